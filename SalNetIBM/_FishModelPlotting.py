@@ -20,19 +20,16 @@ import shutil
 from moviepy.editor import *
 
 from .dominance_based_scheduler import DominanceBasedActivation
-from .fish import Fish, LifeHistory, Activity
-from .redd import Redd
+from .fish import Fish, LifeHistory, Activity, Event
 from .stream_network import StreamNetwork
-from .settings import time_settings, export_settings, network_settings, resident_fish_settings, anadromous_fish_settings
 
 class FishModelPlotting:
 
     def plot_masses_at_timestep(self, timestep):
         fish_at_timestep = self.fish_alive_at_timestep(timestep)
-        anad_masses = [fish.mass_at_age(fish.age_at_timestep(timestep)) for fish in fish_at_timestep if
-                       fish.life_history is LifeHistory.ANADROMOUS]
-        res_masses = [fish.mass_at_age(fish.age_at_timestep(timestep)) for fish in fish_at_timestep if
-                      fish.life_history is LifeHistory.RESIDENT]
+        masses = [(fish.mass_at_age(fish.age_at_timestep(timestep)), fish.life_history) for fish in fish_at_timestep]
+        anad_masses = [mass for mass, life_history in masses if mass is not None and life_history is LifeHistory.ANADROMOUS]
+        res_masses = [mass for mass, life_history in masses if mass is not None and life_history is LifeHistory.RESIDENT]
         max_mass = max([fish.mass for fish in self.schedule.fish + self.schedule.dead_fish])
         # todo fix the ylim to overall max based on anad_hist and res_hist https://stackoverflow.com/questions/29294957/how-can-i-accomplish-set-xlim-or-set-ylim-in-bokeh
         anad_hist, anad_edges = np.histogram(anad_masses, density=True, bins=50, range=(0, max_mass))
@@ -93,7 +90,7 @@ class FishModelPlotting:
             just draws a vertical line indicating the current timestep relative to the plotted data."""
         history = self.network.history
         source = ColumnDataSource({'time': np.array([history_step['step'] for history_step in history]) /
-                                           time_settings['WEEKS_PER_YEAR'],
+                                           self.config.time.weeks_per_year,
                                    'total population': [history_step['anad pop'] + history_step['res pop'] for
                                                         history_step in history],
                                    'anadromous population': [history_step['anad pop'] for history_step in history],
@@ -121,21 +118,33 @@ class FishModelPlotting:
             f.select(dict(type=Axis, layout="left"))[0].formatter.use_scientific = False
             if timestep is not None:
                 f.add_layout(
-                    Span(location=timestep / time_settings['WEEKS_PER_YEAR'], dimension='height', line_color='red',
+                    Span(location=timestep / self.config.time.weeks_per_year, dimension='height', line_color='red',
                          line_dash='dashed', line_width=1))
         return row([fig, rfig])
 
+    def lifespan_dataframe(self):
+        """ Birth week (in years), lifespan (in weeks), and life history of every dead fish, including the fry
+            that died before allocating histories and are only kept as compact rows. """
+        dead_fry = self.schedule.dead_fry
+        return pd.DataFrame({'BirthWeek': np.concatenate(([fish.birth_week for fish in self.schedule.dead_fish], dead_fry['birth_week'])) / self.config.time.weeks_per_year,
+                             'Lifespan': np.concatenate(([fish.death_week - fish.birth_week for fish in self.schedule.dead_fish], dead_fry['death_week'] - dead_fry['birth_week'])),
+                             'IsResident': np.concatenate(([fish.is_resident for fish in self.schedule.dead_fish], dead_fry['life_history'] == 1))})
+
     def survival_plot(self):
-        # Survival function plot (based on dead fish only)
+        # Survival function plot (based on dead fish only, including dead fry rows)
+        dead_fry = self.schedule.dead_fry
+        dead_fry_ages = dead_fry['death_week'] - dead_fry['birth_week']
         anad_death_ages = np.array(
-            [fish.age_weeks for fish in self.schedule.dead_fish if fish.life_history is LifeHistory.ANADROMOUS])
+            [fish.age_weeks for fish in self.schedule.dead_fish if fish.life_history is LifeHistory.ANADROMOUS]
+            + dead_fry_ages[dead_fry['life_history'] == 0].tolist())
         anad_death_proportions = np.bincount(anad_death_ages) / len(anad_death_ages)
-        anad_age_x = np.arange(len(anad_death_proportions)) / time_settings['WEEKS_PER_YEAR']
+        anad_age_x = np.arange(len(anad_death_proportions)) / self.config.time.weeks_per_year
         anad_survival_y = [1 - np.sum(anad_death_proportions[:i]) for i in np.arange(len(anad_death_proportions))]
         res_death_ages = np.array(
-            [fish.age_weeks for fish in self.schedule.dead_fish if fish.life_history is LifeHistory.RESIDENT])
+            [fish.age_weeks for fish in self.schedule.dead_fish if fish.life_history is LifeHistory.RESIDENT]
+            + dead_fry_ages[dead_fry['life_history'] == 1].tolist())
         res_death_proportions = np.bincount(res_death_ages) / len(res_death_ages)
-        res_age_x = np.arange(len(res_death_proportions)) / time_settings['WEEKS_PER_YEAR']
+        res_age_x = np.arange(len(res_death_proportions)) / self.config.time.weeks_per_year
         res_survival_y = [1 - np.sum(res_death_proportions[:i]) for i in np.arange(len(res_death_proportions))]
         fig = figure(plot_width=400, plot_height=300, toolbar_location='above')
         fig.xaxis.axis_label = 'Age (years)'
@@ -147,10 +156,10 @@ class FishModelPlotting:
         return fig
 
     def passage_plot(self, passage, title=""):
-        passage_times_x = np.arange(self.schedule.steps) / time_settings['WEEKS_PER_YEAR']
+        passage_times_x = np.arange(self.schedule.steps) / self.config.time.weeks_per_year
         passage_times_y = np.bincount([item[0] for item in passage])
         passage_times_y = np.pad(passage_times_y, (0, len(passage_times_x) - len(passage_times_y)), 'constant')
-        passage_ages = np.array([item[2] for item in passage]) / time_settings['WEEKS_PER_YEAR']
+        passage_ages = np.array([item[2] for item in passage]) / self.config.time.weeks_per_year
         passage_lengths = np.array([item[3] for item in passage])
         passage_masses = np.array([item[4] for item in passage])
         age_hist, age_edges = np.histogram(passage_ages, density=True, bins=15)
@@ -184,27 +193,27 @@ class FishModelPlotting:
 
     def passage_report(self):
         mainstem_smolt_passage = self.network.reach_with_id(
-            network_settings['MOST_DOWNSTREAM_REACH']).passage_stats(Activity.SMOLT_OUTMIGRATION, 'downstream', 'anadromous')
+            self.config.network.most_downstream_reach).passage_stats(Activity.SMOLT_OUTMIGRATION, 'downstream', 'anadromous')
 
         mainstem_spawner_passage = self.network.reach_with_id(
-            network_settings['MOST_DOWNSTREAM_REACH']).passage_stats(Activity.SPAWNING_MIGRATION, 'upstream', 'anadromous')
+            self.config.network.most_downstream_reach).passage_stats(Activity.SPAWNING_MIGRATION, 'upstream', 'anadromous')
 
-        lemhi_smolt_passage = self.network.reach_with_id(network_settings['LEMHI_MOUTH']).passage_stats(
+        lemhi_smolt_passage = self.network.reach_with_id(self.config.network.lemhi_mouth).passage_stats(
             Activity.SMOLT_OUTMIGRATION, 'downstream', 'anadromous')
 
-        lemhi_spawner_passage = self.network.reach_with_id(network_settings['LEMHI_MOUTH']).passage_stats(
+        lemhi_spawner_passage = self.network.reach_with_id(self.config.network.lemhi_mouth).passage_stats(
             Activity.SPAWNING_MIGRATION, 'upstream', 'anadromous')
 
-        pahsimeroi_smolt_passage = self.network.reach_with_id(network_settings['PAHSIMEROI_MOUTH']).passage_stats(
+        pahsimeroi_smolt_passage = self.network.reach_with_id(self.config.network.pahsimeroi_mouth).passage_stats(
             Activity.SMOLT_OUTMIGRATION, 'downstream', 'anadromous')
 
         pahsimeroi_spawner_passage = self.network.reach_with_id(
-            network_settings['PAHSIMEROI_MOUTH']).passage_stats(Activity.SPAWNING_MIGRATION, 'upstream', 'anadromous')
+            self.config.network.pahsimeroi_mouth).passage_stats(Activity.SPAWNING_MIGRATION, 'upstream', 'anadromous')
 
-        yankee_smolt_passage = self.network.reach_with_id(network_settings['YANKEE_FORK_MOUTH']).passage_stats(
+        yankee_smolt_passage = self.network.reach_with_id(self.config.network.yankee_fork_mouth).passage_stats(
             Activity.SMOLT_OUTMIGRATION, 'downstream', 'anadromous')
 
-        yankee_spawner_passage = self.network.reach_with_id(network_settings['YANKEE_FORK_MOUTH']).passage_stats(
+        yankee_spawner_passage = self.network.reach_with_id(self.config.network.yankee_fork_mouth).passage_stats(
             Activity.SPAWNING_MIGRATION, 'upstream', 'anadromous')
 
         return [ # todo standardize horizontal axes, figure out why yankee fork showed 0 passage
@@ -219,12 +228,7 @@ class FishModelPlotting:
         ]
 
     def plot_survivor_proportion(self, n_weeks):
-        lifespan_rows = [
-            {'BirthWeek': fish.birth_week / time_settings['WEEKS_PER_YEAR'],
-             'Lifespan': fish.death_week - fish.birth_week}
-            for
-            fish in self.schedule.dead_fish]
-        ldf = pd.DataFrame(lifespan_rows)
+        ldf = self.lifespan_dataframe()[['BirthWeek', 'Lifespan']]
         survivor_df = ldf[ldf['Lifespan'] > n_weeks]
         gsdf = survivor_df.groupby(['BirthWeek'], axis=0, as_index=False).count()
         gadf = ldf.groupby(['BirthWeek'], axis=0, as_index=False).count()
@@ -240,11 +244,7 @@ class FishModelPlotting:
         return fig
 
     def plot_survivor_count(self, n_weeks):
-        lifespan_rows = [
-            {'BirthWeek': fish.birth_week / time_settings['WEEKS_PER_YEAR'], 'Lifespan': fish.death_week - fish.birth_week}
-            for
-            fish in self.schedule.dead_fish]
-        ldf = pd.DataFrame(lifespan_rows)
+        ldf = self.lifespan_dataframe()[['BirthWeek', 'Lifespan']]
         survivor_df = ldf[ldf['Lifespan'] > n_weeks]
         gsdf = survivor_df.groupby(['BirthWeek'], axis=0, as_index=False).count()
         source = ColumnDataSource(gsdf)
@@ -256,9 +256,7 @@ class FishModelPlotting:
         return fig
 
     def plot_lifespan_by_birth_week(self):
-        lifespan_rows = [{'BirthWeek': fish.birth_week / time_settings['WEEKS_PER_YEAR'],
-                          'Lifespan': fish.death_week - fish.birth_week} for fish in self.schedule.dead_fish]
-        ldf = pd.DataFrame(lifespan_rows)
+        ldf = self.lifespan_dataframe()[['BirthWeek', 'Lifespan']]
         gldf = ldf.groupby(['BirthWeek'], axis=0, as_index=False).mean()
         source = ColumnDataSource(gldf)
         fig = figure(tools=[], plot_width=1500, plot_height=800, title='Mean Lifespan')
@@ -269,7 +267,8 @@ class FishModelPlotting:
         return fig
 
     def plot_fish_born_per_year(self):
-        all_fish_birth_years = np.array([math.floor(fish.birth_week / time_settings['WEEKS_PER_YEAR']) for fish in self.schedule.fish + self.schedule.dead_fish])
+        all_fish_birth_years = np.array([math.floor(fish.birth_week / self.config.time.weeks_per_year) for fish in self.schedule.fish + self.schedule.dead_fish]
+                                        + (self.schedule.dead_fry['birth_week'] // self.config.time.weeks_per_year).tolist())
         birth_years, birth_year_counts = np.unique(all_fish_birth_years, return_counts=True)
         source = ColumnDataSource({
             'Year': birth_years,
@@ -285,32 +284,42 @@ class FishModelPlotting:
 
     def plot_spawning_success_rates(self):
         # spawn status codes: 0 = never became spawner that year, 1 = became spawner but failed to spawn, 2 = spawned successfully
-        num_years = int(np.ceil(self.schedule.time / time_settings['WEEKS_PER_YEAR']))
+        num_years = int(np.ceil(self.schedule.time / self.config.time.weeks_per_year))
         resident_spawn_statuses = []
         anadromous_spawn_statuses = []
-        resident_spawn_start_weeks = [resident_fish_settings['SPAWNING_MIGRATION_START'] + y * time_settings['WEEKS_PER_YEAR'] for y in range(num_years)]
-        anadromous_spawn_start_weeks = [anadromous_fish_settings['SPAWNING_MIGRATION_START'] + y * time_settings['WEEKS_PER_YEAR'] for y in range(num_years)]
+        resident_spawn_start_weeks = [self.config.resident.spawning_migration_start + y * self.config.time.weeks_per_year for y in range(num_years)]
+        anadromous_spawn_start_weeks = [self.config.anadromous.spawning_migration_start + y * self.config.time.weeks_per_year for y in range(num_years)]
+        mature_fish = []
+        mature_fish_spawn_statuses = []
+        self.schedule.catch_up_parked_fish()
         for fish in self.schedule.dead_fish + self.schedule.fish:
-            if fish.age_weeks >= fish.settings['AGE_AT_MATURITY']:
-                spawn_period_duration = fish.settings['SPAWNING_MIGRATION_END'] - fish.settings['SPAWNING_MIGRATION_START']
-                maturation_week = fish.birth_week + fish.settings['AGE_AT_MATURITY']
+            if fish.age_weeks >= fish.settings.age_at_maturity:
+                spawn_period_duration = fish.settings.spawning_migration_end - fish.settings.spawning_migration_start
+                maturation_week = fish.birth_week + fish.settings.age_at_maturity
                 spawn_start_weeks = resident_spawn_start_weeks if fish.is_resident else anadromous_spawn_start_weeks
                 death_week = fish.death_week if fish.death_week is not None else 1e10
                 possible_spawn_start_weeks = [week for week in spawn_start_weeks if week + spawn_period_duration >= maturation_week and week <= death_week]
                 if len(possible_spawn_start_weeks) > 0:
-                    possible_spawn_years = [math.floor(week / time_settings['WEEKS_PER_YEAR']) for week in possible_spawn_start_weeks]
+                    possible_spawn_years = [math.floor(week / self.config.time.weeks_per_year) for week in possible_spawn_start_weeks]
                     spawn_status = {year : 0 for year in possible_spawn_years}
-                    for log_index, event_age_weeks, event in fish.event_history:
-                        if event in ("Failed to spawn", "Successfully spawned"):
-                            event_timestep = event_age_weeks + fish.birth_week
-                            most_recent_spawn_start_week = [week for week in spawn_start_weeks if week < event_timestep][-1]
-                            spawn_year = math.floor(most_recent_spawn_start_week / time_settings['WEEKS_PER_YEAR'])
-                            if event == "Failed to spawn":
-                                spawn_status[spawn_year] = 1
-                            elif event == "Successfully spawned":
-                                spawn_status[spawn_year] = 2
+                    mature_fish.append(fish)
+                    mature_fish_spawn_statuses.append(spawn_status)
                     spawn_statuses = resident_spawn_statuses if fish.is_resident else anadromous_spawn_statuses
                     spawn_statuses.append(spawn_status)
+        # Spawning outcomes come from the event records of all mature fish at once, filtered by event code. Each
+        # outcome counts toward the year of the most recent spawning migration start before it.
+        event_arrays = [np.array(fish.event_history, dtype=np.int64).reshape(-1, 4) for fish in mature_fish]
+        events = np.concatenate([np.zeros((0, 4), dtype=np.int64)] + event_arrays)
+        event_fish_rows = np.repeat(np.arange(len(mature_fish)), [len(array) for array in event_arrays])
+        is_spawn_outcome = np.isin(events[:, 2], (Event.FAILED_TO_SPAWN, Event.SPAWNED_SUCCESSFULLY))
+        outcome_rows = event_fish_rows[is_spawn_outcome]
+        birth_weeks = np.array([fish.birth_week for fish in mature_fish], dtype=np.int64)
+        spawn_start_weeks_of_year = np.array([fish.settings.spawning_migration_start for fish in mature_fish], dtype=np.int64)
+        outcome_timesteps = events[is_spawn_outcome, 1] + birth_weeks[outcome_rows]
+        outcome_years = (outcome_timesteps - spawn_start_weeks_of_year[outcome_rows] - 1) // self.config.time.weeks_per_year
+        outcome_codes = np.where(events[is_spawn_outcome, 2] == Event.SPAWNED_SUCCESSFULLY, 2, 1)
+        for fish_row, spawn_year, status_code in zip(outcome_rows.tolist(), outcome_years.tolist(), outcome_codes.tolist()):
+            mature_fish_spawn_statuses[fish_row][spawn_year] = status_code
         afig = figure(tools=[], plot_width=500, plot_height=300, title="Anadromous")
         rfig = figure(tools=[], plot_width=500, plot_height=300, title="Resident")
         for statuses, fig, title in ((anadromous_spawn_statuses, afig, "Anadromous"), (resident_spawn_statuses, rfig, "Resident")):
@@ -354,10 +363,9 @@ class FishModelPlotting:
                 previous_weeks_mass = fish.mass_at_timestep(ts - 1)
                 if current_mass is not None and previous_weeks_mass is not None:
                     rows.append({
-                        "Time": ts / time_settings['WEEKS_PER_YEAR'],
+                        "Time": ts / self.config.time.weeks_per_year,
                         "MassCategory": int(round(np.log(current_mass))),
-                        "SGR": ((current_mass - previous_weeks_mass) / previous_weeks_mass) / time_settings[
-                            'DAYS_PER_WEEK']
+                        "SGR": ((current_mass - previous_weeks_mass) / previous_weeks_mass) / self.config.time.days_per_week
                     })
         df = pd.DataFrame(rows)
         gdf = df.groupby(['MassCategory', 'Time'], axis=0, as_index=False).mean()
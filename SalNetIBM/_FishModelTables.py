@@ -17,18 +17,19 @@ import shutil
 from moviepy.editor import *
 
 from .dominance_based_scheduler import DominanceBasedActivation
-from .fish import Fish, LifeHistory, Activity
-from .redd import Redd
+from .fish import Fish, LifeHistory, Activity, MORTALITY_REASONS
 from .stream_network import StreamNetwork
-from .settings import time_settings, export_settings, network_settings
 
 class FishModelTables:
 
     def mortality_source_table(self):
+        dead_fry = self.schedule.dead_fry
         anad_reasons = [fish.mortality_reason for fish in self.schedule.dead_fish if
-                        fish.life_history is LifeHistory.ANADROMOUS]
+                        fish.life_history is LifeHistory.ANADROMOUS] \
+            + [MORTALITY_REASONS[code] for code in dead_fry['mortality_reason'][dead_fry['life_history'] == 0].tolist()]
         res_reasons = [fish.mortality_reason for fish in self.schedule.dead_fish if
-                       fish.life_history is LifeHistory.RESIDENT]
+                       fish.life_history is LifeHistory.RESIDENT] \
+            + [MORTALITY_REASONS[code] for code in dead_fry['mortality_reason'][dead_fry['life_history'] == 1].tolist()]
         all_reasons = set(list(Counter(res_reasons).keys()) + list(Counter(anad_reasons).keys()))
         ac = Counter(anad_reasons)
         rc = Counter(res_reasons)
@@ -50,15 +51,18 @@ class FishModelTables:
             runtimes, though, because many of those "going to succeed" fish aren't included in the "dead fish" array."""
         rates = {}
         dead_fish = self.schedule.dead_fish
+        dead_fry = self.schedule.dead_fry  # fry that died before allocating histories count as dead, non-adult fish
         adult_fish = [fish for fish in dead_fish if fish.is_mature]
         res_adult_fish = [fish for fish in adult_fish if fish.life_history is LifeHistory.RESIDENT]
         anad_adult_fish = [fish for fish in adult_fish if fish.life_history is LifeHistory.ANADROMOUS]
         res_dead_fish = [fish for fish in dead_fish if fish.life_history is LifeHistory.RESIDENT]
         anad_dead_fish = [fish for fish in dead_fish if fish.life_history is LifeHistory.ANADROMOUS]
+        n_res_dead_fry = int((dead_fry['life_history'] == 1).sum())
+        n_anad_dead_fry = len(dead_fry) - n_res_dead_fry
 
-        rates['Fry-to-adult survival (all)'] = len(adult_fish) / len(dead_fish)
-        rates['Fry-to-adult survival (anadromous)'] = len(anad_adult_fish) / len(anad_dead_fish)
-        rates['Fry-to-adult survival (resident)'] = len(res_adult_fish) / len(anad_dead_fish)
+        rates['Fry-to-adult survival (all)'] = len(adult_fish) / (len(dead_fish) + len(dead_fry))
+        rates['Fry-to-adult survival (anadromous)'] = len(anad_adult_fish) / (len(anad_dead_fish) + n_anad_dead_fry)
+        rates['Fry-to-adult survival (resident)'] = len(res_adult_fish) / (len(res_dead_fish) + n_res_dead_fry)
         fish_that_smolted = [fish for fish in dead_fish if
                              fish.life_history is LifeHistory.ANADROMOUS
                              and Activity.SMOLT_OUTMIGRATION in [item[2] for item in fish.activity_history]]
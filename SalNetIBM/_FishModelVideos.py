@@ -18,9 +18,7 @@ from moviepy.editor import *
 
 from .dominance_based_scheduler import DominanceBasedActivation
 from .fish import Fish, LifeHistory, Activity
-from .redd import Redd
 from .stream_network import StreamNetwork
-from .settings import time_settings, export_settings, network_settings
 
 class FishModelVideos:
 
@@ -56,7 +54,7 @@ class FishModelVideos:
 
     def create_movie(self, frame_function, movie_name, attr):
         """ The frame_function should be a function that takes one parameter (frame) and return a figure."""
-        temp_path = os.path.join(export_settings['RESULTS_PATH'], "temp_video_frames_" + str(random.randint(1, 999999)))
+        temp_path = os.path.join(self.config.export.results_path, "temp_video_frames_" + str(random.randint(1, 999999)))
         os.mkdir(temp_path)
         frame_paths = []
         for step in np.arange(self.schedule.steps):
@@ -69,7 +67,7 @@ class FishModelVideos:
         print("Concatenating frames into final video.")
         concat_clip = concatenate_videoclips(clips, method="compose")
         print("Writing final video file.")
-        concat_clip.write_videofile(os.path.join(export_settings['RESULTS_PATH'], movie_name + '.mp4'), fps=30, bitrate='8000k', codec='mpeg4')
+        concat_clip.write_videofile(os.path.join(self.config.export.results_path, movie_name + '.mp4'), fps=30, bitrate='8000k', codec='mpeg4')
         shutil.rmtree(temp_path, ignore_errors=True)
         print("Finished exporting {0}.mp4.".format(movie_name))
 
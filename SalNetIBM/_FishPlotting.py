@@ -2,7 +2,6 @@ from bokeh.models import HoverTool, Label, ColumnDataSource, Arrow, VeeHead, Tab
 from bokeh.layouts import column, row
 from bokeh.plotting import figure
 import numpy as np
-from .settings import time_settings
 
 
 class FishPlotting:
@@ -12,7 +11,7 @@ class FishPlotting:
         reach_descriptors = [(x[0], x[1], "Reach {0}.".format(x[2])) for x in self.reach_history]
         movement_descriptors = [(x[0], x[1], "{0} at rate {1}.".format(x[2], x[3])) for x in
                                 self.movement_history]
-        event_descriptors = [(x[0], x[1], "{0}.".format(x[2])) for x in self.event_history]
+        event_descriptors = [(x[0], x[1], "{0}.".format(self.event_description(x[2], x[3]))) for x in self.event_history]
         descriptors = sorted(activity_descriptors + movement_descriptors + reach_descriptors + event_descriptors,
                              key=lambda x: x[0])
         if self.is_dead:
@@ -27,7 +26,7 @@ class FishPlotting:
         for descriptor in descriptors:
             lifetext += descriptor[2] + "\n"
         source = ColumnDataSource({'age_weeks': [d[1] for d in descriptors],
-                                   'age_years': [d[1] / time_settings['WEEKS_PER_YEAR'] for d in descriptors],
+                                   'age_years': [d[1] / self.model.config.time.weeks_per_year for d in descriptors],
                                    'life_event': [d[2] for d in descriptors]
                                    })
         return title, lifetext, source
@@ -38,9 +37,13 @@ class FishPlotting:
         lifemap.ygrid.visible = False
         lifemap.xaxis.visible = False
         lifemap.yaxis.visible = False
-        self.network_reach.network.plot(lifemap)
-        reachids = list(np.array(self.reach_history).T[2])
-        pointx, pointy = list(np.array([self.network_reach.network.reach_with_id(id).midpoint for id in reachids]).T)
+        network = self.network_reach.network
+        network.plot(lifemap)
+        reachids = [x[2] for x in self.reach_history]
+        geometry = network.plot_geometry()
+        reach_indices = [network.reach_with_id(id).index for id in reachids]
+        pointx = list(geometry['midpoint_xs'][reach_indices])
+        pointy = list(geometry['midpoint_ys'][reach_indices])
         source = ColumnDataSource({'xs': pointx,
                                    'ys': pointy,
                                    'reach_id': reachids})
@@ -72,7 +75,7 @@ class FishPlotting:
         return lyt
 
     def plot_growth(self):
-        source = ColumnDataSource({'age': list(np.arange(len(self.mass_history)) / time_settings['WEEKS_PER_YEAR']),
+        source = ColumnDataSource({'age': list((self.history_start_age + np.arange(len(self.mass_history))) / self.model.config.time.weeks_per_year),
                                    'mass': self.mass_history,
                                    'length': self.length_history})
         fig = figure(tools=[], plot_width=350, plot_height=280)
@@ -89,7 +92,7 @@ class FishPlotting:
         return fig
 
     def plot_temperature(self):
-        source = ColumnDataSource({'age': list(np.arange(len(self.mass_history)) / time_settings['WEEKS_PER_YEAR']),
+        source = ColumnDataSource({'age': list((self.history_start_age + np.arange(len(self.mass_history))) / self.model.config.time.weeks_per_year),
                                    'temperature': self.temperature_history})
         fig = figure(tools=[], plot_width=350, plot_height=280)
         fig.line('age', 'temperature', source=source, line_width=2, line_color='firebrick')
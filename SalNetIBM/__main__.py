@@ -0,0 +1,144 @@
+""" Command line entry point for headless batch runs, like:
+
+        python -m SalNetIBM run --config stray.json --steps 460 --seed 1 --checkpoint-interval 46 --output-dir Results/stray
+
+    The config file is a JSON object of settings overrides as taken by ModelConfig.with_overrides(), like
+    {"spawning_settings.STRAY_PROBABILITY": 0.1}. --steps is the timestep to run until, not a number of steps to run,
+    so after an interruption the same command with --resume finishes the run from the output folder's checkpoint. A
+    resumed run keeps the config saved in its checkpoint, with the config file's overrides, the output folder's paths,
+    --checkpoint-interval and --profile applied on top. Progress is printed every --report-interval timesteps, and the
+    last line printed is a JSON summary of the run, which is also written to summary.json in the output folder along
+    with the weekly network history (history.csv), the dead fish cache, any checkpoints, and with --profile, the
+    timings of the phases of each step (step_profile.csv). Fish-steps count the fish stepped each week, leaving out
+    parked fish, which aren't stepped until they wake. """
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+from .config import ModelConfig
+from .fish_model import FishModel
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_memory_mb():
+    """ Peak resident memory of this process so far in MB, or None where it can't be measured. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, kilobytes elsewhere
+
+
+def run_overrides(args):
+    """ The settings overrides for a run: those in the --config file, plus the output folder's paths and the
+        checkpoint and profiling options. """
+    overrides = {}
+    if args.config is not None:
+        with open(args.config) as config_file:
+            overrides.update(json.load(config_file))
+    output_dir = os.path.abspath(args.output_dir)
+    overrides.update({'export_settings.RESULTS_PATH': output_dir,
+                      'export_settings.DEAD_FISH_CACHE_PATH': os.path.join(output_dir, 'DeadFishCache'),
+                      'export_settings.CHECKPOINT_PATH': os.path.join(output_dir, 'Checkpoint.pickle'),
+                      'export_settings.CHECKPOINT_INTERVAL': args.checkpoint_interval,
+                      'export_settings.PROFILE_STEPS': args.profile})
+    return overrides
+
+
+def run(args):
+    overrides = run_overrides(args)
+    config = ModelConfig.from_settings().with_overrides(overrides)
+    if not os.path.exists(config.export.results_path):
+        os.makedirs(config.export.results_path)
+    start_time = time.perf_counter()
+    resumed = args.resume and os.path.isfile(config.export.checkpoint_path)
+    if resumed:
+        model = FishModel.resume(config.export.checkpoint_path)
+        if args.temperature_scenario is not None and args.temperature_scenario != model.temperature_scenario:
+            raise ValueError("Can't resume the checkpoint's temperature scenario {0} as {1}.".format(
+                model.temperature_scenario, args.temperature_scenario))
+        model.set_config(model.config.with_overrides(overrides))
+        config = model.config
+    else:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+        model = FishModel(args.initial_population, args.temperature_scenario, config=config)
+    setup_seconds = time.perf_counter() - start_time
+    first_step = model.schedule.steps
+    fish_steps = 0
+    interval_fish_steps = 0
+    run_start_time = interval_start_time = time.perf_counter()
+    while model.schedule.steps < args.steps and model.schedule.fish_count > 0:
+        stepped_fish_count = len(model.schedule.active_fish)
+        model.step()
+        fish_steps += stepped_fish_count
+        interval_fish_steps += stepped_fish_count
+        if model.schedule.steps % args.report_interval == 0:
+            now = time.perf_counter()
+            print("Step {0:5d}: {1:8d} fish, {2:6d} redds, {3:7.2f} steps/s, {4:10.0f} fish-steps/s, peak memory {5} MB".format(
+                model.schedule.steps, model.schedule.fish_count, model.schedule.redd_count,
+                args.report_interval / (now - interval_start_time), interval_fish_steps / (now - interval_start_time),
+                "{0:.0f}".format(peak_memory_mb()) if resource is not None else "unknown"), flush=True)
+            interval_start_time = now
+            interval_fish_steps = 0
+    run_seconds = time.perf_counter() - run_start_time
+    steps_run = model.schedule.steps - first_step
+    if len(model.network.history) > 0:
+        with open(os.path.join(config.export.results_path, 'history.csv'), 'w', newline='') as history_file:
+            writer = csv.DictWriter(history_file, fieldnames=list(model.network.history[0].keys()))
+            writer.writeheader()
+            writer.writerows(model.network.history)
+    summary = {'config': args.config,
+               'resumed': resumed,
+               'seed': None if resumed else args.seed,
+               'initial_population': None if resumed else args.initial_population,
+               'temperature_scenario': model.temperature_scenario,
+               'first_step': first_step,
+               'run_until_step': args.steps,
+               'steps': model.schedule.steps,
+               'steps_run': steps_run,
+               'fish_count': model.schedule.fish_count,
+               'redd_count': model.schedule.redd_count,
+               'setup_seconds': setup_seconds,
+               'run_seconds': run_seconds,
+               'steps_per_second': steps_run / run_seconds if run_seconds > 0 else None,
+               'fish_steps': fish_steps,
+               'fish_steps_per_second': fish_steps / run_seconds if run_seconds > 0 else None,
+               'peak_memory_mb': peak_memory_mb()}
+    if model.config.export.profile_steps:
+        model.schedule.profiler.write(os.path.join(config.export.results_path, 'step_profile.csv'))
+    with open(os.path.join(config.export.results_path, 'summary.json'), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    print(json.dumps(summary))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m SalNetIBM', description="Salmonid network individual-based model.")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    run_parser = commands.add_parser('run', help="Run the model headless, reporting throughput and a JSON summary.")
+    run_parser.add_argument('--config', help="JSON file of settings overrides, like {\"spawning_settings.STRAY_PROBABILITY\": 0.1}")
+    run_parser.add_argument('--steps', type=int, required=True, help="timestep to run until (not a count, so a resumed run stops at the same step)")
+    run_parser.add_argument('--seed', type=int, default=0, help="seed for the random number generators")
+    run_parser.add_argument('--checkpoint-interval', type=int, default=0, help="timesteps between checkpoints; 0 for none")
+    run_parser.add_argument('--output-dir', required=True, help="folder for the history, summary, dead fish cache, and checkpoints")
+    run_parser.add_argument('--initial-population', type=int, default=10000, help="number of fish to start with")
+    run_parser.add_argument('--temperature-scenario', help="name of a temperature scenario, if not the configured default")
+    run_parser.add_argument('--report-interval', type=int, default=10, help="timesteps between progress reports")
+    run_parser.add_argument('--profile', action='store_true', help="time the phases of each step into step_profile.csv")
+    run_parser.add_argument('--resume', action='store_true', help="continue from the output folder's checkpoint, if there is one")
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
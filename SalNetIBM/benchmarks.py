@@ -0,0 +1,284 @@
+""" Timing comparisons for performance work on the model. Each benchmark takes an already-built FishModel, so the
+    time spent loading the network isn't included, and prints its results. The "before" timings reproduce the
+    earlier implementation of whatever is being compared, so both sides can be measured on the same network. """
+
+import functools
+import math
+import timeit
+
+import numpy as np
+
+
+def report(label, seconds, count, unit):
+    print("{0:<60s} {1:10.4f} s  ({2:8.1f} ns per {3})".format(label, seconds, 1e9 * seconds / count, unit))
+
+
+def benchmark_temperature_lookups(model, years=1, repeats=3):
+    """ Compares per-reach temperature and GPP lookups through per-reach lists (with the ocean and migration reaches
+        recursing to the most downstream reach, and GPP behind an unbounded lru_cache) against reads from the
+        network's (reach x week) matrices. """
+    network = model.network
+    reaches = network.reaches
+    weeks = range(years * network.temperature_matrix.shape[1])
+    reach_temperatures = {reach: network.temperature_matrix[reach.index].tolist() for reach in reaches}
+
+    def legacy_temperature_at_week(reach, week):
+        if reach.is_ocean or reach.is_migration_reach:
+            return legacy_temperature_at_week(network.most_downstream_reach, week)
+        temperatures = reach_temperatures[reach]
+        return temperatures[week % len(temperatures)]
+
+    @functools.lru_cache(maxsize=None)
+    def legacy_gpp_at_week(reach, week):
+        temperature = legacy_temperature_at_week(reach, week)
+        log_gpp = -11.538 + 0.00827 * min(reach.conductivity, 350) + 4.11e-6 * reach.area_solar + 0.538 * temperature
+        return math.exp(log_gpp)
+
+    def legacy_weekly_temperatures():
+        for week in weeks:
+            for reach in reaches:
+                legacy_temperature_at_week(reach, week)
+
+    def legacy_weekly_gpps():
+        for week in weeks:
+            for reach in reaches:
+                legacy_gpp_at_week(reach, week)
+
+    def matrix_weekly_temperatures():
+        for week in weeks:
+            network.temperatures_at_week(week).tolist()
+
+    def matrix_point_temperatures():
+        for week in weeks:
+            for reach in reaches:
+                reach.temperature_at_week(week)
+
+    def matrix_point_gpps():
+        for week in weeks:
+            for reach in reaches:
+                reach.gpp_at_week(week)
+
+    count = len(weeks) * len(reaches)
+    print("Temperature and GPP lookups for {0} reaches over {1} weeks:".format(len(reaches), len(weeks)))
+    report("Before: per-reach temperature lists", min(timeit.repeat(legacy_weekly_temperatures, number=1, repeat=repeats)), count, "lookup")
+    report("Before: lru_cache GPP (warm cache)", min(timeit.repeat(legacy_weekly_gpps, number=1, repeat=repeats)), count, "lookup")
+    report("After: temperature matrix, one column per week", min(timeit.repeat(matrix_weekly_temperatures, number=1, repeat=repeats)), count, "lookup")
+    report("After: temperature matrix, per-reach reads", min(timeit.repeat(matrix_point_temperatures, number=1, repeat=repeats)), count, "lookup")
+    report("After: GPP matrix, per-reach reads", min(timeit.repeat(matrix_point_gpps, number=1, repeat=repeats)), count, "lookup")
+    legacy_gpps = np.array([[legacy_gpp_at_week(reach, week) for week in weeks] for reach in reaches])
+    matrix_gpps = np.array([[reach.gpp_at_week(week) for week in weeks] for reach in reaches])
+    print("Maximum relative difference in GPP: {0:.3g}".format(np.max(np.abs(matrix_gpps / legacy_gpps - 1))))
+
+
+def benchmark_fry_emergence(model, n_redds=100, mother_fork_length=600, repeats=3):
+    """ Times one emergence week of n_redds redds in random steelhead reaches, comparing one add_fish() call per fry
+        (with a per-fry life history draw and the stray check inside the Fish constructor) against the bulk cohort
+        birth in ReddArrays.replace_with_fry(). The model's fish are restored after each run. """
+    import random
+    from .fish import LifeHistory
+    from .redd import ReddArrays
+    network = model.network
+    schedule = model.schedule
+    redds = ReddArrays(model, n_redds)
+    redds.n = n_redds
+    redds.reach_index[:] = np.random.choice(network.steelhead_spawning_reach_indices, n_redds)
+    redds.mother_fork_length[:] = mother_fork_length
+    redds.mother_life_history[:] = np.random.randint(2, size=n_redds)
+    redds.position_within_reach[:] = [random.uniform(0, network.reaches[i].length) for i in redds.reach_index.tolist()]
+    rows = np.arange(n_redds)
+    original_fish = list(schedule.active_fish)
+    original_reach_fish = {reach: list(reach.fish) for reach in network.reaches}
+    original_next_fish_index = model.next_fish_index
+
+    def restore():
+        born = len(schedule.active_fish) - len(original_fish)
+        schedule.active_fish = list(original_fish)
+        for reach, fish in original_reach_fish.items():
+            reach.fish = list(fish)
+        model.next_fish_index = original_next_fish_index
+        return born
+
+    def legacy_emergence():
+        for row in rows.tolist():
+            fecundity_mean = 0.15 * 0.0002 * redds.mother_fork_length.item(row) ** 2.5989
+            num_fry = round(random.normalvariate(fecundity_mean, 10))
+            mother_life_history = LifeHistory.RESIDENT if redds.mother_life_history.item(row) else LifeHistory.ANADROMOUS
+            for i in range(num_fry):
+                if random.random() < model.config.spawning.life_history_inheritance_probability:
+                    life_history = mother_life_history
+                else:
+                    life_history = LifeHistory.ANADROMOUS if mother_life_history is LifeHistory.RESIDENT else LifeHistory.RESIDENT
+                model.add_fish(network.reaches[redds.reach_index.item(row)], life_history, redds.position_within_reach.item(row))
+
+    def cohort_emergence():
+        redds.replace_with_fry(rows)
+
+    for label, function in (("Before: one add_fish() per fry", legacy_emergence), ("After: bulk cohort birth", cohort_emergence)):
+        times = []
+        for repeat in range(repeats):
+            times.append(timeit.timeit(function, number=1))
+            born = restore()
+        report("{0} ({1} fry from {2} redds)".format(label, born, n_redds), min(times), born, "fry")
+
+
+def benchmark_fry_memory(model, n_redds=100, mother_fork_length=600, fry_history_age=8):
+    """ Compares the memory allocated by one emergence week of fry (and by the records of the same fry all dying a
+        week later) with histories allocated at birth against the fry tier that defers them to fry_history_age. """
+    import pickle
+    import tracemalloc
+    from .fish import DEAD_FRY_DTYPE
+    from .redd import ReddArrays
+    network = model.network
+    schedule = model.schedule
+    original_config = model.config
+    for label, history_age in (("Before: histories allocated at birth", 0), ("After: deferred fry histories", fry_history_age)):
+        model.config = original_config.with_overrides({'spawning_settings.FRY_HISTORY_AGE': history_age})
+        original_fish = list(schedule.active_fish)
+        original_reach_fish = {reach: list(reach.fish) for reach in network.reaches}
+        redds = ReddArrays(model, n_redds)
+        redds.n = n_redds
+        redds.reach_index[:] = np.random.choice(network.steelhead_spawning_reach_indices, n_redds)
+        redds.mother_fork_length[:] = mother_fork_length
+        tracemalloc.start()
+        redds.replace_with_fry(np.arange(n_redds))
+        cohort = schedule.active_fish[len(original_fish):]
+        fry_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        recent_dead_fish, recent_dead_fry = schedule.recent_dead_fish, schedule.recent_dead_fry
+        schedule.recent_dead_fish, schedule.recent_dead_fry = [], []
+        for fish in cohort:
+            fish.die("Survival probability model")
+        for fish in schedule.recent_dead_fish:
+            fish.disconnect_for_pickling()
+        archive_size = len(pickle.dumps(schedule.recent_dead_fish)) + np.array(schedule.recent_dead_fry, dtype=DEAD_FRY_DTYPE).nbytes
+        print("{0:<45s} {1:8d} fry, {2:8.1f} MB allocated, {3:8.1f} MB archived when dead".format(label, len(cohort), fry_memory / 1e6, archive_size / 1e6))
+        schedule.recent_dead_fish, schedule.recent_dead_fry = recent_dead_fish, recent_dead_fry
+        schedule.active_fish = original_fish
+        for reach, fish in original_reach_fish.items():
+            reach.fish = fish
+    model.config = original_config
+
+
+def benchmark_growth_kernel(model, n_fish=100000, repeats=3):
+    """ Times the per-fish bioenergetics calls made by Fish.grow() and territory planning for n_fish fish with random
+        masses and p values spread over random reaches, computing f1(T) through f4(T) in every call against reading
+        them from each reach's precomputed temperature_coefficients, and checks that both give the same numbers. The
+        per-fish calls are dominated by numba's dispatch overhead, so the last comparison shows what the precomputed
+        coefficients allow when a whole reach's fish are passed to the kernels as arrays. """
+    import random
+    from .bioenergetics import daily_growth_from_p, preferred_territory_size, daily_growth_from_coefficients, \
+        preferred_territory_size_from_f1
+    reaches = [reach for reach in model.network.reaches if not reach.is_ocean]
+    fish_reaches = [random.choice(reaches) for i in range(n_fish)]
+    masses = np.random.lognormal(1, 1.5, n_fish).tolist()
+    ps = np.random.uniform(0.2, 0.6, n_fish).tolist()
+    fish_states = list(zip(fish_reaches, masses, ps))
+
+    def per_call_coefficients():
+        return [(daily_growth_from_p(reach.current_temperature, W, p),
+                 preferred_territory_size(reach.current_temperature, W, p, reach.food_production))
+                for reach, W, p in fish_states]
+
+    def precomputed_coefficients():
+        results = []
+        for reach, W, p in fish_states:
+            f1T, f2T, f3T, f4T = reach.temperature_coefficients
+            results.append((daily_growth_from_coefficients(f1T, f2T, f3T, f4T, W, p),
+                            preferred_territory_size_from_f1(f1T, W, p, reach.food_production)))
+        return results
+
+    fish_by_reach = {}
+    for reach, W, p in fish_states:
+        fish_by_reach.setdefault(reach, []).append((W, p))
+    reach_arrays = [(reach, np.array(states)[:, 0].copy(), np.array(states)[:, 1].copy()) for reach, states in fish_by_reach.items()]
+
+    def precomputed_coefficients_by_reach():
+        for reach, W, p in reach_arrays:
+            f1T, f2T, f3T, f4T = reach.temperature_coefficients
+            daily_growth_from_coefficients(f1T, f2T, f3T, f4T, W, p)
+            preferred_territory_size_from_f1(f1T, W, p, reach.food_production)
+
+    print("Growth and preferred territory size for {0} fish:".format(n_fish))
+    report("Before: f1-f4 computed in every call", min(timeit.repeat(per_call_coefficients, number=1, repeat=repeats)), n_fish, "fish")
+    report("After: f1-f4 precomputed per reach-week", min(timeit.repeat(precomputed_coefficients, number=1, repeat=repeats)), n_fish, "fish")
+    report("After: precomputed, one array call per reach", min(timeit.repeat(precomputed_coefficients_by_reach, number=1, repeat=repeats)), n_fish, "fish")
+    before = np.array(per_call_coefficients())
+    after = np.array(precomputed_coefficients())
+    print("Maximum relative difference: {0:.3g} in growth, {1:.3g} in territory size".format(
+        *np.max(np.abs(after - before) / np.maximum(np.abs(before), 1e-300), axis=0)))
+
+
+def benchmark_bioenergetics_arrays(model, sizes=(10000, 100000, 1000000), repeats=3):
+    """ Compares the throughput of daily growth and preferred territory size for arrays of fish at each size, with
+        temperatures drawn from the network's loaded year: a Python loop over the scalar @jit functions, the NumPy
+        versions, and the parallel numba ufuncs (compiled before timing). """
+    from .bioenergetics import daily_growth_from_p, preferred_territory_size, numpy_daily_growth_from_p, \
+        numpy_preferred_territory_size, daily_growth_from_p_array, preferred_territory_size_array, NUMBA_AVAILABLE
+    temperatures = model.network.temperature_matrix.ravel()
+    daily_growth_from_p_array(12.0, 1.0, 0.4)
+    preferred_territory_size_array(12.0, 1.0, 0.4, 2.0)
+    for n_fish in sizes:
+        T = np.random.choice(temperatures, n_fish)
+        W = np.random.lognormal(1, 1.5, n_fish)
+        p = np.random.uniform(0.2, 0.6, n_fish)
+        food = np.random.uniform(1.5, 2.5, n_fish)
+        fish_states = list(zip(T.tolist(), W.tolist(), p.tolist(), food.tolist()))
+
+        def scalar_loop():
+            for T_fish, W_fish, p_fish, food_fish in fish_states:
+                daily_growth_from_p(T_fish, W_fish, p_fish)
+                preferred_territory_size(T_fish, W_fish, p_fish, food_fish)
+
+        def numpy_arrays():
+            numpy_daily_growth_from_p(T, W, p)
+            numpy_preferred_territory_size(T, W, p, food)
+
+        def parallel_ufuncs():
+            daily_growth_from_p_array(T, W, p)
+            preferred_territory_size_array(T, W, p, food)
+
+        print("Daily growth and preferred territory size for {0} fish:".format(n_fish))
+        report("Scalar @jit functions in a Python loop", min(timeit.repeat(scalar_loop, number=1, repeat=repeats)), n_fish, "fish")
+        report("NumPy arrays", min(timeit.repeat(numpy_arrays, number=1, repeat=repeats)), n_fish, "fish")
+        report("Parallel numba ufuncs" if NUMBA_AVAILABLE else "Array versions (NumPy, numba unavailable)",
+               min(timeit.repeat(parallel_ufuncs, number=1, repeat=repeats)), n_fish, "fish")
+
+
+PLOTTING_PACKAGES = ('bokeh', 'moviepy')
+
+
+def benchmark_import_time(modules=('SalNetIBM.fish_model',), repeats=3):
+    """ Times importing the simulation modules in a fresh interpreter, against importing them along with the plotting,
+        table, and video mixins that FishModel and Fish used to import eagerly, and checks that the simulation modules
+        load none of PLOTTING_PACKAGES. Unlike the other benchmarks, this one doesn't need a model. Returns False, after
+        printing which plotting packages were loaded, if there were any, and True otherwise. """
+    import os
+    import subprocess
+    import sys
+    mixin_modules = ('SalNetIBM._FishModelPlotting', 'SalNetIBM._FishModelTables', 'SalNetIBM._FishModelVideos',
+                     'SalNetIBM._FishPlotting')
+    script = ("import sys, time\n"
+              "start = time.perf_counter()\n"
+              "{0}\n"
+              "print(time.perf_counter() - start)\n"
+              "print(' '.join(sorted({{name.split('.')[0] for name in sys.modules}} & {1})))")
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def time_imports(imported_modules):
+        times = []
+        for repeat in range(repeats):
+            imports = "\n".join("import {0}".format(module) for module in imported_modules)
+            output = subprocess.run([sys.executable, '-c', script.format(imports, set(PLOTTING_PACKAGES))], cwd=package_parent,
+                                    stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.splitlines()
+            times.append(float(output[-2]))
+        return min(times), output[-1].split()
+
+    seconds, loaded_packages = time_imports(list(mixin_modules) + list(modules))
+    report("Before: with the plotting and video mixins", seconds, len(modules), "module")
+    seconds, loaded_packages = time_imports(modules)
+    report("After: simulation modules only", seconds, len(modules), "module")
+    if len(loaded_packages) > 0:
+        print("Importing {0} loaded plotting packages: {1}.".format(", ".join(modules), ", ".join(loaded_packages)))
+        return False
+    print("Importing {0} loaded no plotting packages.".format(", ".join(modules)))
+    return True
@@ -1,5 +1,13 @@
 import numpy as np
-from numba import jit
+
+try:
+    from numba import jit, vectorize
+    NUMBA_AVAILABLE = True
+except ImportError:  # without numba, the scalar functions run as plain Python and the array versions use NumPy
+    NUMBA_AVAILABLE = False
+
+    def jit(*args, **kwargs):
+        return lambda function: function
 
 CA = 0.628
 CB = -0.3
@@ -55,11 +63,33 @@ def f4(T):
     return T ** UB if T > 1 else 1
 
 
+@jit(nopython=True)
+def temperature_coefficients(temperatures):
+    # Takes a (reach x week) array of temperatures and returns a (reach x week x 4) array of f1(T) through f4(T), so
+    # the temperature-dependent terms are computed once per reach-week instead of for every fish
+    coefficients = np.empty((temperatures.shape[0], temperatures.shape[1], 4))
+    for i in range(temperatures.shape[0]):
+        for j in range(temperatures.shape[1]):
+            T = temperatures[i, j]
+            coefficients[i, j, 0] = f1(T)
+            coefficients[i, j, 1] = f2(T)
+            coefficients[i, j, 2] = f3(T)
+            coefficients[i, j, 3] = f4(T)
+    return coefficients
+
+
+@jit(nopython=True)
+def daily_growth_from_coefficients(f1T, f2T, f3T, f4T, W, p):
+    # Growth kernel taking precomputed f1(T) through f4(T) from temperature_coefficients(), otherwise the same as
+    # daily_growth_from_p()
+    return (1 / EDpred) * ((EDprey * CA * W ** CB * p * f1T) * (1 - (FA * f3T * np.exp(FG * p)))
+                           * (1 - SDA - UA * f4T * np.exp(UG * p)) - (RA * ACT * EDO2 * W ** RB * f2T))
+
+
 @jit(nopython=True)
 def daily_growth_from_p(T, W, p):
     # Returns daily growth from p, the proportion of the fish's maximum ration it obtains
-    return (1 / EDpred) * ((EDprey * CA * W ** CB * p * f1(T)) * (1 - (FA * f3(T) * np.exp(FG * p)))
-                           * (1 - SDA - UA * f4(T) * np.exp(UG * p)) - (RA * ACT * EDO2 * W ** RB * f2(T)))
+    return daily_growth_from_coefficients(f1(T), f2(T), f3(T), f4(T), W, p)
 
 @jit(nopython=True)
 def daily_growth_from_grams_consumed(T, W, C_g):
@@ -87,4 +117,69 @@ def length_at_mass(mass):
 @jit(nopython=True)
 def preferred_territory_size(T, W, p, network_reach_food_production):
     preferred_daily_ration = daily_grams_consumed_from_p(T, W, p)
-    return preferred_daily_ration / network_reach_food_production
\ No newline at end of file
+    return preferred_daily_ration / network_reach_food_production
+
+@jit(nopython=True)
+def preferred_territory_size_from_f1(f1T, W, p, network_reach_food_production):
+    # Same as preferred_territory_size(), with f1(T) precomputed by temperature_coefficients()
+    preferred_daily_ration = W * CA * W ** CB * p * f1T
+    return preferred_daily_ration / network_reach_food_production
+
+
+
+# Array versions of the functions above, which take arrays of temperature, mass, p, etc (or scalars) and broadcast
+# them against each other like any NumPy operation. With numba they're parallel ufuncs built from the scalar
+# functions, and without it they're NumPy expressions of the same equations.
+
+class ParallelUfunc:
+    """ Array version of a scalar @jit function, compiled into a parallel numba ufunc the first time it's called
+        rather than when this module is imported, or evaluated by the equivalent NumPy function without numba. """
+
+    def __init__(self, scalar_function, signature, numpy_function):
+        self.scalar_function = scalar_function
+        self.signature = signature
+        self.numpy_function = numpy_function
+        self.ufunc = None
+
+    def __call__(self, *args):
+        if not NUMBA_AVAILABLE:
+            return self.numpy_function(*args)
+        if self.ufunc is None:
+            self.ufunc = vectorize([self.signature], target='parallel')(self.scalar_function.py_func)
+        return self.ufunc(*args)
+
+
+def numpy_f3(T):
+    return np.maximum(T, 1) ** FB
+
+
+def numpy_f4(T):
+    return np.maximum(T, 1) ** UB
+
+
+def numpy_daily_growth_from_p(T, W, p):
+    return (1 / EDpred) * ((EDprey * CA * W ** CB * p * f1(T)) * (1 - (FA * numpy_f3(T) * np.exp(FG * p)))
+                           * (1 - SDA - UA * numpy_f4(T) * np.exp(UG * p)) - (RA * ACT * EDO2 * W ** RB * f2(T)))
+
+
+def numpy_daily_grams_consumed_from_p(T, W, p):
+    return W * CA * W ** CB * p * f1(T)
+
+
+def numpy_mass_at_length(fork_length):
+    return 10 ** (2.9 * np.log10(fork_length) - 4.7)
+
+
+def numpy_length_at_mass(mass):
+    return 10 ** ((np.log10(mass) + 4.7) / 2.9)
+
+
+def numpy_preferred_territory_size(T, W, p, network_reach_food_production):
+    return numpy_daily_grams_consumed_from_p(T, W, p) / network_reach_food_production
+
+
+daily_growth_from_p_array = ParallelUfunc(daily_growth_from_p, 'float64(float64, float64, float64)', numpy_daily_growth_from_p)
+daily_grams_consumed_from_p_array = ParallelUfunc(daily_grams_consumed_from_p, 'float64(float64, float64, float64)', numpy_daily_grams_consumed_from_p)
+mass_at_length_array = ParallelUfunc(mass_at_length, 'float64(float64)', numpy_mass_at_length)
+length_at_mass_array = ParallelUfunc(length_at_mass, 'float64(float64)', numpy_length_at_mass)
+preferred_territory_size_array = ParallelUfunc(preferred_territory_size, 'float64(float64, float64, float64, float64)', numpy_preferred_territory_size)
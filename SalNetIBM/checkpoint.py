@@ -0,0 +1,189 @@
+import io
+import os
+import pickle
+import random
+import numpy as np
+from .fish import NO_HISTORY
+from .network_reach import NetworkReach
+
+CHECKPOINT_VERSION = 3
+
+
+class CheckpointPickler(pickle.Pickler):
+    """ Pickles the dynamic state of a model without the static network. References to reaches are written as their
+        IDs, the same way Fish.disconnect_for_pickling() stores them, and references to the model itself are written as
+        a placeholder, so fish, redd registries, and wakeup queue entries can be pickled as-is without following their
+        links into the network and its habitat models. """
+
+    def __init__(self, file, model):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.model = model
+
+    def persistent_id(self, obj):
+        if isinstance(obj, NetworkReach):
+            return 'reach', obj.id
+        elif obj is self.model:
+            return 'model', None
+        elif obj is NO_HISTORY:
+            return 'no_history', None
+        return None
+
+
+class CheckpointUnpickler(pickle.Unpickler):
+    """ Reverses CheckpointPickler, reconnecting the loaded state to the reaches of a freshly loaded network. """
+
+    def __init__(self, file, model):
+        super().__init__(file)
+        self.model = model
+
+    def persistent_load(self, pid):
+        kind, value = pid
+        if kind == 'reach':
+            reach = self.model.network.reach_with_id(value)
+            if reach is None:
+                raise ValueError("Checkpoint refers to reach {0}, which isn't in the network.".format(value))
+            return reach
+        elif kind == 'model':
+            return self.model
+        elif kind == 'no_history':
+            return NO_HISTORY
+        raise pickle.UnpicklingError("Unknown persistent reference {0} in checkpoint.".format(pid))
+
+
+def model_state(model):
+    """ Collects everything that changes while a model runs into one dictionary, leaving out the static network and
+        anything that can be rebuilt from it. Dead fish already written to the dead fish cache stay there. """
+    schedule = model.schedule
+    network = model.network
+    redds = schedule.redds
+    return {
+        'version': CHECKPOINT_VERSION,
+        'temperature_scenario': model.temperature_scenario,
+        'reach_ids': [reach.id for reach in network.reaches],
+        'next_fish_index': model.next_fish_index,
+        'next_redd_index': model.next_redd_index,
+        'schedule': {
+            'steps': schedule.steps,
+            'time': schedule.time,
+            'current_year': schedule.current_year,
+            'week_of_year': schedule.week_of_year,
+            'active_fish': schedule.active_fish,
+            'wakeup_queue': schedule.wakeup_queue,
+            'parked_fish_counts': schedule.parked_fish_counts,
+            'ocean_cohorts': schedule.ocean_cohorts,
+            'recent_dead_fish': schedule.recent_dead_fish,
+            'recent_dead_fry': schedule.recent_dead_fry
+        },
+        'redds': {
+            'arrays': {field: getattr(redds, field)[:redds.n] for field, dtype in redds.FIELDS},
+            'total_emerged': redds.total_emerged,
+            'total_scoured': redds.total_scoured
+        },
+        'network': {
+            'history': network.history,
+            'habitat_competition_stats': network.habitat_competition_stats,
+            'reach_history': {statistic: array[:network.reach_history.n_steps]
+                              for statistic, array in network.reach_history.arrays.items()},
+            'reaches': [(reach.fish, reach.n_redds, reach.spawners) for reach in network.reaches]
+        },
+        'random_state': random.getstate(),
+        'numpy_random_state': np.random.get_state()
+    }
+
+
+def restore_model_state(model, state):
+    """ Puts the state collected by model_state() back into a model built on the same network, including the
+        random number generators, so the run continues exactly as it would have without stopping. """
+    if state['version'] != CHECKPOINT_VERSION:
+        raise ValueError("Checkpoint version {0} can't be resumed by this version of the model.".format(state['version']))
+    network = model.network
+    if state['reach_ids'] != [reach.id for reach in network.reaches]:
+        raise ValueError("Checkpoint was saved from a different network than the one loaded.")
+    model.next_fish_index = state['next_fish_index']
+    model.next_redd_index = state['next_redd_index']
+    schedule = model.schedule
+    for key, value in state['schedule'].items():
+        setattr(schedule, key, value)
+    redds = schedule.redds
+    redds.n = 0
+    for field, dtype in redds.FIELDS:
+        array = state['redds']['arrays'][field]
+        redds.n = len(array)
+        setattr(redds, field, np.concatenate((array, np.zeros(max(len(array), 1024), dtype=dtype))))
+    redds.total_emerged = state['redds']['total_emerged']
+    redds.total_scoured = state['redds']['total_scoured']
+    network_state = state['network']
+    network.history = network_state['history']
+    network.habitat_competition_stats = network_state['habitat_competition_stats']
+    reach_history = network.reach_history
+    for statistic, array in network_state['reach_history'].items():
+        reach_history.arrays[statistic] = np.concatenate((array, np.zeros((max(len(array), schedule.weeks_per_year), array.shape[1]), dtype=array.dtype)))
+        reach_history.n_steps = len(array)
+    for reach, (fish, n_redds, spawners) in zip(network.reaches, network_state['reaches']):
+        reach.fish = fish
+        reach.n_redds = n_redds
+        reach.spawners = spawners
+    network.mouth_passages = {'downstream': 0, 'upstream': 0}
+    network.set_reach_temperatures(max(schedule.steps - 1, 0))  # as set by the census at the end of the last timestep
+    # earlier years' dead fish are in the cache, to be loaded when next requested
+    schedule.loaded_dead_fish = []
+    schedule.loaded_dead_fry = schedule.loaded_dead_fry[:0]
+    schedule.dead_fish_logs_loaded = schedule.dead_fry_logs_loaded = schedule.current_year == 0
+    if schedule.current_year > 0:
+        remove_logs_after_year(model.config.export.dead_fish_cache_path, schedule.current_year - 1)
+    random.setstate(state['random_state'])
+    np.random.set_state(state['numpy_random_state'])
+
+
+def remove_logs_after_year(cache_path, year):
+    """ Deletes dead fish logs for years after the given one, which were written by a run that went past the
+        checkpoint being resumed and would otherwise be loaded along with the resumed run's own logs. """
+    if not os.path.exists(cache_path):
+        return
+    for file_name in os.listdir(cache_path):
+        if file_name.startswith('dead_fish_year_') or file_name.startswith('dead_fry_year_'):
+            log_year = int(file_name.rsplit('_', 1)[1].split('.')[0])
+            if log_year > year:
+                os.remove(os.path.join(cache_path, file_name))
+
+
+def model_state_bytes(model):
+    """ Returns the state of the model pickled the same way as in a checkpoint file, for restoring in memory. """
+    buffer = io.BytesIO()
+    CheckpointPickler(buffer, model).dump(model_state(model))
+    return buffer.getvalue()
+
+
+def restore_model_state_bytes(model, data):
+    """ Restores a state returned by model_state_bytes() into a model on the same network. """
+    restore_model_state(model, CheckpointUnpickler(io.BytesIO(data), model).load())
+
+
+def save_checkpoint(model, path):
+    """ Writes a checkpoint of the model between timesteps. The file is written under a temporary name first and then
+        renamed, so a run interrupted while saving still has its previous checkpoint intact. """
+    directory = os.path.dirname(path)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        pickle.dump((CHECKPOINT_VERSION, model.temperature_scenario, model.config), file, protocol=pickle.HIGHEST_PROTOCOL)
+        CheckpointPickler(file, model).dump(model_state(model))
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(model_class, path):
+    """ Builds a model with no fish on the checkpoint's temperature scenario and config, then restores the checkpoint's
+        state into it. The version, scenario, and config are written ahead of the state so they can be checked before
+        loading the network. """
+    with open(path, 'rb') as file:
+        header = pickle.load(file)
+        version = header[0]
+        if version != CHECKPOINT_VERSION:
+            raise ValueError("Checkpoint {0} is version {1}, which this version of the model (writing version {2}) can't resume."
+                             .format(path, version, CHECKPOINT_VERSION))
+        temperature_scenario, config = header[1:]
+        model = model_class(0, temperature_scenario, config=config)
+        state = CheckpointUnpickler(file, model).load()
+    restore_model_state(model, state)
+    return model
@@ -0,0 +1,164 @@
+import dataclasses
+import numpy as np
+from . import settings
+from .fish import LifeHistory
+
+
+@dataclasses.dataclass(frozen=True)
+class ExportConfig:
+    results_path: str
+    dead_fish_cache_path: str
+    checkpoint_path: str
+    checkpoint_interval: int
+    profile_steps: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class TimeConfig:
+    days_per_week: int
+    weeks_per_year: int
+    event_driven_wakeups: bool
+    ocean_cohorts: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class NetworkConfig:
+    small_network_test: bool
+    most_downstream_reach: int
+    network_to_ocean_distance: float
+    ocean_reach_length: float
+    lemhi_mouth: int
+    pahsimeroi_mouth: int
+    yankee_fork_mouth: int
+    proportion_usable_habitat: float
+    microhabitat_model_cache_path: str
+    microhabitat_preference_cache_path: str
+    shapefile: str
+    node_relationship_file: str
+    temperature_scenario: str
+    temperature_cache_path: str
+    nrei_batch_folder: str
+    plot_simplification_tolerance: float
+
+
+@dataclasses.dataclass(frozen=True)
+class SpawningConfig:
+    required_degree_days_to_emerge: float
+    life_history_inheritance_probability: float
+    max_weeks_to_wait_without_mate: int
+    stray_probability: float
+    fry_history_age: int
+
+
+@dataclasses.dataclass(frozen=True)
+class LifeHistoryConfig:
+    """ Settings for the fish of one life history. The smolt settings only apply to anadromous fish. """
+    spawning_migration_start: int
+    spawning_migration_end: int
+    spawning_migration_speed: float
+    age_at_maturity: int
+    male_postspawn_survival_probability: float
+    female_postspawn_survival_probability: float
+    postspawn_return_rate: float
+    summer_cold_seeking_start: int
+    summer_cold_seeking_end: int
+    fall_warmth_seeking_start: int
+    fall_warmth_seeking_end: int
+    fall_warmth_seeking_rate: float
+    starvation_threshold: float
+    minimum_floater_p: float
+    smolt_outmigration_start: int = None
+    smolt_outmigration_end: int = None
+    smolt_outmigration_speed: float = None
+    smolt_min_fork_length: float = None
+
+
+@dataclasses.dataclass(frozen=True)
+class ModelConfig:
+    """ All the settings of one model, as an immutable object the model carries with it (as model.config) instead of
+        reading the module-level dictionaries in settings.py, so models with different settings can run in the same
+        process and a model's settings go with it to worker processes and into checkpoints. ModelConfig.from_settings()
+        takes the current values of the settings dictionaries, which remain the defaults, and with_overrides() makes
+        a copy with some values changed, named the same way as in the dictionaries.
+
+        The numeric life history settings are also compiled into life_history_arrays, a dictionary of two-element
+        arrays indexed by life history code (0 for anadromous, 1 for resident, as in the census and redd arrays), for
+        code that handles fish of both life histories at once. Settings a life history doesn't have are NaN. """
+
+    export: ExportConfig
+    time: TimeConfig
+    network: NetworkConfig
+    spawning: SpawningConfig
+    resident: LifeHistoryConfig
+    anadromous: LifeHistoryConfig
+    temperature_scenarios: tuple  # (scenario name, tuple of yearly file paths) pairs
+    life_history_arrays: dict = dataclasses.field(init=False, repr=False, compare=False)
+
+    SECTIONS = {'export_settings': 'export',
+                'time_settings': 'time',
+                'network_settings': 'network',
+                'spawning_settings': 'spawning',
+                'resident_fish_settings': 'resident',
+                'anadromous_fish_settings': 'anadromous'}
+
+    def __post_init__(self):
+        arrays = {}
+        for field in dataclasses.fields(LifeHistoryConfig):
+            values = (getattr(self.anadromous, field.name), getattr(self.resident, field.name))
+            arrays[field.name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        object.__setattr__(self, 'life_history_arrays', arrays)
+
+    @classmethod
+    def from_settings(cls):
+        sections = {section: section_config(section, getattr(settings, dictionary_name))
+                    for dictionary_name, section in cls.SECTIONS.items()}
+        scenarios = tuple((name, tuple(file_paths)) for name, file_paths in settings.temperature_scenarios.items())
+        return cls(temperature_scenarios=scenarios, **sections)
+
+    def with_overrides(self, overrides):
+        """ Returns a copy with the given values changed, keyed like 'spawning_settings.STRAY_PROBABILITY'. """
+        sections = {}
+        for parameter, value in overrides.items():
+            section, field = self.parameter_field(parameter)
+            sections.setdefault(section, {})[field] = value
+        return dataclasses.replace(self, **{section: dataclasses.replace(getattr(self, section), **fields)
+                                            for section, fields in sections.items()})
+
+    def parameter_field(self, parameter):
+        """ Returns the section and field names of a parameter named like 'spawning_settings.STRAY_PROBABILITY'. """
+        dictionary_name, _, key = parameter.partition('.')
+        section = self.SECTIONS.get(dictionary_name)
+        if section is None or key.lower() not in {field.name for field in dataclasses.fields(getattr(self, section))}:
+            raise ValueError("Unknown setting '{0}'; settings are named like 'spawning_settings.STRAY_PROBABILITY'.".format(parameter))
+        return section, key.lower()
+
+    def value(self, parameter):
+        section, field = self.parameter_field(parameter)
+        return getattr(getattr(self, section), field)
+
+    def life_history(self, life_history):
+        return self.resident if life_history is LifeHistory.RESIDENT else self.anadromous
+
+    def temperature_scenario_files(self, name):
+        for scenario_name, file_paths in self.temperature_scenarios:
+            if scenario_name == name:
+                return list(file_paths)
+        raise ValueError("Unknown temperature scenario '{0}'. Options are: {1}.".format(
+            name, ", ".join(scenario_name for scenario_name, file_paths in self.temperature_scenarios)))
+
+
+SECTION_CLASSES = {'export': ExportConfig,
+                   'time': TimeConfig,
+                   'network': NetworkConfig,
+                   'spawning': SpawningConfig,
+                   'resident': LifeHistoryConfig,
+                   'anadromous': LifeHistoryConfig}
+
+
+def section_config(section, settings_dict):
+    config_class = SECTION_CLASSES[section]
+    fields = {field.name for field in dataclasses.fields(config_class)}
+    unknown_keys = [key for key in settings_dict if key.lower() not in fields]
+    if len(unknown_keys) > 0:
+        raise ValueError("Unknown setting(s) {0} for {1}.".format(", ".join(unknown_keys), section))
+    return config_class(**{key.lower(): value for key, value in settings_dict.items()})
@@ -1,58 +1,204 @@
+import heapq
 import math
 import os
 import pickle
+import random
 import shutil
-from .settings import export_settings
+import numpy as np
+from .fish import DEAD_FRY_DTYPE, ocean_spawning_probability
+from .profiler import StepProfiler, NO_PROFILER
+from .redd import ReddArrays
 
 class DominanceBasedActivation:
     """ Custom scheduler completely replaces the Mesa framework's BaseScheduler rather than subclassing
-        it, because we need to track two separate collections of agents, Fish and Redds. """
+        it, because we need to track two separate collections, Fish agents and the ReddArrays holding all redds.
+
+        Fish whose coming weeks follow fixed rules (saltwater growth in the ocean, or swimming down the migration
+        reach) are parked in a wakeup queue instead of being stepped every week. When parked, their survival up to
+        their next decision is drawn all at once from the compounded weekly survival probabilities, and when woken
+        (or whenever the fish property is read) their state and histories are caught up in closed form. The weekly
+        stepping only goes through active_fish; the fish property includes the parked ones.
+
+        In ocean cohort mode (model.config.time.ocean_cohorts), ocean fish that won't have a decision until the next
+        year are grouped instead into cohorts by the week they entered the ocean, since the ocean growth and survival
+        models make their members interchangeable. Each week a cohort is thinned with one binomial draw, and at the
+        start of each year one more binomial draw picks the members that will spawn that year, which leave the
+        cohort to be stepped individually. """
 
     model = None
     steps = 0
     time = 0
-    fish = []
-    redds = []
+    active_fish = []
+    redds = None
 
     def __init__(self, model, weeks_per_year):
         self.model = model
         self.steps = 0
         self.time = 0
-        self.fish = []
-        self.redds = []
+        self.active_fish = []
+        self.wakeup_queue = []           # heap of (wake_time, unique_id, fish) for parked fish
+        self.parked_fish_counts = None   # parked fish per census code (2 * reach index + life history code)
+        self.ocean_cohorts = {}          # lists of ocean cohort members, keyed by ocean entry week
+        self.redds = ReddArrays(model)
+        self.profiler = StepProfiler()   # per-step phase timings, recorded while config.export.profile_steps is True
+        self.step_profiler = NO_PROFILER  # the profiler in use for the current step, for Fish.step()
         self.weeks_per_year = weeks_per_year
         self.current_year = 0
         self.week_of_year = 0
         self.recent_dead_fish = []
         self.loaded_dead_fish = []
         self.dead_fish_logs_loaded = True   # set to false whenever there are new dead fish logs dumped but not loaded
+        self.recent_dead_fry = []           # DEAD_FRY_DTYPE tuples for fry that died before allocating histories
+        self.loaded_dead_fry = np.zeros(0, dtype=DEAD_FRY_DTYPE)
+        self.dead_fry_logs_loaded = True
 
     def step(self):
         """ Executes the step of all fish, one at a time, with the largest going first. """
+        profiler = self.step_profiler = self.profiler if self.model.config.export.profile_steps else NO_PROFILER
+        profiler.start_step(self)
         self.current_year = math.floor(self.time / self.weeks_per_year)
         self.week_of_year = self.time % self.weeks_per_year
-        self.fish.sort(key=lambda fish: -fish.fork_length)
-        for fish in self.fish:
+        died_while_parked = self.wake_due_fish()
+        profiler.lap('wake parked fish')
+        left_ocean_cohorts = self.step_ocean_cohorts()
+        profiler.lap('ocean cohorts')
+        self.active_fish.sort(key=lambda fish: -fish.fork_length)
+        profiler.lap('sort')
+        self.model.network.prepare_habitat_competition(self.time)
+        profiler.lap('habitat competition')
+        for fish in self.active_fish:
             fish.step()
-        for redd in self.redds:
-            redd.step()
-        self.model.network.step(self.steps)
-        self.redds = [redd for redd in self.redds if not redd.is_dead]
-        self.fish = [fish for fish in self.fish if not fish.is_dead]
+        profiler.lap('fish step')
+        self.active_fish.extend(died_while_parked)  # so the census removes them from their reaches
+        self.active_fish.extend(left_ocean_cohorts)  # already stepped this timestep by catch_up()
+        self.redds.step(self.time)
+        profiler.lap('redd step')
+        self.active_fish = self.model.network.step(self.steps)
+        profiler.lap('network step')
         if self.current_year > 0 and self.week_of_year == 0:
             self.log_dead_fish()
+        profiler.lap('dead fish logging')
+        profiler.finish_step()
+        self.step_profiler = NO_PROFILER
         self.steps += 1
         self.time += 1
 
+    @property
+    def fish(self):
+        """ All live fish, including the parked ones, whose state and histories stop at the timestep they were parked
+            until they wake. Analysis code that needs them current should call catch_up_parked_fish() first. """
+        return self.active_fish + [fish for wake_time, unique_id, fish in self.wakeup_queue] \
+            + [fish for members in self.ocean_cohorts.values() for fish in members]
+
+    def park(self, fish):
+        """ Called at the end of a fish's step. If the fish's next decision is more than a week away, it's removed
+            from the weekly stepping until then, unless it dies first: one uniform draw against the survival
+            probabilities compounded over the weeks until its decision gives the week of death, if any, in which
+            case it's woken that week only to die. The census drops it from active_fish and counts it from
+            parked_fish_counts instead. """
+        first_step = self.time + 1
+        wake_time = fish.wakeup_time(first_step)
+        if wake_time == first_step:
+            return
+        if self.model.config.time.ocean_cohorts and fish.network_reach.is_ocean and wake_time % self.weeks_per_year == 0:
+            self.join_ocean_cohort(fish, first_step)
+            return
+        survival = np.cumprod([fish.survival_probability(timestep % self.weeks_per_year)
+                               for timestep in range(first_step, wake_time)])
+        death_offsets = np.flatnonzero(survival < random.random())
+        fish.dies_on_waking = len(death_offsets) > 0
+        fish.wake_time = first_step + death_offsets.item(0) if fish.dies_on_waking else wake_time
+        fish.parked_step = first_step
+        fish.is_parked = True
+        heapq.heappush(self.wakeup_queue, (fish.wake_time, fish.unique_id, fish))
+        self.count_parked_fish(fish, 1)
+
+    def count_parked_fish(self, fish, change):
+        if self.parked_fish_counts is None:
+            self.parked_fish_counts = np.zeros(2 * len(self.model.network.reaches), dtype=np.int64)
+        self.parked_fish_counts[2 * fish.network_reach.index + fish.is_resident] += change
+
+    def join_ocean_cohort(self, fish, first_step):
+        """ Adds an ocean fish with no decision pending this year to the cohort of its ocean entry week, or rather
+            the week it would have entered had it never left (for kelts), so all members share one ocean age. """
+        fish.parked_step = first_step
+        fish.is_parked = True
+        self.ocean_cohorts.setdefault(first_step - fish.ocean_age_weeks, []).append(fish)
+        self.count_parked_fish(fish, 1)
+
+    def step_ocean_cohorts(self):
+        """ Applies this timestep to every ocean cohort. The members dying this week are drawn with one binomial draw
+            per cohort, and at the start of a year so are the members deciding to spawn, which leave the cohort to be
+            stepped individually from the next timestep on. Both are caught up through this timestep by catch_up(),
+            with reconstructed histories, and returned in a list. """
+        left_cohorts = []
+        for entry_week, members in list(self.ocean_cohorts.items()):
+            survival_probability = members[0].survival_probability(self.week_of_year)
+            for i in range(np.random.binomial(len(members), 1 - survival_probability)):
+                fish = self.leave_ocean_cohort(members)
+                fish.die("Survival probability model")
+                left_cohorts.append(fish)
+            if self.week_of_year == 0:
+                ocean_age_years = (self.time - entry_week) / self.weeks_per_year
+                for i in range(np.random.binomial(len(members), ocean_spawning_probability(ocean_age_years))):
+                    fish = self.leave_ocean_cohort(members)
+                    fish.has_spawned_this_year = False
+                    fish.should_spawn_this_year = True
+                    left_cohorts.append(fish)
+                for fish in members:
+                    fish.has_spawned_this_year = False
+                    fish.should_spawn_this_year = False
+            if len(members) == 0:
+                del self.ocean_cohorts[entry_week]
+        return left_cohorts
+
+    def leave_ocean_cohort(self, members):
+        """ Removes a random member from a cohort's list of members and returns it, caught up through this timestep. """
+        i = random.randrange(len(members))
+        members[i], members[-1] = members[-1], members[i]
+        fish = members.pop()
+        fish.is_parked = False
+        self.count_parked_fish(fish, -1)
+        fish.catch_up(self.time + 1)
+        return fish
+
+    def wake_due_fish(self):
+        """ Returns parked fish due to wake this timestep to active_fish, caught up through the previous timestep.
+            Those due to die are caught up through this timestep instead and die, and are returned in a list. """
+        died = []
+        while len(self.wakeup_queue) > 0 and self.wakeup_queue[0][0] <= self.time:
+            wake_time, unique_id, fish = heapq.heappop(self.wakeup_queue)
+            fish.is_parked = False
+            self.count_parked_fish(fish, -1)
+            if fish.dies_on_waking:
+                fish.catch_up(self.time + 1)
+                fish.die("Survival probability model")
+                died.append(fish)
+            else:
+                fish.catch_up(self.time)
+                self.active_fish.append(fish)
+        return died
+
+    def catch_up_parked_fish(self):
+        """ Brings every parked fish's state and histories up to the current timestep for analysis, without
+            changing when it wakes. """
+        for wake_time, unique_id, fish in self.wakeup_queue:
+            fish.catch_up(self.time)
+        for members in self.ocean_cohorts.values():
+            for fish in members:
+                fish.catch_up(self.time)
+
     @property
     def dead_fish(self):
         """ This property returns all dead fish, loading them from files if they aren't already loaded. """
         if not self.dead_fish_logs_loaded:
             self.loaded_dead_fish = []
-            cache_path = export_settings['DEAD_FISH_CACHE_PATH']
+            cache_path = self.model.config.export.dead_fish_cache_path
             if not os.path.exists(cache_path):
                 return self.recent_dead_fish
-            for file_name in os.listdir(cache_path):
+            for file_name in sorted(os.listdir(cache_path)):
+                if not file_name.startswith('dead_fish_'):
+                    continue
                 print("Loading cached dead fish from {0}.".format(file_name))
                 file_path = os.path.join(cache_path, file_name)
                 with open(file_path, 'rb') as file:
@@ -64,9 +210,21 @@ class DominanceBasedActivation:
             self.dead_fish_logs_loaded = True
         return self.loaded_dead_fish + self.recent_dead_fish
 
+    @property
+    def dead_fry(self):
+        """ Structured array (DEAD_FRY_DTYPE) of all the fry that died before allocating their histories, loading
+            earlier years' rows from the dead fish cache if they aren't already loaded. """
+        if not self.dead_fry_logs_loaded:
+            cache_path = self.model.config.export.dead_fish_cache_path
+            file_names = sorted(name for name in os.listdir(cache_path) if name.startswith('dead_fry_')) if os.path.exists(cache_path) else []
+            self.loaded_dead_fry = np.concatenate([np.zeros(0, dtype=DEAD_FRY_DTYPE)] +
+                                                  [np.load(os.path.join(cache_path, name)) for name in file_names])
+            self.dead_fry_logs_loaded = True
+        return np.concatenate((self.loaded_dead_fry, np.array(self.recent_dead_fry, dtype=DEAD_FRY_DTYPE)))
+
     def log_dead_fish(self):
         """ Called once a year on Jan 1st, this function writes all dead fish to a file to remove them from memory. """
-        cache_path = export_settings['DEAD_FISH_CACHE_PATH']
+        cache_path = self.model.config.export.dead_fish_cache_path
         if self.current_year == 1:  # if writing the first logs, empty and re-create the log directory
             if os.path.exists(cache_path):
                 shutil.rmtree(cache_path)
@@ -80,21 +238,25 @@ class DominanceBasedActivation:
                 fish.disconnect_for_pickling()
             p.dump(self.recent_dead_fish)
             self.recent_dead_fish = []
+        np.save(os.path.join(cache_path, 'dead_fry_year_{0}.npy'.format(self.current_year - 1)),
+                np.array(self.recent_dead_fry, dtype=DEAD_FRY_DTYPE))
+        self.recent_dead_fry = []
         self.dead_fish_logs_loaded = False
+        self.dead_fry_logs_loaded = False
 
     @property
     def all_fish(self):
         return self.fish + self.dead_fish
 
     def add_fish(self, agent):
-        self.fish.append(agent)
+        self.active_fish.append(agent)
 
-    def add_redd(self, agent):
-        self.redds.append(agent)
+    def add_redd(self, mother):
+        self.redds.add(mother)
 
     @property  # could gain a bit of speed by tracking these as variables instead of calculating whenever called
     def fish_count(self):
-        return len(self.fish)
+        return len(self.active_fish) + len(self.wakeup_queue) + sum(len(members) for members in self.ocean_cohorts.values())
 
     @property
     def redd_count(self):
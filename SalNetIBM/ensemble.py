@@ -0,0 +1,120 @@
+import contextlib
+import glob
+import multiprocessing
+import os
+import random
+import shutil
+import numpy as np
+from .checkpoint import model_state_bytes, restore_model_state_bytes
+from .config import ModelConfig
+from .fish_model import FishModel
+from .shared_network import SharedNetwork
+
+SUMMARY_STATISTICS = ('anad pop', 'res pop', 'anad redds', 'res redds', 'mouth passage down', 'mouth passage up')
+
+# Each worker's model with no fish, and its pickled state, to which the model is reset before every replicate so the
+# network is only loaded once per worker. With fork, the parent loads it once and every worker inherits it; otherwise
+# the parent publishes its network in a SharedNetwork, and each worker attaches to it.
+_worker = {}
+
+
+def run_ensemble(n_replicates, steps, initial_population_size, temperature_scenario=None, base_seed=0,
+                 processes=None, quantiles=(0.05, 0.5, 0.95), config=None):
+    """ Runs replicates of the model with seeds base_seed, base_seed + 1, ... over a pool of worker processes and
+        returns their weekly summary statistics (SUMMARY_STATISTICS from the network history, including the number
+        of fish passing the network's mouth in each direction) as a dictionary with keys:
+            'replicates': a (replicate x timestep x statistic) array of the statistics of every replicate
+            'mean': a dictionary of arrays of the mean of each statistic by timestep
+            'quantiles': a dictionary keyed by quantile of dictionaries like 'mean'
+        Only each replicate's summary series comes back to the parent, as soon as the replicate finishes, so no
+        replicate's fish are ever kept. A replicate's results depend only on its seed, not on the worker that ran it.
+        The replicates use the given config, by default ModelConfig.from_settings(). """
+    if processes is None:
+        processes = min(n_replicates, os.cpu_count())
+    seeds = [base_seed + replicate for replicate in range(n_replicates)]
+    series = np.zeros((n_replicates, steps, len(SUMMARY_STATISTICS)))
+    with worker_pool(processes, initial_population_size, temperature_scenario, config) as pool:
+        for finished, (seed, replicate_series) in enumerate(pool.imap_unordered(run_replicate, [(seed, steps) for seed in seeds])):
+            series[seeds.index(seed)] = replicate_series
+            print("Finished replicate with seed {0} ({1} of {2}).".format(seed, finished + 1, n_replicates))
+    return ensemble_summary(series, quantiles)
+
+
+@contextlib.contextmanager
+def worker_pool(processes, initial_population_size, temperature_scenario=None, config=None):
+    """ A pool of worker processes, each holding a model with no fish on a network loaded only once, which tasks
+        run in the pool reset with fresh_worker_model() before each run. The workers' dead fish caches are deleted
+        when the pool is closed. """
+    if config is None:
+        config = ModelConfig.from_settings()
+    cache_path = config.export.dead_fish_cache_path
+    load_worker_model(temperature_scenario, config)
+    shared_network = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        initargs = (config, initial_population_size, temperature_scenario, None)
+    else:
+        context = multiprocessing.get_context('spawn')
+        shared_network = SharedNetwork(_worker['model'].network)
+        initargs = (config, initial_population_size, temperature_scenario, shared_network.handle)
+    try:
+        with context.Pool(processes, start_worker, initargs) as pool:
+            yield pool
+    finally:
+        _worker.clear()
+        if shared_network is not None:
+            shared_network.close()
+        for worker_cache_path in glob.glob("{0}_ensemble_worker_*".format(cache_path)):
+            shutil.rmtree(worker_cache_path)
+
+
+def ensemble_summary(series, quantiles):
+    summary = {'replicates': series,
+               'mean': {statistic: series[:, :, i].mean(axis=0) for i, statistic in enumerate(SUMMARY_STATISTICS)},
+               'quantiles': {}}
+    quantile_values = np.quantile(series, quantiles, axis=0)
+    for quantile, values in zip(quantiles, quantile_values):
+        summary['quantiles'][quantile] = {statistic: values[:, i] for i, statistic in enumerate(SUMMARY_STATISTICS)}
+    return summary
+
+
+def load_worker_model(temperature_scenario, config, shared_network_handle=None):
+    if 'model' not in _worker:
+        model = FishModel(0, temperature_scenario, shared_network_handle, config=config)
+        _worker.update(model=model, blank_state=model_state_bytes(model))
+
+
+def start_worker(config, initial_population_size, temperature_scenario, shared_network_handle):
+    """ Pool initializer. Each worker logs dead fish to its own cache folder and never writes checkpoints, so
+        replicates running at the same time don't overwrite each other's files. """
+    cache_path = "{0}_ensemble_worker_{1}".format(config.export.dead_fish_cache_path, os.getpid())
+    config = config.with_overrides({'export_settings.DEAD_FISH_CACHE_PATH': cache_path,
+                                    'export_settings.CHECKPOINT_INTERVAL': 0})
+    load_worker_model(temperature_scenario, config, shared_network_handle)
+    _worker.update(config=config, initial_population_size=initial_population_size)
+
+
+def fresh_worker_model(seed, overrides=None):
+    """ Resets the worker's model to its state with no fish and to the worker's config with the given overrides (as
+        taken by ModelConfig.with_overrides()), seeds the random number generators, and adds the initial population,
+        giving the same model as constructing a new one after seeding. """
+    model = _worker['model']
+    restore_model_state_bytes(model, _worker['blank_state'])
+    model.set_config(_worker['config'].with_overrides({} if overrides is None else overrides))
+    random.seed(seed)
+    np.random.seed(seed)
+    model.add_initial_population(_worker['initial_population_size'])
+    return model
+
+
+def run_replicate(task):
+    seed, steps = task
+    model = fresh_worker_model(seed)
+    for i in range(steps):
+        model.step()
+    return seed, replicate_series(model)
+
+
+def replicate_series(model):
+    return np.array([[history_step[statistic] for statistic in SUMMARY_STATISTICS] for history_step in model.network.history],
+                    dtype=np.float64)
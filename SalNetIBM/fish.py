@@ -2,12 +2,11 @@ from mesa import Agent
 import random
 import numpy as np
 
-from ._FishPlotting import FishPlotting
+from .lazy_mixins import LazyMixins
 
-from .settings import time_settings, resident_fish_settings, anadromous_fish_settings, spawning_settings
-from .bioenergetics import daily_growth_from_p, mass_at_length, length_at_mass, preferred_territory_size
+from .bioenergetics import daily_growth_from_coefficients, mass_at_length, length_at_mass, preferred_territory_size_from_f1
 
-from enum import Enum, auto
+from enum import Enum, IntEnum, auto
 
 class Sex(Enum):
     MALE = auto()
@@ -47,27 +46,102 @@ class SpawnStatus(Enum):
     SEEKING_SPAWNING_REACH = auto()
     AWAITING_MATE = auto()
 
-
-class Fish(Agent, FishPlotting):
+class Event(IntEnum):
+    """ Codes for the records in Fish.event_history, stored as (event_index, age, event_code, int_arg) tuples. The
+        text in EVENT_DESCRIPTIONS is only rendered for display, by Fish.event_description(). """
+    BORN = auto()                           # int_arg = natal reach id
+    SET_SPAWNING_REACH = auto()             # int_arg = reach id
+    SET_HOME_REACH = auto()                 # int_arg = reach id
+    STRAYED_DUE_TO_REDD_CAPACITY = auto()
+    SPAWNED_SUCCESSFULLY = auto()
+    FAILED_TO_SPAWN = auto()
+    DIED = auto()                           # int_arg = index into MORTALITY_REASONS, or -1 for other reasons
+
+EVENT_DESCRIPTIONS = {Event.BORN: "Born into reach {0}",
+                      Event.SET_SPAWNING_REACH: "Set spawning reach = {0}",
+                      Event.SET_HOME_REACH: "Set home reach = {0}",
+                      Event.STRAYED_DUE_TO_REDD_CAPACITY: "Straying due to redd capacity",
+                      Event.SPAWNED_SUCCESSFULLY: "Successfully spawned",
+                      Event.FAILED_TO_SPAWN: "Failed to spawn",
+                      Event.DIED: "Died from {0}"}
+
+# Mortality reasons that can be recorded in the compact dead fry rows, which store their index in this tuple
+MORTALITY_REASONS = ("Starvation", "Survival probability model",
+                     "Post-spawn mortality (successful)", "Post-spawn mortality (unsuccessful)")
+
+# One row per fry that died before FRY_HISTORY_AGE, in place of a full dead Fish object
+DEAD_FRY_DTYPE = np.dtype([('unique_id', np.int64),
+                           ('life_history', np.int8),   # 0 = anadromous, 1 = resident
+                           ('sex', np.int8),            # 0 = male, 1 = female
+                           ('birth_week', np.int32),
+                           ('death_week', np.int32),
+                           ('natal_reach_id', np.int32),
+                           ('death_reach_id', np.int32),
+                           ('fork_length', np.float32),
+                           ('mass', np.float32),
+                           ('mortality_reason', np.int8)])  # index into MORTALITY_REASONS
+
+
+class _NoHistory:
+    """ Shared stand-in for every history list of a fry that hasn't reached FRY_HISTORY_AGE. Anything appended to
+        it is discarded, so the fry's step code runs unchanged without building up histories. """
+
+    def append(self, item):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def __iter__(self):
+        return iter(())
+
+NO_HISTORY = _NoHistory()
+
+def ocean_spawning_probability(ocean_age_years):
+    """ Probability that an anadromous fish decides at the start of a year to spawn that year, by years in the ocean. """
+    if ocean_age_years < 1:
+        return 1.0
+    elif ocean_age_years < 2:
+        return 0.07
+    elif ocean_age_years < 3:
+        return 0.6
+    elif ocean_age_years < 4:
+        return 0.76
+    else:
+        return 1.0
+
+# Activities in which a fish can follow fixed weekly rules, so the scheduler can park it until its next decision
+PARKABLE_ACTIVITIES = (Activity.SALTWATER_GROWTH, Activity.SMOLT_OUTMIGRATION, Activity.KELT_OUTMIGRATION)
+
+
+class Fish(Agent, LazyMixins):
     """ A single O. mykiss individual."""
-    def __init__(self, unique_id, model, network_reach, life_history, redd):
+
+    LAZY_MIXINS = (('._FishPlotting', 'FishPlotting'),)  # plotting methods, loaded with bokeh on first use
+
+    def __init__(self, unique_id, model, network_reach, life_history, birth_position=None, spawning_reach=None,
+                 sex=None, preferred_p=None):
+        """ The fish isn't added to its reach's list of fish here; FishModel.add_fish() and add_fish_cohort() do that.
+            The spawning reach, sex, and preferred_p are drawn randomly unless given, so add_fish_cohort() can draw
+            them for a whole cohort at once. """
         super().__init__(unique_id, model)
         self.network_reach = network_reach
         self.natal_reach = network_reach  # should never change
         self.spawning_reach = network_reach  # usually stays as natal reach, but can change to stray
         self.home_reach = network_reach  # home reach for feeding residents
-        self.network_reach.fish.append(self)
         self.life_history = life_history
-        if life_history is LifeHistory.ANADROMOUS and (random.random() < spawning_settings['STRAY_PROBABILITY']
-                                                       or not self.spawning_reach.is_within_steelhead_extent):
+        if spawning_reach is not None:
+            self.spawning_reach = spawning_reach
+        elif life_history is LifeHistory.ANADROMOUS and (random.random() < model.config.spawning.stray_probability
+                                                         or not self.spawning_reach.is_within_steelhead_extent):
             self.spawning_reach = network_reach.network.random_reach(True)
-        if redd is None:  # only for the fish created when initializing the model
+        if birth_position is None:  # only for the fish created when initializing the model
             self.position_within_reach = random.uniform(0, network_reach.length)
             self.origin = Origin.INITIATED
-        else:
-            self.position_within_reach = redd.position_within_reach
+        else:  # fry emerging at the position of their redd
+            self.position_within_reach = birth_position
             self.origin = Origin.BORN
-        self.sex = random.choice([Sex.MALE, Sex.FEMALE])
+        self.sex = random.choice([Sex.MALE, Sex.FEMALE]) if sex is None else sex
         self.fork_length = 35
         self.mass = 0.5
         self.stray = False
@@ -78,9 +152,9 @@ class Fish(Agent, FishPlotting):
         self.ocean_entry_week = None
         self.ocean_age_weeks = 0
         self.mortality_reason = None
-        self.preferred_p = 0.45 + 0.05 * random.normalvariate(0, 1)    # how much food this fish wants to get; varied based individual metabolic variation
+        self.preferred_p = 0.45 + 0.05 * random.normalvariate(0, 1) if preferred_p is None else preferred_p  # how much food this fish wants to get; varied based individual metabolic variation
         self.p = self.preferred_p                                      # how much food it actually gets in each timestep based on territories
-        self.settings = resident_fish_settings if self.is_resident else anadromous_fish_settings
+        self.settings = model.config.life_history(life_history)
         self.should_spawn_this_year = False
         self.has_spawned_this_year = False
         self.is_being_outcompeted = False
@@ -92,12 +166,38 @@ class Fish(Agent, FishPlotting):
         self.movement_rate = 0
         self.current_route = None
         self.current_route_position = 0
+        self.planned_territory = (None, None, None, 0)  # (timestep, reach, habitat key, space) from the uncontested-reach precheck
+        self.is_parked = False      # True while the fish is in the scheduler's wakeup queue instead of stepping weekly
+        self.parked_step = None     # first timestep not yet applied to a parked fish by catch_up()
+        self.wake_time = None       # timestep at which a parked fish resumes stepping (or dies, if dies_on_waking)
+        self.dies_on_waking = False
 
         self._event_log_index = -1  # internal increment for event logs, accessed via property that increments it
-        self.event_history = [(self.event_log_index, 0, "Born into reach {0}".format(self.natal_reach.id))]
+        if self.origin is Origin.BORN and self.model.config.spawning.fry_history_age > 0:
+            # Fry only track their current state until they reach FRY_HISTORY_AGE, since most die before then
+            self.history_start_age = None
+            self.event_history = self.reach_history = self.activity_history = self.movement_history = NO_HISTORY
+            self.mass_history = self.length_history = self.temperature_history = self.p_history = NO_HISTORY
+            self.space_use_history = NO_HISTORY
+        else:
+            self.allocate_histories()
+
+    def allocate_histories(self):
+        """ Creates the fish's history lists. Fish created at initialization get them right away, and fry get them
+            on reaching FRY_HISTORY_AGE, when their weekly mass, length, temperature, and p histories start (at
+            index 0 = age history_start_age). A fry's event, reach, activity and movement histories start with its
+            birth, plus its current reach, activity and movement if those have changed since then. """
+        self.history_start_age = self.age_weeks
+        self.event_history = [(self.event_log_index, 0, Event.BORN, self.natal_reach.id)]
         self.reach_history = [(self.event_log_index, 0, self.natal_reach.id)]
-        self.activity_history = [(self.event_log_index, 0, self.activity)]
-        self.movement_history = [(self.event_log_index, 0, self.movement_mode, self.movement_rate)]
+        self.activity_history = [(self.event_log_index, 0, Activity.FRESHWATER_GROWTH)]
+        self.movement_history = [(self.event_log_index, 0, Movement.STATIONARY, 0)]
+        if self.network_reach is not self.natal_reach:
+            self.reach_history.append((self.event_log_index, self.age_weeks, self.network_reach.id))
+        if self.activity is not Activity.FRESHWATER_GROWTH:
+            self.activity_history.append((self.event_log_index, self.age_weeks, self.activity))
+        if self.movement_mode is not Movement.STATIONARY:
+            self.movement_history.append((self.event_log_index, self.age_weeks, self.movement_mode, self.movement_rate))
         self.mass_history = []
         self.length_history = []
         self.temperature_history = []
@@ -117,6 +217,7 @@ class Fish(Agent, FishPlotting):
         self.spawning_reach_id = self.spawning_reach.id
         self.home_reach_id = self.home_reach.id
         self.current_route = None
+        self.planned_territory = (None, None, None, 0)
         self.network_reach = None
         self.natal_reach = None
         self.spawning_reach = None
@@ -142,7 +243,7 @@ class Fish(Agent, FishPlotting):
 
     @property
     def is_mature(self):
-        is_old_enough = self.age_weeks >= self.settings['AGE_AT_MATURITY']
+        is_old_enough = self.age_weeks >= self.settings.age_at_maturity
         if self.is_resident:
             return is_old_enough
         else:  # anadromous fish aren't "mature" until they've been to the ocean
@@ -152,6 +253,10 @@ class Fish(Agent, FishPlotting):
         if activity is Activity.SALTWATER_GROWTH and self.ocean_entry_week is None:
             print("Setting an ocean fish that isn't in the ocean")
         if self.activity is not activity:
+            if self.activity is Activity.SPAWNING:
+                self.network_reach.spawners.remove(self)
+            elif activity is Activity.SPAWNING:
+                self.network_reach.spawners.add(self)
             self.activity = activity
             self.activity_duration = 0
             self.activity_history.append((self.event_log_index, self.age_weeks, self.activity))
@@ -161,114 +266,162 @@ class Fish(Agent, FishPlotting):
         self.movement_rate = movement_rate
         self.movement_history.append((self.event_log_index, self.age_weeks, movement_mode, movement_rate))
 
-    def log_event(self, description):
-        self.event_history.append((self.event_log_index, self.age_weeks, description))
+    def log_event(self, event, int_arg=-1):
+        self.event_history.append((self.event_log_index, self.age_weeks, event, int_arg))
+
+    def event_description(self, event, int_arg):
+        """ Renders an event_history record as text for display. """
+        if event is Event.DIED:
+            return EVENT_DESCRIPTIONS[event].format(self.mortality_reason)
+        return EVENT_DESCRIPTIONS[event].format(int_arg)
 
     def set_spawning_reach(self, reach):
-        self.log_event("Set spawning reach = {0}".format(reach.id))
+        self.log_event(Event.SET_SPAWNING_REACH, reach.id)
         self.spawning_reach = reach
 
     def set_home_reach(self, reach):
-        self.log_event("Set home reach = {0}".format(reach.id))
+        self.log_event(Event.SET_HOME_REACH, reach.id)
         self.home_reach = reach
 
     @property
     def age_years(self):
-        return self.age_weeks / time_settings['WEEKS_PER_YEAR']
+        return self.age_weeks / self.model.config.time.weeks_per_year
 
     def current_habitat_preferences(self):
-        temperature_key = int(round(self.network_reach.current_temperature))
-        if temperature_key < 1:
-            temperature_key = 1
-        if temperature_key > 20:
-            temperature_key = 20
-        #lengths_for_temperature = np.array(list(self.network_reach.network.habitat_preferences[temperature_key].keys()))
-        #length_key = lengths_for_temperature[(np.abs(lengths_for_temperature - self.fork_length)).argmin()]
-        length_key = self.network_reach.network.habitat_preference_fork_lengths[np.abs(self.network_reach.network.habitat_preference_fork_lengths - self.fork_length).argmin()]
-        return self.network_reach.network.habitat_preferences[temperature_key][length_key]
+        return self.network_reach.network.habitat_preference_indices_for(self.network_reach.current_temperature, self.fork_length)
 
     def step(self):
+        if self.history_start_age is None and self.age_weeks >= self.model.config.spawning.fry_history_age:
+            self.allocate_histories()
         if self.model.schedule.week_of_year == 0:
             self.has_spawned_this_year = False
             self.should_spawn_this_year = True
             if self.is_anadromous:
-                ocean_age_years = self.ocean_age_weeks / time_settings['WEEKS_PER_YEAR']
+                ocean_age_years = self.ocean_age_weeks / self.model.config.time.weeks_per_year
                 if ocean_age_years >= 1:
-                    rand = random.random()
-                    if 1 <= ocean_age_years < 2:
-                        self.should_spawn_this_year = True if rand < 0.07 else False
-                    elif 2 <= ocean_age_years < 3:
-                        self.should_spawn_this_year = True if rand < 0.6 else False
-                    elif 3 <= ocean_age_years < 4:
-                        self.should_spawn_this_year = True if rand < 0.76 else False
-                    else:
-                        self.should_spawn_this_year = True
+                    self.should_spawn_this_year = random.random() < ocean_spawning_probability(ocean_age_years)
 
         # Record history, except p_history, which is recorded in grow()
         self.length_history.append(self.fork_length)
         self.mass_history.append(self.mass)
         self.temperature_history.append(self.network_reach.current_temperature)
 
+        profiler = self.model.schedule.step_profiler
+        profiler.start_fish_lap()
         self.dispatch_activities()
+        profiler.fish_lap('dispatch')
 
         if self.movement_mode is not Movement.STATIONARY:
             self.move()
+        profiler.fish_lap('move')
 
         self.activity_duration += 1
         self.age_weeks += 1
         self.ocean_age_weeks += 1 if self.network_reach.is_ocean else 0
 
+        profiler.start_fish_lap()
         if self.activity in (Activity.FRESHWATER_GROWTH, Activity.SALTWATER_GROWTH,
                              Activity.SUMMER_COLD_SEEKING, Activity.FALL_WARMTH_SEEKING,
                              Activity.RANDOM_DISPERSAL, Activity.COMPETITIVE_DISPERSAL):
             self.grow()  # should smolts be growing, too?
+        profiler.fish_lap('grow')
 
         self.possible_mortality()
+        profiler.fish_lap('mortality')
+
+        if self.activity in PARKABLE_ACTIVITIES and not self.is_dead and self.model.config.time.event_driven_wakeups:
+            self.model.schedule.park(self)
+
+    def wakeup_time(self, first_step):
+        """ For a fish whose coming weeks follow fixed rules -- saltwater growth in the ocean, or swimming down the
+            migration reach toward it -- returns the first timestep from first_step on at which it has a decision to
+            make: the start of a year (when the decision to spawn is redrawn), a week in which it could start its
+            spawning migration, or the week a migrant swims out of the migration reach. Returns first_step for fish
+            that aren't following such rules. """
+        if self.activity is Activity.SALTWATER_GROWTH:
+            if not self.network_reach.is_ocean or self.movement_mode is not Movement.STATIONARY:
+                return first_step
+            wake_time = None
+        elif self.activity in (Activity.SMOLT_OUTMIGRATION, Activity.KELT_OUTMIGRATION):
+            if not self.network_reach.is_migration_reach or self.movement_mode is not Movement.DOWNSTREAM:
+                return first_step
+            position = self.position_within_reach
+            wake_time = first_step
+            while position - self.movement_rate >= 0:  # same arithmetic as network.position_after_movement()
+                position -= self.movement_rate
+                wake_time += 1
+        else:
+            return first_step
+        weeks_per_year = self.model.config.time.weeks_per_year
+        next_year_start = -(-first_step // weeks_per_year) * weeks_per_year
+        wake_time = next_year_start if wake_time is None else min(wake_time, next_year_start)
+        if self.should_spawn_this_year and not self.has_spawned_this_year and self.ocean_entry_week is not None:
+            year_start = next_year_start - weeks_per_year
+            age_of_maturity_step = first_step + self.settings.age_at_maturity - self.age_weeks
+            migration_step = max(first_step, age_of_maturity_step, year_start + self.settings.spawning_migration_start)
+            if migration_step <= year_start + self.settings.spawning_migration_end:
+                wake_time = min(wake_time, migration_step)
+        return wake_time
+
+    def catch_up(self, end_step):
+        """ Applies the closed-form equivalent of Fish.step() to a parked fish for each timestep from parked_step up
+            to (not including) end_step, backfilling its weekly histories as it goes: migrants just swim downstream,
+            and fish in the ocean grow by the ocean growth formula. Survival was already decided when the fish was
+            parked, so nothing here is random. """
+        network_reach = self.network_reach
+        for timestep in range(self.parked_step, end_step):
+            self.length_history.append(self.fork_length)
+            self.mass_history.append(self.mass)
+            self.temperature_history.append(network_reach.temperature_at_week(timestep - 1))  # set in the previous census
+            if self.movement_mode is Movement.DOWNSTREAM:
+                self.position_within_reach -= self.movement_rate
+            self.activity_duration += 1
+            self.age_weeks += 1
+            if network_reach.is_ocean:
+                self.ocean_age_weeks += 1
+                self.grow()
+        self.parked_step = end_step
 
     def dispatch_activities(self):
+        """ The activity state machine as a chain of conditions in priority order. """
+
         # Anadromous fish ready to smolt start toward the ocean
 
         if self.activity is Activity.FRESHWATER_GROWTH \
                 and self.life_history is LifeHistory.ANADROMOUS \
-                and self.fork_length >= self.settings['SMOLT_MIN_FORK_LENGTH'] \
-                and self.model.schedule.week_of_year_is_within(self.settings['SMOLT_OUTMIGRATION_START'],
-                        self.settings['SMOLT_OUTMIGRATION_END']):
-            self.set_activity(Activity.SMOLT_OUTMIGRATION)
-            self.set_movement(Movement.DOWNSTREAM, self.settings['SMOLT_OUTMIGRATION_SPEED'])
+                and self.fork_length >= self.settings.smolt_min_fork_length \
+                and self.model.schedule.week_of_year_is_within(self.settings.smolt_outmigration_start,
+                        self.settings.smolt_outmigration_end):
+            self.start_smolt_outmigration()
 
         # Smolts arriving at the ocean stay there
 
         elif self.activity is Activity.SMOLT_OUTMIGRATION and self.network_reach.is_ocean:
-            self.ocean_entry_week = self.model.schedule.time
-            self.set_activity(Activity.SALTWATER_GROWTH)
-            self.set_movement(Movement.STATIONARY)
+            self.enter_ocean()
 
         # Fish in hot water during the summer seek cold water and stop when they get there
 
         elif self.activity is Activity.FRESHWATER_GROWTH \
                 and self.network_reach.current_temperature > 24 \
-                and self.model.schedule.week_of_year_is_within(self.settings['SUMMER_COLD_SEEKING_START'],
-                    self.settings['SUMMER_COLD_SEEKING_END']):
-            self.set_activity(Activity.SUMMER_COLD_SEEKING)
-            cold_seeking_rate = 0.4 if self.age_years < 1 else 1.0
-            self.set_movement(Movement.UPSTREAM, cold_seeking_rate)
+                and self.model.schedule.week_of_year_is_within(self.settings.summer_cold_seeking_start,
+                    self.settings.summer_cold_seeking_end):
+            self.start_summer_cold_seeking()
 
         elif self.activity is Activity.SUMMER_COLD_SEEKING \
                 and self.network_reach.current_temperature <= 20:
-            self.set_activity(Activity.FRESHWATER_GROWTH)
-            self.set_movement(Movement.STATIONARY)
+            self.resume_freshwater_growth()
 
         # A small proportion of large fish in cold water during the fall seek warmer water, but stop 5th -order
         # or after 4 weeks, whichever comes first, if they don't find it
         # COMMENTED OUT because right now, there is no warm water within the desired range to seek!
         # elif self.activity is Activity.FRESHWATER_GROWTH \
-        #         and self.model.schedule.week_of_year_is_within(self.settings['FALL_WARMTH_SEEKING_START'],
-        #             self.settings['FALL_WARMTH_SEEKING_END']) \
+        #         and self.model.schedule.week_of_year_is_within(self.settings.fall_warmth_seeking_start,
+        #             self.settings.fall_warmth_seeking_end) \
         #         and self.fork_length > 180 \
         #         and random.random() < 0.2 \
         #         and not 10 <= self.temperature <= 20:
         #     self.set_activity(Activity.FALL_WARMTH_SEEKING)
-        #     self.set_movement(Movement.DOWNSTREAM, self.settings['FALL_WARMTH_SEEKING_RATE'])
+        #     self.set_movement(Movement.DOWNSTREAM, self.settings.fall_warmth_seeking_rate)
         #
         # elif self.activity is Activity.FALL_WARMTH_SEEKING \
         #         and (10 <= self.temperature <= 20
@@ -281,16 +434,11 @@ class Fish(Agent, FishPlotting):
 
         elif self.activity is Activity.FRESHWATER_GROWTH \
                 and random.random() < 0.002:  # this 0.002 weekly chance gives a 9 % annual chance of random dispersal
-            self.set_activity(Activity.RANDOM_DISPERSAL)
-            self.set_movement(Movement.RANDOM, 5)
+            self.start_random_dispersal()
 
         elif self.activity is Activity.RANDOM_DISPERSAL \
                 and random.random() < 0.25:  # a randomly dispersing fish has a 25 % chance of stopping any given week
-            self.set_activity(Activity.FRESHWATER_GROWTH)
-            self.set_movement(Movement.STATIONARY)
-            self.set_home_reach(self.network_reach)
-            if self.life_history is LifeHistory.RESIDENT and self.network_reach.capacity_redds > 0:
-                self.set_spawning_reach(self.network_reach)
+            self.stop_random_dispersal()
 
         # Fish exceeding the capacity of their reach are forced to disperse
 
@@ -300,48 +448,27 @@ class Fish(Agent, FishPlotting):
             # Each network reach has a fixed # of spots available (and unoccupied) at the start of each timestep,
             # as determined by its capacity. Because fish are stepped through in order from largest to smallest, the
             # large ones will fill the appropriate capacity first and the small ones have to move.
-            self.set_activity(Activity.COMPETITIVE_DISPERSAL)
-            if self.movement_mode is Movement.STATIONARY:
-                self.set_movement(Movement.RANDOM, 1)
+            self.start_competitive_dispersal()
 
         # A competitive-dispersing fish that is no longer being outcompeted stops and switches to freshwater growth
 
         elif self.activity is Activity.COMPETITIVE_DISPERSAL \
                 and not self.is_being_outcompeted:
-            self.set_activity(Activity.FRESHWATER_GROWTH)
-            self.set_movement(Movement.STATIONARY)
-            self.set_home_reach(self.network_reach)
+            self.stop_dispersal()
 
         # Mature fish ready to spawn start seeking their natal reach
 
         elif self.is_mature \
                 and not self.has_spawned_this_year \
                 and self.activity not in (Activity.SPAWNING_MIGRATION, Activity.SPAWNING) \
-                and self.model.schedule.week_of_year_is_within(self.settings['SPAWNING_MIGRATION_START'], self.settings['SPAWNING_MIGRATION_END']) \
+                and self.model.schedule.week_of_year_is_within(self.settings.spawning_migration_start, self.settings.spawning_migration_end) \
                 and self.should_spawn_this_year:
-            self.set_activity(Activity.SPAWNING_MIGRATION)
-            self.set_movement(Movement.SEEKING_SPAWNING_REACH, self.settings['SPAWNING_MIGRATION_SPEED'])
+            self.start_spawning_migration()
 
         # Spawning fish arrive at the spawning grounds, possibly after going astray
 
         elif self.activity is Activity.SPAWNING_MIGRATION:
-            if self.network_reach == self.spawning_reach and not self.stray:
-                if len(self.network_reach.redds) >= self.network_reach.capacity_redds:
-                    self.stray = True
-                    self.log_event("Straying due to redd capacity")
-                    self.set_movement(Movement.RANDOM, self.movement_rate)
-                else:
-                    self.set_activity(Activity.SPAWNING)
-            elif self.stray:
-                if self.sex is Sex.FEMALE:  # female strays stop at the first open place to build a redd
-                    if len(self.network_reach.redds) < self.network_reach.capacity_redds:
-                        self.set_activity(Activity.SPAWNING)
-                else:  # male strays stop at the first spawning females
-                    spawning_females = [fish for fish in self.network_reach.fish if fish.sex is Sex.FEMALE
-                                        and fish.activity is Activity.SPAWNING]
-                    if len(spawning_females) > 0:
-                        self.set_activity(Activity.SPAWNING)
-                        self.set_movement(Movement.STATIONARY)
+            self.continue_spawning_migration()
 
         # Female spawners (as set by above code, on a previous timestep) spawn
 
@@ -351,60 +478,116 @@ class Fish(Agent, FishPlotting):
         # Male spawners cease to be spawners if there haven't been any females around for a long time
 
         elif self.activity is Activity.SPAWNING and self.sex is Sex.MALE \
-                and self.activity_duration >= spawning_settings['MAX_WEEKS_TO_WAIT_WITHOUT_MATE']:
+                and self.activity_duration >= self.model.config.spawning.max_weeks_to_wait_without_mate:
             self.post_spawn(False)
 
         # Kelts heading to the ocean (triggered in self.post_spawn()) stop when they get there
 
         elif self.activity is Activity.KELT_OUTMIGRATION and self.network_reach.is_ocean:
-            self.set_activity(Activity.SALTWATER_GROWTH)
-            self.set_movement(Movement.STATIONARY)
+            self.resume_saltwater_growth()
 
         # Residents postspawn stop when they get to their home reach
 
         elif self.activity is Activity.POSTSPAWN_RETURN_HOME and self.network_reach is self.home_reach:
-            self.set_activity(Activity.FRESHWATER_GROWTH)
-            self.set_movement(Movement.STATIONARY)
+            self.resume_freshwater_growth()
 
         # Fish that reach the end of the spawning period without finding spawning grounds give up
         # todo NEED TO RETHINK THIS PART A BIT!!!
 
         # elif self.activity in (Activity.SPAWNING_MIGRATION, Activity.SPAWNING) and not \
-        #         self.model.schedule.week_of_year_is_within(self.settings['SPAWNING_MIGRATION_START'],
-        #             self.settings['SPAWNING_MIGRATION_END']):
+        #         self.model.schedule.week_of_year_is_within(self.settings.spawning_migration_start,
+        #             self.settings.spawning_migration_end):
         #     self.post_spawn(False)
 
+    # Transitions made by dispatch_activities()
+
+    def start_smolt_outmigration(self):
+        self.set_activity(Activity.SMOLT_OUTMIGRATION)
+        self.set_movement(Movement.DOWNSTREAM, self.settings.smolt_outmigration_speed)
+
+    def enter_ocean(self):
+        self.ocean_entry_week = self.model.schedule.time
+        self.set_activity(Activity.SALTWATER_GROWTH)
+        self.set_movement(Movement.STATIONARY)
+
+    def start_summer_cold_seeking(self):
+        self.set_activity(Activity.SUMMER_COLD_SEEKING)
+        cold_seeking_rate = 0.4 if self.age_years < 1 else 1.0
+        self.set_movement(Movement.UPSTREAM, cold_seeking_rate)
+
+    def resume_freshwater_growth(self):
+        self.set_activity(Activity.FRESHWATER_GROWTH)
+        self.set_movement(Movement.STATIONARY)
+
+    def resume_saltwater_growth(self):
+        self.set_activity(Activity.SALTWATER_GROWTH)
+        self.set_movement(Movement.STATIONARY)
+
+    def start_random_dispersal(self):
+        self.set_activity(Activity.RANDOM_DISPERSAL)
+        self.set_movement(Movement.RANDOM, 5)
+
+    def start_competitive_dispersal(self):
+        self.set_activity(Activity.COMPETITIVE_DISPERSAL)
+        if self.movement_mode is Movement.STATIONARY:
+            self.set_movement(Movement.RANDOM, 1)
+
+    def stop_dispersal(self):
+        self.set_activity(Activity.FRESHWATER_GROWTH)
+        self.set_movement(Movement.STATIONARY)
+        self.set_home_reach(self.network_reach)
+
+    def stop_random_dispersal(self):
+        self.stop_dispersal()
+        if self.life_history is LifeHistory.RESIDENT and self.network_reach.capacity_redds > 0:
+            self.set_spawning_reach(self.network_reach)
+
+    def start_spawning_migration(self):
+        self.set_activity(Activity.SPAWNING_MIGRATION)
+        self.set_movement(Movement.SEEKING_SPAWNING_REACH, self.settings.spawning_migration_speed)
+
+    def continue_spawning_migration(self):
+        if self.network_reach == self.spawning_reach and not self.stray:
+            if self.network_reach.n_redds >= self.network_reach.capacity_redds:
+                self.stray = True
+                self.log_event(Event.STRAYED_DUE_TO_REDD_CAPACITY)
+                self.set_movement(Movement.RANDOM, self.movement_rate)
+            else:
+                self.set_activity(Activity.SPAWNING)
+        elif self.stray:
+            if self.sex is Sex.FEMALE:  # female strays stop at the first open place to build a redd
+                if self.network_reach.n_redds < self.network_reach.capacity_redds:
+                    self.set_activity(Activity.SPAWNING)
+            else:  # male strays stop at the first spawning females
+                if self.network_reach.spawners.has_spawning_females:
+                    self.set_activity(Activity.SPAWNING)
+                    self.set_movement(Movement.STATIONARY)
+
     def female_spawn(self):
-        possible_mates = [fish for fish in self.network_reach.fish if fish.sex is Sex.MALE
-                          and fish.activity is Activity.SPAWNING and not fish.has_spawned_this_year]
-        if len(possible_mates) == 0:
-            if self.activity_duration >= spawning_settings['MAX_WEEKS_TO_WAIT_WITHOUT_MATE']:
+        mate = self.network_reach.spawners.random_mate(self)  # prefers a mate with the same life history
+        if mate is None:
+            if self.activity_duration >= self.model.config.spawning.max_weeks_to_wait_without_mate:
                 self.post_spawn(False)
             return  # if no males around, just wait until one shows up
         else:
-            preferred_mates = [mate for mate in possible_mates if mate.life_history == self.life_history]
-            if len(preferred_mates) > 0:
-                mate = random.choice(preferred_mates)
-            else:
-                mate = random.choice(possible_mates)
             self.model.add_redd(self)
             self.post_spawn(True)
             mate.post_spawn(True)
 
     def post_spawn(self, succeeded):
         self.has_spawned_this_year = True
-        self.log_event("Successfully spawned" if succeeded else "Failed to spawn")
-        survival_probability = self.settings['MALE_POSTSPAWN_SURVIVAL_PROBABILITY'] if self.sex is Sex.MALE \
-            else self.settings['FEMALE_POSTSPAWN_SURVIVAL_PROBABILITY']
+        self.log_event(Event.SPAWNED_SUCCESSFULLY if succeeded else Event.FAILED_TO_SPAWN)
+        survival_probability = self.settings.male_postspawn_survival_probability if self.sex is Sex.MALE \
+            else self.settings.female_postspawn_survival_probability
         if random.random() > survival_probability:
             self.die("Post-spawn mortality ({0})".format("successful" if succeeded else "unsuccessful"))
         else:
             if self.life_history is LifeHistory.ANADROMOUS:
                 self.set_activity(Activity.KELT_OUTMIGRATION)
-                self.set_movement(Movement.DOWNSTREAM, self.settings['POSTSPAWN_RETURN_RATE'])
+                self.set_movement(Movement.DOWNSTREAM, self.settings.postspawn_return_rate)
             else:
                 self.set_activity(Activity.POSTSPAWN_RETURN_HOME)
-                self.set_movement(Movement.SEEKING_HOME_REACH, self.settings['POSTSPAWN_RETURN_RATE'])
+                self.set_movement(Movement.SEEKING_HOME_REACH, self.settings.postspawn_return_rate)
 
     def move(self):
         initial_network_reach = self.network_reach
@@ -447,34 +630,32 @@ class Fish(Agent, FishPlotting):
         if self.network_reach != initial_network_reach:
             initial_network_reach.fish.remove(self)
             self.network_reach.fish.append(self)
+            if self.activity is Activity.SPAWNING:
+                initial_network_reach.spawners.remove(self)
+                self.network_reach.spawners.add(self)
+            if self.network_reach.is_uncontested:
+                self.network_reach.network.add_habitat_arrival(self, self.model.schedule.time)
             self.reach_history.append((self.event_log_index, self.age_weeks, self.network_reach.id))
+            was_outside_network = initial_network_reach.is_ocean or initial_network_reach.is_migration_reach
+            if was_outside_network != (self.network_reach.is_ocean or self.network_reach.is_migration_reach):
+                self.network_reach.network.mouth_passages['upstream' if was_outside_network else 'downstream'] += 1
 
     def grow(self):
         if not self.network_reach.is_ocean:
-            self.is_being_outcompeted = True
-            best_habitat_key = None
-            most_space_available = -1
-            space_preferred = preferred_territory_size(self.network_reach.current_temperature, self.mass, self.p, self.network_reach.food_production)
-            for habitat_key, generic_nrei in self.current_habitat_preferences():
-                habitat_exists_in_reach = (habitat_key in self.network_reach.current_habitat_available.keys())
-                space_available = self.network_reach.current_habitat_available[habitat_key] if habitat_exists_in_reach else -2
-                if space_available >= space_preferred:
-                    self.is_being_outcompeted = False
-                    self.network_reach.current_habitat_available[habitat_key] -= space_preferred
-                    self.space_use_history.append((habitat_key, space_preferred))
-                    self.p = self.preferred_p
-                    break
-                else:
-                    if space_available > most_space_available:  # keep track of the habitat with the most space in case one with enough space is never found
-                        most_space_available = space_available
-                        best_habitat_key = habitat_key
-            if self.is_being_outcompeted:
-                proportion_of_preferred_territory_obtained = most_space_available / space_preferred
-                self.space_use_history.append((best_habitat_key, most_space_available))
-                self.network_reach.current_habitat_available[best_habitat_key] = 0
-                self.p = max(proportion_of_preferred_territory_obtained * self.preferred_p, self.settings['MINIMUM_FLOATER_P'])
-            dg = daily_growth_from_p(self.network_reach.current_temperature, self.mass, self.p)
-            weekly_growth_multiplier = (1 + dg) ** time_settings['DAYS_PER_WEEK']
+            planned_timestep, planned_reach, planned_habitat_key, planned_space = self.planned_territory
+            has_current_plan = planned_timestep == self.model.schedule.time and planned_reach is self.network_reach
+            if has_current_plan and self.network_reach.is_uncontested:
+                # Fast path: the reach can't be saturated this week, so the fish gets its planned habitat class
+                self.network_reach.current_habitat_available[planned_habitat_key] -= planned_space
+                self.is_being_outcompeted = False
+                self.space_use_history.append((self.network_reach.network.habitat_keys[planned_habitat_key], planned_space))
+                self.p = self.preferred_p
+                self.network_reach.network.habitat_competition_stats['fast path fish'] += 1
+            else:
+                self.allocate_territory(planned_space if has_current_plan else None)
+            f1T, f2T, f3T, f4T = self.network_reach.temperature_coefficients
+            dg = daily_growth_from_coefficients(f1T, f2T, f3T, f4T, self.mass, self.p)
+            weekly_growth_multiplier = (1 + dg) ** self.model.config.time.days_per_week
             self.mass = self.mass * weekly_growth_multiplier
             if self.mass > self.lifetime_maximum_mass:
                 self.lifetime_maximum_mass = self.mass
@@ -486,24 +667,58 @@ class Fish(Agent, FishPlotting):
             self.lifetime_maximum_mass = self.mass
             self.p_history.append(np.nan)
 
+    def allocate_territory(self, space_preferred=None):
+        """ Full habitat allocation for fish in contested reaches: walks down the fish's habitat preferences to the
+            first class with room for its preferred territory, or takes whatever is left of the roomiest class and
+            has its p reduced accordingly if none has room. """
+        self.network_reach.network.habitat_competition_stats['full allocation fish'] += 1
+        self.is_being_outcompeted = True
+        best_habitat_key = None
+        most_space_available = -1
+        if space_preferred is None:
+            space_preferred = preferred_territory_size_from_f1(self.network_reach.temperature_coefficients[0], self.mass, self.p, self.network_reach.food_production)
+        habitat_keys = self.network_reach.network.habitat_keys
+        for habitat_key in self.current_habitat_preferences():
+            space_available = self.network_reach.current_habitat_available[habitat_key]  # ABSENT_HABITAT_AREA if the reach doesn't have it
+            if space_available >= space_preferred:
+                self.is_being_outcompeted = False
+                self.network_reach.current_habitat_available[habitat_key] -= space_preferred
+                self.space_use_history.append((habitat_keys[habitat_key], space_preferred))
+                self.p = self.preferred_p
+                break
+            else:
+                if space_available > most_space_available:  # keep track of the habitat with the most space in case one with enough space is never found
+                    most_space_available = space_available
+                    best_habitat_key = habitat_key
+        if self.is_being_outcompeted:
+            proportion_of_preferred_territory_obtained = most_space_available / space_preferred
+            if best_habitat_key is not None:
+                self.space_use_history.append((habitat_keys[best_habitat_key], most_space_available))
+                self.network_reach.current_habitat_available[best_habitat_key] = 0
+            else:
+                self.space_use_history.append((None, most_space_available))
+            self.p = max(proportion_of_preferred_territory_obtained * self.preferred_p, self.settings.minimum_floater_p)
+
     def possible_mortality(self):
         """ Currently this uses the same size-based model for anadromous spawners as other freshwater fish,
             and only uses a different model when they're out in the ocean. """
-        if self.mass < self.settings['STARVATION_THRESHOLD'] * self.lifetime_maximum_mass:
+        if self.mass < self.settings.starvation_threshold * self.lifetime_maximum_mass:
             self.die("Starvation")
+        elif random.random() > self.survival_probability(self.model.schedule.week_of_year):
+            self.die("Survival probability model")
+
+    def survival_probability(self, week_of_year):
+        """ Weekly probability of surviving the size- and season-based mortality model at the fish's current size. """
+        if not self.network_reach.is_ocean:
+            L = self.fork_length
+            if 1 <= week_of_year <= 19:  # todo winter -- WATCH THE INDEXING WITH 0/1 START
+                return 0.00055*L + 0.921 if L <= 100 else 0.976
+            elif 20 <= week_of_year <= 32:  # summer
+                return 0.00026 * L + 0.968 if L <= 100 else 0.994
+            else:  # weeks 33-46; fall
+                return 0.00039 * L + 0.988 if L <= 100 else 0.988
         else:
-            if not self.network_reach.is_ocean:
-                L = self.fork_length
-                if self.model.schedule.week_of_year_is_within(1, 19):  # todo winter -- WATCH THE INDEXING WITH 0/1 START
-                    surv_prob = 0.00055*L + 0.921 if L <= 100 else 0.976
-                elif self.model.schedule.week_of_year_is_within(20, 32):  # summer
-                    surv_prob = 0.00026 * L + 0.968 if L <= 100 else 0.994
-                else:  # weeks 33-46; fall
-                    surv_prob = 0.00039 * L + 0.988 if L <= 100 else 0.988
-            else:
-                surv_prob = 0.9952  # used for "anadromous adults" in HexSim, fish in ocean here
-            if random.random() > surv_prob:
-                self.die("Survival probability model")
+            return 0.9952  # used for "anadromous adults" in HexSim, fish in ocean here
 
     def age_at_timestep(self, timestep):
         """ Gives the age in weeks of the fish at a given timestep of the overall model's schedule. If the fish
@@ -518,6 +733,8 @@ class Fish(Agent, FishPlotting):
     def reach_at_timestep(self, target_timestep):
         # Returns -3 (not a real reach) if the fish wasn't born yet
         # Returns death reach if the fish was dead
+        if self.history_start_age is None:  # fry without histories have only been tracked in their current reach
+            return self.network_reach.id if target_timestep >= self.birth_week else -3
         result = -3
         for eventid, life_week, reachid in self.reach_history:
             timestep = life_week + self.birth_week
@@ -526,6 +743,8 @@ class Fish(Agent, FishPlotting):
         return result
 
     def activity_at_age(self, age_weeks):
+        if self.history_start_age is None:
+            return self.activity
         previous_activity = self.activity_history[0][2]
         for event_log_index, activity_age, activity in self.activity_history:
             if activity_age >= age_weeks:
@@ -533,16 +752,25 @@ class Fish(Agent, FishPlotting):
             previous_activity = activity
         return self.activity_history[-1][2]
 
+    def history_index(self, age):
+        """ Index into the weekly histories for the given age, or None if the histories don't cover that age
+            because the fish was a fry without histories then. """
+        if self.history_start_age is None or age < self.history_start_age:
+            return None
+        return age - self.history_start_age
+
     def length_at_age(self, age):
-        return self.length_history[age]
+        index = self.history_index(age)
+        return self.length_history[index] if index is not None else None
 
     def mass_at_age(self, age):
-        return self.mass_history[age]
+        index = self.history_index(age)
+        return self.mass_history[index] if index is not None else None
 
     def mass_at_timestep(self, timestep):
         age = self.age_at_timestep(timestep)
         if age > 0:
-            return self.mass_history[age]
+            return self.mass_at_age(age)
         else:
             return None
 
@@ -552,7 +780,20 @@ class Fish(Agent, FishPlotting):
             runtime) to flag fish for deletion and remove them the fish arrays together at the end of each timestep."""
         if not self.is_dead:    # Prevents fish from dying twice in rare cases where two mechanisms kill it before it's moved to recent_dead_fish
             self.is_dead = True
+            if self.activity is Activity.SPAWNING:
+                self.network_reach.spawners.remove(self)
             self.death_week = self.model.schedule.time
             self.mortality_reason = reason
-            self.log_event("Died from {0}".format(reason))
+            if self.history_start_age is None and reason in MORTALITY_REASONS:
+                self.model.schedule.recent_dead_fry.append(self.dead_fry_row())
+                return
+            elif self.history_start_age is None:
+                self.allocate_histories()
+            self.log_event(Event.DIED, MORTALITY_REASONS.index(reason) if reason in MORTALITY_REASONS else -1)
             self.model.schedule.recent_dead_fish.append(self)
+
+    def dead_fry_row(self):
+        """ Compact record (matching DEAD_FRY_DTYPE) of a fry that died before allocating its histories. """
+        return (self.unique_id, self.is_resident, self.sex is Sex.FEMALE, self.birth_week, self.death_week,
+                self.natal_reach.id, self.network_reach.id, self.fork_length, self.mass,
+                MORTALITY_REASONS.index(self.mortality_reason))
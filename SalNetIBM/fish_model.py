@@ -1,52 +1,135 @@
+import itertools
 import random
 
-from mesa import Model
+import numpy as np
 
-from bokeh.io import export_png
+from mesa import Model
 
 import os
 
+from .checkpoint import save_checkpoint, load_checkpoint
+from .config import ModelConfig
 from .dominance_based_scheduler import DominanceBasedActivation
-from .fish import Fish, LifeHistory, Activity
-from ._FishModelPlotting import FishModelPlotting
-from ._FishModelTables import FishModelTables
-from ._FishModelVideos import FishModelVideos
-from .redd import Redd
+from .fish import Fish, LifeHistory, Activity, Sex
+from .lazy_mixins import LazyMixins
+from .shared_network import attach_network
 from .stream_network import StreamNetwork
-from .settings import time_settings, export_settings, network_settings
 
 
-class FishModel(Model, FishModelPlotting, FishModelTables, FishModelVideos):
+class FishModel(Model, LazyMixins):
     """A model with several fish."""
 
-    def __init__(self, initial_population_size):
-        self.schedule = DominanceBasedActivation(self, time_settings['WEEKS_PER_YEAR'])
-        # Load the network
-        self.network = StreamNetwork(self)
+    # plotting, table, and video methods, loaded with bokeh and moviepy on first use
+    LAZY_MIXINS = (('._FishModelPlotting', 'FishModelPlotting'),
+                   ('._FishModelTables', 'FishModelTables'),
+                   ('._FishModelVideos', 'FishModelVideos'))
+
+    def __init__(self, initial_population_size, temperature_scenario=None, shared_network_handle=None, config=None):
+        # The model's settings, by default the current values of the dictionaries in settings.py
+        self.config = ModelConfig.from_settings() if config is None else config
+        self.temperature_scenario = temperature_scenario
+        self.schedule = DominanceBasedActivation(self, self.config.time.weeks_per_year)
+        # Load the network, or attach it to one published by a SharedNetwork in another process
+        if shared_network_handle is None:
+            self.network = StreamNetwork(self, temperature_scenario)
+        else:
+            self.network = attach_network(shared_network_handle, self)
         # Create initial fish population
         self.next_fish_index = 0
         self.next_redd_index = 0
+        self.add_initial_population(initial_population_size)
+
+    def set_config(self, config):
+        """ Switches the model to another config, such as one made from its own with config.with_overrides(), including
+            the life history settings its live fish hold. Fish that are parked keep the wakeup times they were parked
+            with. """
+        self.config = config
+        schedule = self.schedule
+        live_fish = schedule.active_fish + [fish for wake_time, unique_id, fish in schedule.wakeup_queue] \
+            + [fish for members in schedule.ocean_cohorts.values() for fish in members]
+        for fish in live_fish:
+            fish.settings = config.life_history(fish.life_history)
+
+    def add_initial_population(self, initial_population_size):
+        """ Creates the initial fish population, with random life histories in random reaches. """
         for i in range(initial_population_size):
             life_history = random.choice([LifeHistory.ANADROMOUS, LifeHistory.RESIDENT])
             network_reach = self.network.random_reach(life_history is LifeHistory.ANADROMOUS)
-            self.add_fish(network_reach, life_history, None)
+            self.add_fish(network_reach, life_history)
 
-    def add_fish(self, network_reach, life_history, redd):
-        fish = Fish(self.next_fish_index, self, network_reach, life_history, redd)
+    def add_fish(self, network_reach, life_history, birth_position=None):
+        fish = Fish(self.next_fish_index, self, network_reach, life_history, birth_position)
         self.schedule.add_fish(fish)
+        network_reach.fish.append(fish)
         self.next_fish_index += 1
 
+    def add_fish_cohort(self, reach_indices, is_resident, birth_positions):
+        """ Bulk birth of a cohort of fry, given arrays of their natal reach indices (into network.reaches), whether
+            each is resident, and their positions within their reaches. The stray draws and spawning reach picks for
+            anadromous fry, sexes, and preferred_p values are drawn as arrays for the whole cohort, and the cohort
+            is added to the schedule and to its reaches' fish lists in one extend per reach rather than per fish.
+            Fry from the same redd must be consecutive. """
+        n = len(reach_indices)
+        if n == 0:
+            return
+        network = self.network
+        reaches = network.reaches
+        spawning_indices = reach_indices.copy()
+        strays = ~is_resident & ((np.random.random(n) < self.config.spawning.stray_probability)
+                                 | ~network.is_within_steelhead_extent[reach_indices])
+        n_strays = int(strays.sum())
+        if n_strays > 0:
+            steelhead_indices = network.steelhead_spawning_reach_indices
+            spawning_indices[strays] = steelhead_indices[np.random.randint(len(steelhead_indices), size=n_strays)]
+        is_female = np.random.random(n) < 0.5
+        preferred_ps = 0.45 + 0.05 * np.random.standard_normal(n)
+        life_histories = (LifeHistory.ANADROMOUS, LifeHistory.RESIDENT)
+        sexes = (Sex.MALE, Sex.FEMALE)
+        cohort = [Fish(unique_id, self, reaches[reach_index], life_histories[resident], birth_position,
+                       reaches[spawning_index], sexes[female], preferred_p)
+                  for unique_id, reach_index, resident, birth_position, spawning_index, female, preferred_p
+                  in zip(range(self.next_fish_index, self.next_fish_index + n), reach_indices.tolist(),
+                         is_resident.tolist(), birth_positions.tolist(), spawning_indices.tolist(),
+                         is_female.tolist(), preferred_ps.tolist())]
+        self.next_fish_index += n
+        self.schedule.active_fish.extend(cohort)
+        for network_reach, reach_cohort in itertools.groupby(cohort, key=lambda fish: fish.network_reach):
+            network_reach.fish.extend(reach_cohort)
+
     def add_redd(self, mother):
-        redd = Redd(self.next_redd_index, self, mother)
-        self.schedule.add_redd(redd)
+        self.schedule.add_redd(mother)
         self.next_redd_index += 1
 
     def step(self):
         """Advance the model by one step."""
         self.schedule.step()
+        interval = self.config.export.checkpoint_interval
+        if interval > 0 and self.schedule.steps % interval == 0:
+            self.save_checkpoint()
+
+    def save_checkpoint(self, path=None):
+        """ Saves the state of the model between timesteps to a file (by default config.export.checkpoint_path)
+            from which FishModel.resume() can continue the run. Only the state that changes is saved, with reaches
+            stored by ID, and the static network is reloaded from its own files and caches on resuming. """
+        if path is None:
+            path = self.config.export.checkpoint_path
+        save_checkpoint(self, path)
+        print("Saved checkpoint at timestep {0} to {1}.".format(self.schedule.steps, path))
+
+    @classmethod
+    def resume(cls, path=None):
+        """ Loads a model saved by save_checkpoint(), including the state of the random number generators, so running
+            it from there follows the same trajectory as a run that was never stopped. The path defaults to the
+            CHECKPOINT_PATH in settings.py. """
+        if path is None:
+            path = ModelConfig.from_settings().export.checkpoint_path
+        model = load_checkpoint(cls, path)
+        print("Resumed from checkpoint {0} at timestep {1}.".format(path, model.schedule.steps))
+        return model
 
     def fish_with_id(self, unique_id):
         """ Retrieves a fish by its unique_id attribute, regardless of living or dead."""
+        self.schedule.catch_up_parked_fish()
         live_fish = [fish for fish in self.schedule.fish if fish.unique_id == unique_id]
         if len(live_fish) == 1:
             return live_fish[0]
@@ -56,18 +139,21 @@ class FishModel(Model, FishModelPlotting, FishModelTables, FishModelVideos):
         raise ValueError("There are {0} live fish and {1} dead fish with unique_id {2}.".format(len(live_fish), len(dead_fish), unique_id))
 
     def random_live_fish(self):
+        self.schedule.catch_up_parked_fish()
         return random.choice(self.schedule.fish)
 
     def random_dead_fish(self):
         return random.choice(self.schedule.dead_fish)
 
     def fish_alive_at_timestep(self, timestep):
+        self.schedule.catch_up_parked_fish()
         return [fish for fish in self.schedule.fish + self.schedule.dead_fish if
                 fish.birth_week <= timestep and fish.birth_week + fish.age_weeks > timestep]
 
     def generate_report(self, movies=True, passage=True, individuals=10):
+        from bokeh.io import export_png
         print("Exporting basic plots.")
-        export_path = export_settings['RESULTS_PATH']
+        export_path = self.config.export.results_path
         if not os.path.exists(export_path):
             os.makedirs(export_path)
         export_png(self.survival_plot(), os.path.join(export_path, "Survival Curves.png"))
@@ -0,0 +1,51 @@
+import ast
+import importlib
+import importlib.util
+
+
+class LazyMixins:
+    """ Base for classes whose plotting and video methods live in mixins that import bokeh and moviepy, so the
+        simulation can be imported and run without loading them. The mixins are named in LAZY_MIXINS as (module,
+        class name) pairs, and are imported the first time an instance is asked for one of the names they define,
+        which are read from the mixin modules' source without importing them. Asking for any other missing name
+        raises AttributeError right away, so typos and hasattr() checks don't load the plotting packages. Once
+        loaded, the mixins' methods are copied onto the class, earlier mixins first and without replacing anything
+        the class already has (the same precedence as listing them as base classes), so later lookups are ordinary
+        ones. """
+
+    LAZY_MIXINS = ()
+
+    def __getattr__(self, name):
+        cls = type(self)
+        if name.startswith('__') or cls.__dict__.get('_lazy_mixins_loaded', False) or name not in lazy_mixin_names(cls):
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(cls.__name__, name))
+        load_lazy_mixins(cls)
+        return getattr(self, name)
+
+
+def lazy_mixin_names(cls):
+    """ Returns the set of names defined in the bodies of the classes in cls.LAZY_MIXINS, parsed from their source. """
+    names = cls.__dict__.get('_lazy_mixin_names')
+    if names is None:
+        names = set()
+        for module_name, class_name in cls.LAZY_MIXINS:
+            with open(importlib.util.find_spec(module_name, __package__).origin) as source_file:
+                module_tree = ast.parse(source_file.read())
+            for node in module_tree.body:
+                if isinstance(node, ast.ClassDef) and node.name == class_name:
+                    for statement in node.body:
+                        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                            names.add(statement.name)
+                        elif isinstance(statement, ast.Assign):
+                            names.update(target.id for target in statement.targets if isinstance(target, ast.Name))
+        cls._lazy_mixin_names = names
+    return names
+
+
+def load_lazy_mixins(cls):
+    for module_name, class_name in cls.LAZY_MIXINS:
+        mixin = getattr(importlib.import_module(module_name, __package__), class_name)
+        for key, value in vars(mixin).items():
+            if not key.startswith('__') and not hasattr(cls, key):
+                setattr(cls, key, value)
+    cls._lazy_mixins_loaded = True
@@ -1,15 +1,11 @@
-import math
-import sys
 import os
 import numpy as np
 import pandas as pd
-import functools
-import copy
 import pickle
-from bokeh.plotting import figure
 from .fish import LifeHistory
-from .settings import network_settings
+from .spawner_registry import SpawnerRegistry
 
+ABSENT_HABITAT_AREA = -2  # area of habitat classes a reach doesn't have, in the network's habitat area array
 
 class NetworkReach:
     """ The network is represented as a collection of reaches. """
@@ -17,6 +13,7 @@ class NetworkReach:
     def __init__(self, network, attribs, points, from_node, to_node, **kwargs):
         self.network = network
         self.id = attribs['LineOID']
+        self.index = None  # position in the network's list of reaches, set by the network after building all reaches
         self.from_node = from_node
         self.to_node = to_node
         self.points = points
@@ -41,44 +38,46 @@ class NetworkReach:
         self.is_ocean = False
         self.is_migration_reach = False
         self.fish = []
-        self.redds = []
-        self.temperatures = []
-        self.current_temperature = 0
-        self.history = []
+        self.n_redds = 0  # kept up to date by the model's ReddArrays
+        self.spawners = SpawnerRegistry()  # fish with the SPAWNING activity in this reach
+        self.current_temperature = 0     # set by the network from its temperature matrix
+        self.temperature_coefficients = None  # (f1, f2, f3, f4) of current_temperature, for the bioenergetics kernels
         self.calculate_midpoint()
         self.mean_gpp = None                # placeholder, calculated by network after building all reaches
         self.mean_gpp_percentile = None     # same
         self.food_production = None         # same. units are g dry mass produced per m2 per day
-        self.initial_habitat_available = self.predict_habitat_areas(**kwargs)
-        self.current_habitat_available = copy.copy(self.initial_habitat_available)
-
-    def set_temperatures(self, temperatures):
-        self.temperatures = temperatures
-        self.current_temperature = self.temperatures[0]
-
-    def set_mean_gpp(self):  # has to be run after set_temperatures
-        self.mean_gpp = np.array([self.gpp_at_week(week) for week in list(np.arange(1, 49))]).mean()
+        self.initial_habitat_available = self.predict_habitat_areas(**kwargs)  # replaced by its row of network.habitat_areas
+        self.current_habitat_available = None  # list of areas by habitat class index, reset from the row each timestep
+        self.first_available_habitat_key_cache = {}  # keyed by habitat temperature key
+        self.is_uncontested = False  # set each timestep by network.prepare_habitat_competition()
+        self.habitat_demand = {}
+
+    def first_available_habitat_keys(self, temperature_key):
+        """ For each modeled fork length, the index of the best-ranked habitat class at the given temperature key
+            that has any area in this reach (or None if none does). Fish take this class whenever the reach isn't
+            saturated. """
+        if temperature_key not in self.first_available_habitat_key_cache:
+            preference_indices = self.network.habitat_preference_indices[temperature_key]
+            is_available = (preference_indices >= 0) & (self.initial_habitat_available[preference_indices] > 0)
+            first_ranks = is_available.argmax(axis=1)
+            keys = [index if any_available else None for index, any_available
+                    in zip(preference_indices[np.arange(len(first_ranks)), first_ranks].tolist(), is_available.any(axis=1).tolist())]
+            self.first_available_habitat_key_cache[temperature_key] = keys
+        return self.first_available_habitat_key_cache[temperature_key]
 
     def temperature_at_week(self, week_of_simulation):
-        """ Input the week of the simulation, not week of year. Temperatures from the input file are
-            assumed to cyclically repeat. One year of temperatures is fine, but we could put in a 20+ year
-            cycle or something with temperatures rising or falling from year to year, and it should still
-            work fine. Another alternative would be to build into this a 'year' check and hard-code or build
-            some system to modify temperatures in certain years."""
-        # todo this is called so much it eats some time, mostly for current temperature; save that once in step() instead
-        if self.is_ocean or self.is_migration_reach:
-            return self.network.most_downstream_reach.temperature_at_week(week_of_simulation)
-        else:
-            return self.temperatures[week_of_simulation % len(self.temperatures)]
+        """ Input the week of the simulation, not week of year. Each simulation year uses the next year of the
+            network's temperature scenario, and the scenario's years cyclically repeat after the last one, so a
+            single year of temperatures repeats every year while a 20+ year scenario can have temperatures rising
+            or falling from year to year. The ocean and migration reaches have the temperatures of the most
+            downstream reach."""
+        return self.network.temperature_at_week(self.index, week_of_simulation)
 
-    @functools.lru_cache(maxsize=None)
     def gpp_at_week(self, week_of_simulation):
-        temperature = self.temperature_at_week(week_of_simulation)
-        # capping conductivity at 350 here because max real value was 345 in our network; had one glitch value over 100,000
-        log_gpp = -11.538 + 0.00827 * min(self.conductivity, 350) + 4.11e-6 * self.area_solar + 0.538 * temperature
-        return math.exp(log_gpp)
+        return self.network.gpp_at_week(self.index, week_of_simulation)
 
     def gpp_plot(self):
+        from bokeh.plotting import figure
         # Survival function plot (based on dead fish only)
         x = list(np.arange(1, 49))
         y = [self.gpp_at_week(week) for week in x]
@@ -111,7 +110,7 @@ class NetworkReach:
 
     def predict_habitat_areas(self, **kwargs):
         force_recalculate_microhabitat = kwargs.get('force_recalculate_microhabitat', False)
-        cache_file_path = os.path.join(network_settings['MICROHABITAT_MODEL_CACHE_PATH'], "reach_{0}.pickle".format(self.id))
+        cache_file_path = os.path.join(self.network.model.config.network.microhabitat_model_cache_path, "reach_{0}.pickle".format(self.id))
         directory = os.path.dirname(cache_file_path)
         if not os.path.exists(directory):
             os.makedirs(directory)
@@ -121,7 +120,7 @@ class NetworkReach:
         else:
             print("Predicting microhabitat proportions available for reach {0}".format(self.id))
             proportions_dict = self.predict_normalized_habitat_proportions(self.gradient, self.bank_full_width)
-            habitat_areas = {key: value * self.wetted_area * network_settings['PROPORTION_USABLE_HABITAT'] for key, value in proportions_dict.items()}
+            habitat_areas = {key: value * self.wetted_area * self.network.model.config.network.proportion_usable_habitat for key, value in proportions_dict.items()}
             with open(cache_file_path, 'wb') as file:
                 pickle.dump(habitat_areas, file)
         return habitat_areas
@@ -135,42 +134,18 @@ class NetworkReach:
         else:
             self.midpoint = self.points[int(np.floor(npoints / 2))]
 
-    def step(self, timestep):
-        # could also speed things up by flagging whether any fish died and not doing the 2 lines below if nothing died
-        self.current_temperature = self.temperature_at_week(timestep)
-        self.current_habitat_available = copy.copy(self.initial_habitat_available)
-        self.redds = [redd for redd in self.redds if not redd.is_dead]
-        self.fish = [fish for fish in self.fish if not fish.is_dead]
-        anadromous_fish_count = len([fish for fish in self.fish if fish.life_history == LifeHistory.ANADROMOUS])
-        resident_fish_count = len(self.fish) - anadromous_fish_count
-        self.history.append({'step': timestep,
-                             'anadromous': anadromous_fish_count,
-                             'resident': resident_fish_count,
-                             'n_redds': len(self.redds)
-                             })
+    def step(self, current_temperature, temperature_coefficients):
+        """ Dead fish are removed from the reach, and the reach's history recorded, by the network's census in
+            StreamNetwork.step(). """
+        self.current_temperature = current_temperature
+        self.temperature_coefficients = temperature_coefficients
+        self.current_habitat_available = self.initial_habitat_available.tolist()
 
     def reach_statistic(self, value, timestep=None):
-        """This saves some space in the history-logging dictionary for values that can be calculated from those using
-           other, static attributes of the reach. It also allows a single function call from plotting functions to
-           retrieve either a static attribute of the reach (if timestep is None) or a dynamic element of the reach's
-           history (if timestep is not None)."""
-
-        if hasattr(self, value):
-            return getattr(self, value)
-        elif timestep is not None:
-            step_history = self.history[timestep]
-            if value in step_history.keys():
-                return step_history[value]
-            elif value == 'temperature':
-                return self.temperature_at_week(timestep)
-            elif value == 'population':
-                return step_history['anadromous'] + step_history['resident']
-            elif value == 'proportion_capacity_redds':
-                return step_history['n_redds'] / self.capacity_redds
-            else:
-                sys.exit("Invalid reach history value requested.")
-        else:
-            sys.exit("Requested reach history value that isn't a reach attribute, but without a timestep.")
+        """ Retrieves either a static attribute of the reach (if timestep is None) or an element of the reach's
+            history (if timestep is not None) from the network-wide reach history. Plotting functions should use
+            network.reach_statistic() to get the values for all reaches at once instead. """
+        return self.network.reach_statistic(value, timestep)[self.index]
 
     def passage_stats(self, activity, direction, life_history='both'):  # self = a network reach
         """ How this is supposed to work:
@@ -183,6 +158,7 @@ class NetworkReach:
                   from its current position, and that its previous position either is this reach was in the path downstream
                   from this reach.
         """
+        self.network.model.schedule.catch_up_parked_fish()
         all_fish = self.network.model.schedule.fish + self.network.model.schedule.dead_fish
         downstream_reach_ids = [reach.id for reach in self.network.path_downstream_from_reach(self)]
         downstream_passage_records = []
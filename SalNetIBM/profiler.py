@@ -0,0 +1,97 @@
+import time
+import pandas as pd
+from .fish import Activity
+
+STEP_PHASES = ('wake parked fish', 'ocean cohorts', 'sort', 'habitat competition', 'fish step',
+               'redd step', 'network step', 'dead fish logging')
+# Parts of Fish.step() timed within 'fish step', summed over all the fish
+FISH_PHASES = ('dispatch', 'move', 'grow', 'mortality')
+
+
+def column_name(phase):
+    return phase.replace(' ', '_') + '_ns'
+
+
+class StepProfiler:
+    """ Times the phases of each scheduler step with time.perf_counter_ns() and counts the active fish in each
+        activity at the start of the step, keeping one row per step. The scheduler uses it for every step while
+        model.config.export.profile_steps is True; otherwise it uses NO_PROFILER, which does nothing.
+
+        The fish step is broken down further into dispatching activities, moving, growing, and mortality, which
+        Fish.step() times with start_fish_lap() and fish_lap() on its schedule's step_profiler, so only the fish of
+        the model being profiled are counted. A move made while dispatching counts toward dispatching. Dropping dead
+        and parked fish from the active list is part of the census pass, so it's timed within 'network step'. """
+
+    def __init__(self):
+        self.rows = []
+        self.row = None
+        self.lap_start = None
+        self.fish_lap_start = None
+
+    def start_step(self, schedule):
+        counts = dict.fromkeys(Activity, 0)
+        for fish in schedule.active_fish:
+            counts[fish.activity] += 1
+        self.row = {'step': schedule.steps,
+                    'active_fish': len(schedule.active_fish),
+                    'parked_fish': schedule.fish_count - len(schedule.active_fish)}
+        self.row.update({'fish_' + activity.name.lower(): count for activity, count in counts.items()})
+        self.row.update({column_name(phase): 0 for phase in STEP_PHASES})
+        self.row.update({column_name(phase): 0 for phase in FISH_PHASES})
+        self.lap_start = time.perf_counter_ns()
+
+    def lap(self, phase):
+        """ Adds the time since the last lap (or the start of the step) to the given phase. """
+        now = time.perf_counter_ns()
+        self.row[column_name(phase)] += now - self.lap_start
+        self.lap_start = now
+
+    def finish_step(self):
+        self.row['total_ns'] = sum(self.row[column_name(phase)] for phase in STEP_PHASES)
+        self.rows.append(self.row)
+        self.row = None
+
+    def start_fish_lap(self):
+        self.fish_lap_start = time.perf_counter_ns()
+
+    def fish_lap(self, phase):
+        """ Adds the time since the last fish lap (or start_fish_lap()) to the given part of the fish step. """
+        now = time.perf_counter_ns()
+        self.row[column_name(phase)] += now - self.fish_lap_start
+        self.fish_lap_start = now
+
+    def table(self):
+        """ The per-step metrics as a DataFrame, one row per profiled step. """
+        return pd.DataFrame(self.rows)
+
+    def write(self, path):
+        """ Writes the per-step metrics to a CSV file, or to a Parquet file (which needs pyarrow or fastparquet) if the
+            path ends in '.parquet'. """
+        if path.endswith('.parquet'):
+            self.table().to_parquet(path, index=False)
+        else:
+            self.table().to_csv(path, index=False)
+
+    def clear(self):
+        self.rows = []
+
+
+class _NoProfiler:
+    """ Stand-in for a StepProfiler in steps that aren't profiled, with the same methods doing nothing. """
+
+    def start_step(self, schedule):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def finish_step(self):
+        pass
+
+    def start_fish_lap(self):
+        pass
+
+    def fish_lap(self, phase):
+        pass
+
+NO_PROFILER = _NoProfiler()
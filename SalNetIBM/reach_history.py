@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class ReachHistory:
+    """ Weekly history of every reach in the network, stored as one (timestep x reach) array per statistic instead of
+        a dictionary per reach per week. Row t holds the values recorded at the end of timestep t, and columns follow
+        the order of network.reaches (reach.index), so all the values needed to color one frame of a network plot
+        come from a single row read. """
+
+    COUNT_STATISTICS = ('anadromous', 'resident', 'n_redds')
+    DERIVED_STATISTICS = ('population', 'proportion_capacity_redds')
+
+    def __init__(self, network, initial_capacity):
+        self.network = network
+        self.n_steps = 0
+        n_reaches = len(network.reaches)
+        self.arrays = {statistic: np.zeros((initial_capacity, n_reaches), dtype=np.int32)
+                       for statistic in self.COUNT_STATISTICS}
+        self.arrays['temperature'] = np.zeros((initial_capacity, n_reaches), dtype=np.float32)
+        self.attribute_values = {}  # arrays of fixed reach attributes, cached the first time they're requested
+
+    def record(self, anadromous, resident, n_redds, temperature):
+        """ Appends one timestep of values, each given as an array or list with one entry per reach. """
+        if self.n_steps == len(self.arrays['temperature']):
+            for statistic, array in self.arrays.items():
+                self.arrays[statistic] = np.concatenate((array, np.zeros_like(array)))
+        row = self.n_steps
+        self.arrays['anadromous'][row] = anadromous
+        self.arrays['resident'][row] = resident
+        self.arrays['n_redds'][row] = n_redds
+        self.arrays['temperature'][row] = temperature
+        self.n_steps += 1
+
+    def statistic(self, statistic, timestep):
+        """ Returns the array of values of a recorded or derived statistic for every reach at the given timestep. """
+        if not 0 <= timestep < self.n_steps:
+            raise ValueError("No reach history has been recorded for timestep {0}.".format(timestep))
+        if statistic in self.arrays:
+            return self.arrays[statistic][timestep]
+        elif statistic == 'population':
+            return self.arrays['anadromous'][timestep] + self.arrays['resident'][timestep]
+        elif statistic == 'proportion_capacity_redds':
+            with np.errstate(divide='ignore', invalid='ignore'):  # reaches with no spawning habitat give inf/nan
+                return self.arrays['n_redds'][timestep] / self.attribute('capacity_redds')
+        else:
+            raise ValueError("Invalid reach history value '{0}' requested.".format(statistic))
+
+    def attribute(self, attribute):
+        """ Returns an array of a fixed attribute (such as capacity_redds) of every reach. """
+        if attribute not in self.attribute_values:
+            self.attribute_values[attribute] = np.array([getattr(reach, attribute) for reach in self.network.reaches])
+        return self.attribute_values[attribute]
+
+    def values(self, value, timestep=None):
+        """ Retrieves either the history of a statistic at a timestep (if timestep is not None and the statistic is
+            recorded or derived from recorded ones) or a fixed attribute of every reach. """
+        if timestep is not None and (value in self.arrays or value in self.DERIVED_STATISTICS):
+            return self.statistic(value, timestep)
+        elif hasattr(self.network.reaches[0], value):
+            return self.attribute(value)
+        elif timestep is not None:
+            raise ValueError("Invalid reach history value '{0}' requested.".format(value))
+        else:
+            raise ValueError("Requested reach value '{0}' that isn't a reach attribute, but without a timestep.".format(value))
@@ -1,54 +1,101 @@
-import random
-from mesa import Agent
+import numpy as np
 from .fish import LifeHistory
-from .settings import time_settings, spawning_settings
-
-class Redd(Agent):
-    """ A redd that will disappear and be replaced by fish at the appropriate time."""
-    def __init__(self, unique_id, model, mother):
-        super().__init__(unique_id, model)
-        self.accrued_degree_days = 0
-        self.deposited_time = model.schedule.time
-        self.mother = mother
-        self.network_reach = mother.network_reach
-        self.position_within_reach = self.mother.position_within_reach
-        self.mortality_reason = None
-        self.is_dead = False  # flag used to mark fish when they die, for more efficient mass deletion once per timestep
-        self.network_reach.redds.append(self)
-
-    def step(self):
-        self.accrue_degree_days()
-        if self.accrued_degree_days > spawning_settings['REQUIRED_DEGREE_DAYS_TO_EMERGE']:
-            self.replace_with_fry()
-        elif 0.07 * random.normalvariate(0, 1) * self.network_reach.spring95 > 1:
-            self.die("Scoured.")
-
-    def accrue_degree_days(self):
-        """ Need to figure out why Chris used the fancier formula  """
-        T = self.network_reach.temperature_at_week(self.model.schedule.time)
-        self.accrued_degree_days += time_settings['DAYS_PER_WEEK'] * T
+
+class ReddArrays:
+    """ All the redds in the model, held as parallel arrays instead of one agent per redd. Each redd is a row with its
+        reach index (into network.reaches), deposit week, accrued degree days, mother's fork length and life history
+        (0 for anadromous, 1 for resident, matching the census codes), and position within the reach. Rows are
+        compacted each week after emerged and scoured redds are removed, so row order is deposit order. """
+
+    FIELDS = (('reach_index', np.int64),
+              ('deposited_time', np.int64),
+              ('accrued_degree_days', np.float64),
+              ('mother_fork_length', np.float64),
+              ('mother_life_history', np.int64),
+              ('position_within_reach', np.float64))
+
+    def __init__(self, model, initial_capacity=1024):
+        self.model = model
+        self.n = 0
+        for field, dtype in self.FIELDS:
+            setattr(self, field, np.zeros(initial_capacity, dtype=dtype))
+        self.total_emerged = 0
+        self.total_scoured = 0
+
+    def __len__(self):
+        return self.n
+
+    def add(self, mother):
+        """ Adds a redd built by the given female in her current reach and position. """
+        if self.n == len(self.reach_index):
+            for field, dtype in self.FIELDS:
+                array = getattr(self, field)
+                setattr(self, field, np.concatenate((array, np.zeros_like(array))))
+        row = self.n
+        self.reach_index[row] = mother.network_reach.index
+        self.deposited_time[row] = self.model.schedule.time
+        self.accrued_degree_days[row] = 0
+        self.mother_fork_length[row] = mother.fork_length
+        self.mother_life_history[row] = mother.life_history is LifeHistory.RESIDENT
+        self.position_within_reach[row] = mother.position_within_reach
+        self.n += 1
+        mother.network_reach.n_redds += 1
+
+    def accrue_degree_days_and_scour(self, time):
+        """ Weekly kernel for all redds at once. Adds a week of degree days at each redd's reach temperature, then
+            scours redds that haven't accrued enough to emerge with probability based on their reach's spring95
+            flow. Returns the row indices of redds ready to emerge and of redds scoured. """
+        n = self.n
+        reach_index = self.reach_index[:n]
+        network = self.model.network
+        self.accrued_degree_days[:n] += self.model.config.time.days_per_week * network.temperatures_at_week(time)[reach_index]
         # if T < 2:
         #     self.accrued_degree_days += time_settings['DAYS_PER_WEEK'] * T + 0.96
         # elif T > 14:
         #     self.accrued_degree_days += time_settings['DAYS_PER_WEEK'] * T + 1.45
         # else:
         #     self.accrued_degree_days += -0.26*T + 0.16 * T**2 + 0.0055 * T**3 + 2.91
+        ready_to_emerge = self.accrued_degree_days[:n] > self.model.config.spawning.required_degree_days_to_emerge
+        scoured = ~ready_to_emerge & (0.07 * np.random.standard_normal(n) * network.spring95s[reach_index] > 1)
+        return np.flatnonzero(ready_to_emerge), np.flatnonzero(scoured)
 
-    def replace_with_fry(self):
-        fecundity_mean = 0.15 * 0.0002 * self.mother.fork_length ** 2.5989
+    def step(self, time):
+        """ Advances every redd by a week, replaces the emerged ones with fry, and drops the emerged and scoured
+            ones from the arrays and from their reaches' redd counts. """
+        emerged, scoured = self.accrue_degree_days_and_scour(time)
+        if len(emerged) == 0 and len(scoured) == 0:
+            return
+        self.replace_with_fry(emerged)
+        self.total_emerged += len(emerged)
+        self.total_scoured += len(scoured)
+        keep = np.ones(self.n, dtype=bool)
+        keep[emerged] = False
+        keep[scoured] = False
+        reaches = self.model.network.reaches
+        removed_counts = np.bincount(self.reach_index[:self.n][~keep], minlength=len(reaches))
+        for reach_index in np.flatnonzero(removed_counts).tolist():
+            reaches[reach_index].n_redds -= removed_counts.item(reach_index)
+        n_kept = int(keep.sum())
+        for field, dtype in self.FIELDS:
+            array = getattr(self, field)
+            array[:n_kept] = array[:self.n][keep]
+        self.n = n_kept
+
+    def replace_with_fry(self, rows):
+        """ Emerges fry from the given redd rows as one cohort. Fecundity is drawn per redd, and the number of fry
+            inheriting their mother's life history with one binomial draw per redd; the rest get the other one. """
+        if len(rows) == 0:
+            return
+        fecundity_mean = 0.15 * 0.0002 * self.mother_fork_length[rows] ** 2.5989
         fecundity_variance = 10
-        num_fry = round(random.normalvariate(fecundity_mean, fecundity_variance))
-        for i in range(num_fry):
-            if random.random() < spawning_settings['LIFE_HISTORY_INHERITANCE_PROBABILITY']:
-                life_history = self.mother.life_history
-            else:
-                if self.mother.life_history == LifeHistory.RESIDENT:
-                    life_history = LifeHistory.ANADROMOUS
-                else:
-                    life_history = LifeHistory.RESIDENT
-            self.model.add_fish(self.network_reach, life_history, self)
-        self.die("Fry emerged")
-
-    def die(self, reason):
-        self.mortality_reason = reason
-        self.is_dead = True
\ No newline at end of file
+        num_fry = np.maximum(np.round(np.random.normal(fecundity_mean, fecundity_variance)), 0).astype(np.int64)
+        num_inheriting = np.random.binomial(num_fry, self.model.config.spawning.life_history_inheritance_probability)
+        fry_rows = np.repeat(rows, num_fry)
+        first_fry_of_redd = np.repeat(np.cumsum(num_fry) - num_fry, num_fry)
+        inherits = np.arange(len(fry_rows)) - first_fry_of_redd < np.repeat(num_inheriting, num_fry)
+        mother_is_resident = self.mother_life_history[fry_rows] == 1
+        self.model.add_fish_cohort(self.reach_index[fry_rows], mother_is_resident == inherits, self.position_within_reach[fry_rows])
+
+    def life_history_codes(self):
+        """ Returns 2 * reach index + mother's life history code for every redd, for the network census. """
+        return 2 * self.reach_index[:self.n] + self.mother_life_history[:self.n]
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import random
+import shutil
+import numpy as np
+from .fish_model import FishModel
+
+# The spun-up model and branch options, set in the parent just before the worker pool forks so every worker inherits
+# them copy-on-write, or set by start_spawned_worker() on platforms that can't fork.
+_spin_up = {}
+
+
+def spin_up(initial_population_size, steps, temperature_scenario=None, checkpoint_path=None, config=None):
+    """ Burns in a population from scratch for the given number of timesteps, optionally saving a checkpoint of it, and
+        returns the model, from which run_branches() can start any number of scenarios. """
+    model = FishModel(initial_population_size, temperature_scenario, config=config)
+    for i in range(steps):
+        model.step()
+    if checkpoint_path is not None:
+        model.save_checkpoint(checkpoint_path)
+    return model
+
+
+def branch_summary(model):
+    """ Default result of a branch: the network-wide weekly history, the final fish and redd counts, and the habitat
+        competition statistics. """
+    return {'history': model.network.history,
+            'fish_count': model.schedule.fish_count,
+            'redd_count': model.schedule.redd_count,
+            'habitat_competition_stats': model.network.habitat_competition_stats}
+
+
+def run_branches(model, branches, steps, summarize=branch_summary, processes=None, checkpoint_path=None):
+    """ Runs several scenarios onward from the same spun-up state, each in its own process, and returns a dictionary
+        of summarize(model) for each branch at the end of its run. The model can be a FishModel or the path of a
+        checkpoint saved from one.
+
+        Branches are given as a dictionary of options keyed by branch name. Options are 'temperature_scenario' (the
+        name of one of config.temperature_scenarios or a list of yearly files), 'settings' (a dictionary of config
+        overrides as taken by ModelConfig.with_overrides(), like {'spawning_settings.STRAY_PROBABILITY': 0.1}), and 'seed' for
+        the random number generators. Without a seed, every branch continues from the spin-up's generator state, so
+        differences between branches come from the scenarios rather than from the draws.
+
+        Where processes can be forked, each branch runs in a fresh fork of this process, sharing the spun-up model
+        and the network copy-on-write. Elsewhere the model is checkpointed and each worker resumes from the checkpoint.
+        Each branch writes its dead fish logs and checkpoints to its own copies of those folders. The summarize
+        function must be picklable (defined at module level) unless processes are forked. """
+    if isinstance(model, str):
+        model = FishModel.resume(model)
+    if processes is None:
+        processes = min(len(branches), os.cpu_count())
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        _spin_up.update(model=model, summarize=summarize, random_state=random.getstate(),
+                        numpy_random_state=np.random.get_state())
+        initializer, initargs = None, ()
+    else:
+        if checkpoint_path is None:
+            checkpoint_path = model.config.export.checkpoint_path
+        model.save_checkpoint(checkpoint_path)
+        context = multiprocessing.get_context('spawn')
+        initializer, initargs = start_spawned_worker, (checkpoint_path, summarize)
+    tasks = [(name, branch, steps) for name, branch in branches.items()]
+    try:
+        # one branch per worker, so each branch starts from an untouched fork (or resume) of the spin-up
+        with context.Pool(processes, initializer, initargs, maxtasksperchild=1) as pool:
+            results = pool.map(run_branch, tasks, chunksize=1)
+    finally:
+        _spin_up.clear()
+    return dict(zip(branches.keys(), results))
+
+
+def start_spawned_worker(checkpoint_path, summarize):
+    _spin_up.update(checkpoint_path=checkpoint_path, summarize=summarize)
+
+
+def run_branch(task):
+    name, branch, steps = task
+    if 'model' in _spin_up:
+        model = _spin_up['model']
+        random.setstate(_spin_up['random_state'])  # the random module reseeds itself in forked processes
+        np.random.set_state(_spin_up['numpy_random_state'])
+    else:
+        model = FishModel.resume(_spin_up['checkpoint_path'])
+    apply_branch(model, name, branch)
+    print("Running branch '{0}' for {1} timesteps from timestep {2}.".format(name, steps, model.schedule.steps))
+    for i in range(steps):
+        model.step()
+    return _spin_up['summarize'](model)
+
+
+def apply_branch(model, name, branch):
+    """ Switches a spun-up model over to a branch's scenario within the worker running it. """
+    unknown_options = set(branch.keys()) - {'temperature_scenario', 'settings', 'seed'}
+    if len(unknown_options) > 0:
+        raise ValueError("Unknown option(s) {0} for branch '{1}'.".format(", ".join(sorted(unknown_options)), name))
+    spin_up_cache_path = model.config.export.dead_fish_cache_path
+    branch_cache_path = "{0}_{1}".format(spin_up_cache_path, name)
+    if os.path.exists(branch_cache_path):
+        shutil.rmtree(branch_cache_path)
+    if os.path.exists(spin_up_cache_path):
+        shutil.copytree(spin_up_cache_path, branch_cache_path)
+    checkpoint_root, checkpoint_extension = os.path.splitext(model.config.export.checkpoint_path)
+    overrides = dict(branch.get('settings', {}))
+    overrides.update({'export_settings.DEAD_FISH_CACHE_PATH': branch_cache_path,
+                      'export_settings.CHECKPOINT_PATH': "{0}_{1}{2}".format(checkpoint_root, name, checkpoint_extension)})
+    model.set_config(model.config.with_overrides(overrides))
+    if 'temperature_scenario' in branch:
+        model.temperature_scenario = branch['temperature_scenario']
+        model.network.load_temperature_source(branch['temperature_scenario'])
+        if model.schedule.steps > 0:
+            model.network.set_reach_temperatures(model.schedule.steps - 1)
+    if branch.get('seed') is not None:
+        random.seed(branch['seed'])
+        np.random.seed(branch['seed'])
@@ -4,12 +4,17 @@ BASE_DIRECTORY = os.path.join(os.path.expanduser("~"), 'Dropbox', 'SFR')
 
 export_settings = dict(
     RESULTS_PATH=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBMResults'),
-    DEAD_FISH_CACHE_PATH=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBMResults', 'DeadFishCache')
+    DEAD_FISH_CACHE_PATH=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBMResults', 'DeadFishCache'),
+    CHECKPOINT_PATH=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBMResults', 'Checkpoint.pickle'),
+    CHECKPOINT_INTERVAL=0,  # timesteps between automatic checkpoints written by FishModel.step(); 0 for none
+    PROFILE_STEPS=False     # time the phases of every step into model.schedule.profiler (see profiler.StepProfiler)
 )
 
 time_settings = dict(
     DAYS_PER_WEEK=8,
-    WEEKS_PER_YEAR=46
+    WEEKS_PER_YEAR=46,
+    EVENT_DRIVEN_WAKEUPS=True,  # park fish in the ocean or migrating down the migration reach until their next decision
+    OCEAN_COHORTS=False         # with EVENT_DRIVEN_WAKEUPS, also group ocean fish with no decision pending into cohorts by entry week
 )
 
 network_settings = dict(
@@ -26,16 +31,25 @@ network_settings = dict(
     MICROHABITAT_PREFERENCE_CACHE_PATH=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBM', 'resources', 'nrei_batch_results'),
     SHAPEFILE=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBM', 'Network', 'G_SalmonNetwork_R1_TextFields_20171206.shp'),
     NODE_RELATIONSHIP_FILE=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBM', 'Network', 'Salmon_noderelationship_20171003.dbf'),
-    #TEMPERATURE_FILE=os.path.join(BASE_DIRECTORY, 'UpperSalmon', 'HexSim', 'RipVeg', '2013', 'Mean', 'USal_2013_8D_pot_Mn.shp'),  # restoration 2013 temps
-    TEMPERATURE_FILE=os.path.join(BASE_DIRECTORY, 'UpperSalmon', 'HexSim', 'RipVeg', '2013', 'Mean', 'USal_2013_8D_curr_Mn.shp'),  # regular 2013 temps
-    NREI_BATCH_FOLDER=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBM', 'resources', 'nrei_batch_results')
+    TEMPERATURE_SCENARIO='current_2013',  # default key in temperature_scenarios, overridden by FishModel(temperature_scenario=...)
+    TEMPERATURE_CACHE_PATH=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBM', 'Network', 'Temperature_Cache'),
+    NREI_BATCH_FOLDER=os.path.join(BASE_DIRECTORY, 'Projects', 'SalmonidNetworkIBM', 'resources', 'nrei_batch_results'),
+    PLOT_SIMPLIFICATION_TOLERANCE=250  # meters; vertices closer than this to a straight line are dropped from thumbnail plots
+)
+
+# Each temperature scenario is a list of yearly temperature files (shapefiles with 'TMn' fields, or CSVs with a LineOID
+# column followed by weekly columns), used in order for successive simulation years and repeated after the last one.
+temperature_scenarios = dict(
+    current_2013=[os.path.join(BASE_DIRECTORY, 'UpperSalmon', 'HexSim', 'RipVeg', '2013', 'Mean', 'USal_2013_8D_curr_Mn.shp')],     # regular 2013 temps
+    restoration_2013=[os.path.join(BASE_DIRECTORY, 'UpperSalmon', 'HexSim', 'RipVeg', '2013', 'Mean', 'USal_2013_8D_pot_Mn.shp')],  # restoration 2013 temps
 )
 
 spawning_settings = dict(
     REQUIRED_DEGREE_DAYS_TO_EMERGE=340,
     LIFE_HISTORY_INHERITANCE_PROBABILITY=0.75,
     MAX_WEEKS_TO_WAIT_WITHOUT_MATE=6,  # how long a fish will remain a spawner before giving up on finding a mate
-    STRAY_PROBABILITY=0.02  # arbitrary guess
+    STRAY_PROBABILITY=0.02,  # arbitrary guess
+    FRY_HISTORY_AGE=8  # weeks; fry keep no histories until this age, and those dying younger are kept as compact rows
 )
 
 resident_fish_settings = dict(
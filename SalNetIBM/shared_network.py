@@ -0,0 +1,189 @@
+import io
+import pickle
+import numpy as np
+from multiprocessing import shared_memory
+from .bioenergetics import temperature_coefficients
+from .network_reach import NetworkReach
+from .reach_history import ReachHistory
+from .spawner_registry import SpawnerRegistry
+from .stream_network import StreamNetwork
+
+ALIGNMENT = 64  # byte alignment of each array within the shared block
+# Reach attributes left out of the shared block: dynamic state, and habitat areas that are views of the shared array
+UNSHARED_REACH_ATTRIBUTES = ('fish', 'n_redds', 'spawners', 'initial_habitat_available', 'current_habitat_available',
+                             'first_available_habitat_key_cache', 'habitat_demand', 'is_uncontested', 'current_temperature',
+                             'temperature_coefficients')
+
+
+class SharedTemperatureSource:
+    """ Stands in for a TemperatureSource in networks attached to a SharedNetwork, with the same attributes and
+        methods the network uses, reading from the shared (year x reach x week) temperature array. Its columns are
+        the network's reaches, in order. """
+
+    def __init__(self, name, temperatures):
+        self.name = name
+        self.n_years, n_reaches, self.weeks_per_year = temperatures.shape
+        self.temperatures = temperatures.transpose(0, 2, 1)  # (year x week x reach), like TemperatureSource
+
+    def year_slab(self, year):
+        return np.array(self.temperatures[year % self.n_years])
+
+    def week_values(self, year, week_of_year):
+        return np.array(self.temperatures[year % self.n_years, week_of_year % self.weeks_per_year])
+
+
+class NetworkSkeletonPickler(pickle.Pickler):
+    """ Pickles a network's reaches and Python-object tables (topology, reach attributes, habitat class labels),
+        writing the network itself and its published arrays as references and leaving out the reaches' dynamic state,
+        such as their fish, and their views of the habitat area array. """
+
+    def __init__(self, file, network, array_names):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.network = network
+        self.array_names = array_names  # names of published arrays keyed by id() of the objects they replace
+
+    def persistent_id(self, obj):
+        if obj is self.network:
+            return 'network', None
+        name = self.array_names.get(id(obj))
+        if name is not None:
+            return 'array', name
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, NetworkReach):
+            state = {key: value for key, value in vars(obj).items() if key not in UNSHARED_REACH_ATTRIBUTES}
+            return NetworkReach.__new__, (NetworkReach,), state
+        return NotImplemented
+
+
+class NetworkSkeletonUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, network, arrays):
+        super().__init__(file)
+        self.network = network
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind == 'network':
+            return self.network
+        return self.arrays[name]
+
+
+class SharedNetwork:
+    """ Publishes the static data of a loaded network once in a block of shared memory, from which any number of
+        worker processes can attach a network with attach_network(handle, model) without loading shapefiles, fitting the
+        habitat regressions, or reading temperature files.
+
+        The bulky numeric data is placed in the block as arrays that attached networks use in place, without copying:
+        the temperatures of every year of the scenario along with their GPP and bioenergetic temperature coefficients
+        (so workers never compute them either), each reach's geometry, the network's arrays of reach attributes, the
+        (reach x habitat class) habitat areas, and the habitat preference library's tables of class indices and NREIs.
+        The rest (reach topology and attributes, and the habitat class labels) is pickled into the same block and
+        unpickled by each attaching worker. The habitat regressions aren't shared at all, because habitat areas are
+        only predicted while the network is first built.
+
+        The publishing process must keep the SharedNetwork open until the workers are done with it, then call
+        close(), or use it as a context manager. Workers should be started by the publishing process (as in a
+        multiprocessing pool), so they share its resource tracker and leave unlinking the block to it. """
+
+    def __init__(self, network):
+        temperature_years = [network.temperature_source.year_slab(year)[:, network.temperature_columns].T
+                             for year in range(network.temperature_source.n_years)]
+        temperatures = np.stack(temperature_years)
+        arrays = {
+            'temperatures': temperatures,
+            'gpps': np.exp(network.gpp_log_intercepts[None, :, None] + 0.538 * temperatures),
+            'temperature_coefficients': np.stack([temperature_coefficients(year_temperatures) for year_temperatures in temperature_years]),
+            'point_offsets': np.cumsum([0] + [len(reach.points) for reach in network.reaches]),
+            'points': np.concatenate([np.array(reach.points, dtype=np.float64).reshape(-1, 2) for reach in network.reaches])
+        }
+        array_names = {}
+        for name in ('spring95s', 'is_within_steelhead_extent', 'steelhead_spawning_reach_indices', 'gpp_log_intercepts',
+                     'habitat_preference_fork_lengths', 'habitat_areas', 'habitat_preference_indices',
+                     'habitat_preference_nreis', 'habitat_preference_counts'):
+            arrays[name] = getattr(network, name)
+            array_names[id(arrays[name])] = name
+        for index, reach in enumerate(network.reaches):
+            array_names[id(reach.points)] = 'reach_points_{0}'.format(index)
+        buffer = io.BytesIO()
+        NetworkSkeletonPickler(buffer, network, array_names).dump((network_skeleton(network), network.reaches))
+        arrays['skeleton'] = np.frombuffer(buffer.getvalue(), dtype=np.uint8)
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            layout[name] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            shared_array(self.shared_memory, layout[name])[...] = array
+        self.handle = (self.shared_memory.name, layout, network.temperature_source.name)
+        self.size = size
+
+    def close(self):
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def network_skeleton(network):
+    """ The attributes of a network that are pickled into the shared block, leaving out the model, dynamic state,
+        habitat regressions, and anything published as an array or rebuilt on attaching. """
+    omitted = {'model', 'reaches', 'history', 'reach_history', 'plot_geometries', 'habitat_competition_stats',
+               'mouth_passages', 'velocity_depth_regression_data', 'zmodels', 'bmodels', 'zfits', 'bfits',
+               'temperature_source', 'temperature_columns', 'temperature_matrix', 'gpp_matrix',
+               'temperature_coefficient_matrix', 'temperature_year', 'shared_temperature_years', 'shared_memory'}
+    return {key: value for key, value in vars(network).items() if key not in omitted}
+
+
+def shared_array(block, layout_entry):
+    offset, shape, dtype = layout_entry
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+
+
+def attach_network(handle, model):
+    """ Builds a StreamNetwork for the given model from a SharedNetwork's handle, with its static arrays backed by
+        the shared block. The attached network is otherwise just like one built from files, with no fish, redds, or
+        history, and the first year of its temperature scenario loaded. """
+    block_name, layout, temperature_source_name = handle
+    block = shared_memory.SharedMemory(name=block_name)
+    arrays = {name: shared_array(block, entry) for name, entry in layout.items()}
+    for array in arrays.values():
+        array.flags.writeable = False
+    offsets = arrays['point_offsets'].tolist()
+    for index in range(len(offsets) - 1):
+        arrays['reach_points_{0}'.format(index)] = arrays['points'][offsets[index]:offsets[index + 1]]
+    network = StreamNetwork.__new__(StreamNetwork)
+    skeleton, reaches = NetworkSkeletonUnpickler(io.BytesIO(arrays['skeleton'].tobytes()), network, arrays).load()
+    vars(network).update(skeleton)
+    network.shared_memory = block  # keeps the block mapped for as long as the network uses it
+    network.model = model
+    network.reaches = reaches
+    network.history = []
+    network.plot_geometries = {}
+    network.habitat_competition_stats = dict.fromkeys(StreamNetwork.HABITAT_COMPETITION_STATISTICS, 0)
+    network.mouth_passages = {'downstream': 0, 'upstream': 0}
+    network.reach_history = ReachHistory(network, model.config.time.weeks_per_year)
+    network.zmodels, network.bmodels, network.zfits, network.bfits = {}, {}, {}, {}
+    network.velocity_depth_regression_data = {}
+    network.temperature_source = SharedTemperatureSource(temperature_source_name, arrays['temperatures'])
+    network.temperature_columns = np.arange(len(reaches))
+    network.temperature_cycle_length = network.temperature_source.weeks_per_year
+    network.check_temperature_cycle_length()
+    network.shared_temperature_years = (arrays['temperatures'], arrays['gpps'], arrays['temperature_coefficients'])
+    for reach in reaches:
+        reach.fish = []
+        reach.n_redds = 0
+        reach.spawners = SpawnerRegistry()
+        reach.habitat_demand = {}
+        reach.is_uncontested = False
+    network.set_habitat_areas(network.habitat_areas)
+    network.temperature_year = None
+    network.set_reach_temperatures(0)
+    return network
@@ -0,0 +1,50 @@
+import random
+from .fish import Sex, LifeHistory
+
+
+class SpawnerRegistry:
+    """ The fish in one reach whose activity is SPAWNING, split by sex and life history, so females can find a mate
+        and stray males can check for spawning females without scanning every fish in the reach. Fish are added and
+        removed by Fish.set_activity(), Fish.die(), and Fish.move(). Each list is unordered; a removed fish is
+        replaced by the last one in its list, and a dictionary of positions makes adding and removing O(1). """
+
+    def __init__(self):
+        self.members = {(sex, life_history): [] for sex in Sex for life_history in LifeHistory}
+        self.positions = {}
+
+    def add(self, fish):
+        if fish in self.positions:
+            return
+        members = self.members[(fish.sex, fish.life_history)]
+        self.positions[fish] = len(members)
+        members.append(fish)
+
+    def remove(self, fish):
+        index = self.positions.pop(fish, None)
+        if index is None:
+            return
+        members = self.members[(fish.sex, fish.life_history)]
+        last_fish = members.pop()
+        if last_fish is not fish:
+            members[index] = last_fish
+            self.positions[last_fish] = index
+
+    def random_mate(self, female):
+        """ Picks a random spawning male, preferring one with the female's life history, or returns None if there
+            aren't any. Males that spawn leave the registry when post_spawn() changes their activity, so every male
+            in it is still available this year. """
+        same_life_history_males = self.members[(Sex.MALE, female.life_history)]
+        if len(same_life_history_males) > 0:
+            return random.choice(same_life_history_males)
+        other_life_history = LifeHistory.RESIDENT if female.life_history is LifeHistory.ANADROMOUS else LifeHistory.ANADROMOUS
+        other_males = self.members[(Sex.MALE, other_life_history)]
+        if len(other_males) > 0:
+            return random.choice(other_males)
+        return None
+
+    @property
+    def has_spawning_females(self):
+        return len(self.members[(Sex.FEMALE, LifeHistory.ANADROMOUS)]) + len(self.members[(Sex.FEMALE, LifeHistory.RESIDENT)]) > 0
+
+    def __len__(self):
+        return len(self.positions)
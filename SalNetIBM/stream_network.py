@@ -1,3 +1,4 @@
+import bisect
 import math
 import pickle
 import random
@@ -10,22 +11,27 @@ import csv
 import os
 import sys
 import datetime
-from bokeh.models import LinearColorMapper, LogColorMapper, ColorBar, HoverTool, Label, Span, Axis, NumeralTickFormatter
-from bokeh.layouts import column, row
-from bokeh.models.sources import ColumnDataSource
-from bokeh.plotting import figure
+import hashlib
 from .fish import Movement, LifeHistory
-from .settings import network_settings, time_settings
-from .network_reach import NetworkReach
+from .bioenergetics import preferred_territory_size_from_f1, temperature_coefficients
+from .network_reach import NetworkReach, ABSENT_HABITAT_AREA
+from .reach_history import ReachHistory
+from .temperature_source import TemperatureSource
 from .betareg import Beta
 
 class StreamNetwork:
     """ The network is represented as a collection of reaches. """
 
-    def __init__(self, model):
+    HABITAT_COMPETITION_STATISTICS = ('uncontested reach-weeks', 'contested reach-weeks', 'fallbacks', 'fast path fish',
+                                      'full allocation fish')
+
+    def __init__(self, model, temperature_scenario=None):
         self.model = model
         self.reaches = []
         self.history = []
+        self.plot_geometries = {}  # static plotting geometry, built on first use by plot_geometry()
+        self.habitat_competition_stats = dict.fromkeys(self.HABITAT_COMPETITION_STATISTICS, 0)
+        self.mouth_passages = {'downstream': 0, 'upstream': 0}  # fish leaving/entering the network this timestep
         # Initialize the habitat availability model
         self.velocity_depth_regression_data = pickle.load(
             open("/Users/Jason/Dropbox/SFR/Projects/2018-02 NetworkHabitat/velocity_depth_regression_data.pickle",
@@ -37,11 +43,11 @@ class StreamNetwork:
         self.load_depth_velocity_regressions()
         print("Loading network shapefile.")
         # Create the shapefile reader and load the names of its fields
-        sf = shapefile.Reader(network_settings['SHAPEFILE'])
+        sf = shapefile.Reader(self.model.config.network.shapefile)
         attrib_keys = [field[0] for field in sf.fields][1:]
         # Build a dictionary of from_node and to_node data, keyed by reach id
-        dummy_shp = open(network_settings['SHAPEFILE'], "rb")  # not used here, just has to be a shapefile
-        relationship_dbf = open(network_settings['NODE_RELATIONSHIP_FILE'], "rb")
+        dummy_shp = open(self.model.config.network.shapefile, "rb")  # not used here, just has to be a shapefile
+        relationship_dbf = open(self.model.config.network.node_relationship_file, "rb")
         relationship_reader = shapefile.Reader(shp=dummy_shp, dbf=relationship_dbf)
         relationships = {}
         for r in relationship_reader.iterRecords():  # records are [reach_id, from_node, to_node]
@@ -51,12 +57,12 @@ class StreamNetwork:
         for sr in sf.iterShapeRecords():
             attrib_values = sr.record
             attribs = dict(zip(attrib_keys, attrib_values))
-            if network_settings['SMALL_NETWORK_TEST'] is False or attribs['small_test'] > 0:
+            if self.model.config.network.small_network_test is False or attribs['small_test'] > 0:
                 points = sr.shape.points
                 from_node, to_node = relationships[attribs['LineOID']]
                 new_reach = NetworkReach(self, attribs, points, from_node, to_node)
                 self.reaches.append(new_reach)
-                if attribs['LineOID'] == network_settings['MOST_DOWNSTREAM_REACH']:
+                if attribs['LineOID'] == self.model.config.network.most_downstream_reach:
                     self.most_downstream_reach = new_reach
                     most_downstream_reach_attribs = attribs
         if not hasattr(self, 'most_downstream_reach'):
@@ -77,7 +83,7 @@ class StreamNetwork:
         self.migration_reach = NetworkReach(self, most_downstream_reach_attribs, points, None, None)
         self.most_downstream_reach.downstream_reach = self.migration_reach
         self.migration_reach.upstream_reaches.append(self.most_downstream_reach)
-        self.migration_reach.length = network_settings['NETWORK_TO_OCEAN_DISTANCE']
+        self.migration_reach.length = self.model.config.network.network_to_ocean_distance
         self.migration_reach.length_m = self.migration_reach.length * 1000
         self.migration_reach.is_migration_reach = True
         self.migration_reach.id = -2
@@ -88,60 +94,188 @@ class StreamNetwork:
         self.ocean_reach = NetworkReach(self, most_downstream_reach_attribs, points, None, None)
         self.migration_reach.downstream_reach = self.ocean_reach
         self.ocean_reach.upstream_reaches.append(self.migration_reach)
-        self.ocean_reach.length = network_settings['OCEAN_REACH_LENGTH']
+        self.ocean_reach.length = self.model.config.network.ocean_reach_length
         self.ocean_reach.length_m = self.ocean_reach.length * 1000
         self.ocean_reach.is_ocean = True
         self.ocean_reach.id = -1
         self.ocean_reach.points = [(-1415000, 759943), (-1400000, 759943)]
         self.ocean_reach.calculate_midpoint()
         self.reaches.append(self.ocean_reach)
+        # Give each reach its position in self.reaches, for indexing into network-wide arrays
+        for index, reach in enumerate(self.reaches):
+            reach.index = index
+        self.spring95s = np.array([reach.spring95 for reach in self.reaches])  # used to scour redds each week
+        self.is_within_steelhead_extent = np.array([reach.is_within_steelhead_extent for reach in self.reaches])
+        self.steelhead_spawning_reach_indices = np.array([reach.index for reach in self.reaches if reach.is_within_steelhead_extent
+                                                          and not reach.is_ocean and not reach.is_migration_reach])  # same choices as random_reach(True)
         # Create a dictionary of reach IDs for faster lookups
         self.reach_id_dict = {reach.id: reach for reach in self.reaches}
         # Load temperature data for the network reaches
         print("Loading temperature data for the network.")
-        # reach_temperatures = {}
-        # with open(network_settings['TEMPERATURE_FILE'], newline='') as temperature_file:
-        #     reader = csv.DictReader(temperature_file)
-        #     for row in reader:
-        #         temperature_strings = list(row.values())[1:]
-        #         reach_temperatures[int(row['LineOID'])] = [float(temperature) for temperature in temperature_strings]
-        # for reach in self.reaches:
-        #     reach.set_temperatures(reach_temperatures[reach.id])
-
-        tf = shapefile.Reader(network_settings['TEMPERATURE_FILE'])
-        tfields = [field[0] for field in tf.fields if 'TMn' in field[0]]
-        attrib_keys = [field[0] for field in tf.fields][1:]
-        for attrib_values in tf.iterRecords():
-            attribs = dict(zip(attrib_keys, attrib_values))
-            reach = self.reach_with_id(int(attribs['LineOID']), True)
-            if reach is not None:
-                reach.set_temperatures([attribs[field] for field in tfields])
+        self.load_temperature_source(temperature_scenario)
         # Calculate predicted mean annual GPP (as actual value and percentile) for each reach
         print("Calculating GPP percentiles.")
-        for reach in self.reaches:
-            reach.set_mean_gpp()
-        all_gpps = np.array([reach.mean_gpp for reach in self.reaches])
+        all_gpps = self.gpp_matrix[:, np.arange(1, 49) % self.temperature_cycle_length].mean(axis=1)
         all_gpp_percentiles = (all_gpps < all_gpps[:, None]).mean(axis=1)
-        for reach, percentile in zip(self.reaches, all_gpp_percentiles):
+        for reach, gpp, percentile in zip(self.reaches, all_gpps, all_gpp_percentiles):
+            reach.mean_gpp = gpp
             reach.mean_gpp_percentile = percentile
             reach.food_production = 1.5 + percentile  # food production in g/m2/day, ranges from 1.5 to 2.5 based on gpp percentile
         # Load habitat preferences (does its own printing)
         self.load_habitat_preferences()
+        self.reach_history = ReachHistory(self, self.model.config.time.weeks_per_year)
         print("Network loading complete.")
 
+    def load_temperature_source(self, temperature_scenario=None):
+        """ Opens the temperature source for a scenario, given either as the name of one of config.temperature_scenarios or
+            as a list of yearly temperature files, defaulting to config.network.temperature_scenario. Each reach
+            is mapped to its column in the source (the ocean and migration reaches use the column of the most
+            downstream reach), and the first year is loaded. """
+        if temperature_scenario is None:
+            temperature_scenario = self.model.config.network.temperature_scenario
+        if isinstance(temperature_scenario, str):
+            name, file_paths = temperature_scenario, self.model.config.temperature_scenario_files(temperature_scenario)
+        else:
+            file_paths = list(temperature_scenario)
+            name = "files_" + hashlib.md5("|".join(os.path.abspath(path) for path in file_paths).encode()).hexdigest()[:12]
+        self.temperature_source = TemperatureSource(name, file_paths, self.model.config.network.temperature_cache_path)
+        source_ids = [self.most_downstream_reach.id if reach.is_ocean or reach.is_migration_reach else reach.id for reach in self.reaches]
+        self.temperature_columns = self.temperature_source.columns_for_reach_ids(source_ids)
+        if (self.temperature_columns < 0).any():
+            missing_reach = self.reaches[int(np.argmax(self.temperature_columns < 0))]
+            sys.exit("Network loading error: No temperature data for reach {0}.".format(missing_reach.id))
+        self.temperature_cycle_length = self.temperature_source.weeks_per_year
+        self.check_temperature_cycle_length()
+        # capping conductivity at 350 here because max real value was 345 in our network; had one glitch value over 100,000
+        conductivity = np.minimum([reach.conductivity for reach in self.reaches], 350)
+        area_solar = np.array([reach.area_solar for reach in self.reaches])
+        self.gpp_log_intercepts = -11.538 + 0.00827 * conductivity + 4.11e-6 * area_solar
+        self.temperature_year = None
+        self.shared_temperature_years = None  # (temperature, GPP, coefficient) arrays of every year, if attached to a SharedNetwork
+        self.set_reach_temperatures(0)
+
+    def check_temperature_cycle_length(self):
+        """ Temperature lookups take the year of the scenario from WEEKS_PER_YEAR and the week within it from the
+            number of weeks in the temperature source, so the two have to agree. """
+        if self.temperature_cycle_length != self.model.config.time.weeks_per_year:
+            raise ValueError("Temperature source '{0}' has {1} weeks per year, but the model has WEEKS_PER_YEAR={2}.".format(
+                self.temperature_source.name, self.temperature_cycle_length, self.model.config.time.weeks_per_year))
+
+    def set_reach_temperatures(self, week_of_simulation):
+        """ Sets every reach's current temperature and bioenergetic temperature coefficients to those of the given
+            week of the simulation, loading that week's year of the scenario. The census does the same in step(), so
+            this is only needed when the temperatures change between timesteps, such as when loading a scenario. """
+        self.load_temperature_year(week_of_simulation // self.model.config.time.weeks_per_year)
+        for reach, temperature, coefficients in zip(self.reaches, self.temperatures_at_week(week_of_simulation).tolist(),
+                                                    self.temperature_coefficients_at_week(week_of_simulation).tolist()):
+            reach.current_temperature = temperature
+            reach.temperature_coefficients = tuple(coefficients)
+
+    def load_temperature_year(self, year):
+        """ Replaces the resident temperature and GPP matrices, dense (reach x week-of-year) arrays with rows in the
+            order of self.reaches, with those for the given year of the scenario. Only this one year's slab is read
+            from the memory-mapped temperature source. Networks attached to a SharedNetwork use views of its arrays,
+            which already hold every year. """
+        source_year = year % self.temperature_source.n_years
+        if source_year == self.temperature_year:
+            return
+        if self.shared_temperature_years is not None:
+            self.temperature_matrix, self.gpp_matrix, self.temperature_coefficient_matrix = \
+                (array[source_year] for array in self.shared_temperature_years)
+            self.temperature_year = source_year
+            return
+        slab = self.temperature_source.year_slab(source_year)
+        self.temperature_matrix = np.ascontiguousarray(slab[:, self.temperature_columns].T)
+        self.gpp_matrix = np.exp(self.gpp_log_intercepts[:, None] + 0.538 * self.temperature_matrix)
+        self.temperature_coefficient_matrix = temperature_coefficients(self.temperature_matrix)
+        self.temperature_year = source_year
+
+    def source_year_and_week(self, week_of_simulation):
+        year = week_of_simulation // self.model.config.time.weeks_per_year
+        return year % self.temperature_source.n_years, week_of_simulation % self.temperature_cycle_length
+
+    def temperature_at_week(self, reach_index, week_of_simulation):
+        """ Temperature of one reach at a week of the simulation, read from the resident matrix if the week falls in
+            the currently loaded year, or straight from the memory-mapped source otherwise. """
+        year, week = self.source_year_and_week(week_of_simulation)
+        if year == self.temperature_year:
+            return self.temperature_matrix.item(reach_index, week)
+        return self.temperature_source.temperatures.item(year, week, self.temperature_columns.item(reach_index))
+
+    def gpp_at_week(self, reach_index, week_of_simulation):
+        year, week = self.source_year_and_week(week_of_simulation)
+        if year == self.temperature_year:
+            return self.gpp_matrix.item(reach_index, week)
+        return math.exp(self.gpp_log_intercepts.item(reach_index) + 0.538 * self.temperature_at_week(reach_index, week_of_simulation))
+
+    def temperatures_at_week(self, week_of_simulation):
+        """ Returns the temperatures of all reaches (in the order of self.reaches) at the given week of the
+            simulation: a column view of the resident matrix for the loaded year, or a copy read from the source
+            for any other year. Years of the scenario repeat in order after the last one. """
+        year, week = self.source_year_and_week(week_of_simulation)
+        if year == self.temperature_year:
+            return self.temperature_matrix[:, week]
+        return self.temperature_source.week_values(year, week)[self.temperature_columns]
+
+    def temperature_coefficients_at_week(self, week_of_simulation):
+        """ Returns the (reach x 4) array of bioenergetic temperature coefficients f1(T) through f4(T) of all reaches
+            at the given week of the simulation, computed for the whole year when it was loaded, or on the fly for
+            any other year. """
+        year, week = self.source_year_and_week(week_of_simulation)
+        if year == self.temperature_year:
+            return self.temperature_coefficient_matrix[:, week]
+        return temperature_coefficients(self.temperatures_at_week(week_of_simulation)[:, None])[:, 0]
+
     def step(self, timestep):
+        """ End-of-timestep census, called by the scheduler after all fish and redds have stepped. A single pass over
+            the fish drops the dead ones and encodes each live one as 2 * reach index + life history, redds are
+            encoded the same way straight from the redd arrays, and one np.bincount of each set of codes fills both
+            the network-wide history and the per-reach history. Reach fish lists are only rebuilt for reaches in
+            which a fish died this timestep. Parked fish are counted from the scheduler's tally of them, and the
+            numbers of fish that crossed the network's mouth this timestep in each direction are recorded. Returns the
+            list of live fish that aren't parked, for the scheduler. """
+        schedule = self.model.schedule
+        live_fish = []
+        fish_codes = []
+        reaches_with_dead_fish = set()
+        for fish in schedule.active_fish:
+            if fish.is_dead:
+                reaches_with_dead_fish.add(fish.network_reach)
+            elif not fish.is_parked:  # fish parked this timestep are counted from schedule.parked_fish_counts
+                live_fish.append(fish)
+                fish_codes.append(2 * fish.network_reach.index + (fish.life_history is LifeHistory.RESIDENT))
+        for reach in reaches_with_dead_fish:
+            reach.fish = [fish for fish in reach.fish if not fish.is_dead]
+        n_codes = 2 * len(self.reaches)
+        fish_counts = np.bincount(np.array(fish_codes, dtype=np.int64), minlength=n_codes)
+        if schedule.parked_fish_counts is not None:
+            fish_counts += schedule.parked_fish_counts
+        fish_counts = fish_counts.reshape(-1, 2)
+        redd_counts = np.bincount(schedule.redds.life_history_codes(), minlength=n_codes).reshape(-1, 2)
+        anadromous_fish_total, resident_fish_total = fish_counts.sum(axis=0).tolist()
+        anadromous_redd_total, resident_redd_total = redd_counts.sum(axis=0).tolist()
         self.history.append({'step': timestep,
-                             'anad pop': len([fish for fish in self.model.schedule.fish
-                                              if fish.life_history is LifeHistory.ANADROMOUS]),
-                             'res pop': len([fish for fish in self.model.schedule.fish
-                                             if fish.life_history is LifeHistory.RESIDENT]),
-                             'anad redds': len([redd for redd in self.model.schedule.redds
-                                                if redd.mother.life_history is LifeHistory.ANADROMOUS]),
-                             'res redds': len([redd for redd in self.model.schedule.redds
-                                               if redd.mother.life_history is LifeHistory.RESIDENT])
+                             'anad pop': anadromous_fish_total,
+                             'res pop': resident_fish_total,
+                             'anad redds': anadromous_redd_total,
+                             'res redds': resident_redd_total,
+                             'mouth passage down': self.mouth_passages['downstream'],
+                             'mouth passage up': self.mouth_passages['upstream']
                              })
-        for reach in self.reaches:
-            reach.step(timestep)
+        self.mouth_passages = {'downstream': 0, 'upstream': 0}
+        self.load_temperature_year(timestep // self.model.config.time.weeks_per_year)
+        current_temperatures = self.temperatures_at_week(timestep)
+        current_coefficients = self.temperature_coefficients_at_week(timestep)
+        for reach, temperature, coefficients in zip(self.reaches, current_temperatures.tolist(), current_coefficients.tolist()):
+            reach.step(temperature, tuple(coefficients))
+        self.reach_history.record(fish_counts[:, 0], fish_counts[:, 1], redd_counts.sum(axis=1), current_temperatures)
+        return live_fish
+
+    def reach_statistic(self, value, timestep=None):
+        """ Returns an array with one value per reach (in the order of self.reaches) of either a fixed attribute of
+            the reaches (if timestep is None) or an element of the reach history at the given timestep, including
+            values like 'population' and 'proportion_capacity_redds' calculated from the recorded ones. """
+        return self.reach_history.values(value, timestep)
 
     def random_reach(self, restricted_to_steelhead_extent=False):
         """ Returns a random reach from the main network, excluding the ocean and migration reaches. """
@@ -203,7 +337,7 @@ class StreamNetwork:
             return sorted(habitat_prefs, key=lambda x: -x[1])
         print("Loading a library of habitat preferences from NREI modeling results.")
         habitat_preferences = {}
-        nrei_folder = network_settings['NREI_BATCH_FOLDER']
+        nrei_folder = self.model.config.network.nrei_batch_folder
         for root, dirs, filenames in os.walk(nrei_folder):
             for filename in filenames:
                 label_parts = filename.split(' ')[0].split('_')
@@ -212,12 +346,147 @@ class StreamNetwork:
                 if temperature not in habitat_preferences.keys():
                     habitat_preferences[temperature] = {}
                 habitat_preferences[temperature][fork_length] = habitat_preferences_from_file(os.path.join(nrei_folder, filename))
-        self.habitat_preferences = habitat_preferences
         self.habitat_preference_fork_lengths = np.array(sorted(list(habitat_preferences[1].keys())))
+        fork_lengths = self.habitat_preference_fork_lengths.tolist()
+        self.habitat_preference_fork_length_list = fork_lengths
+        self.habitat_preference_length_midpoints = [(a + b) / 2 for a, b in zip(fork_lengths[:-1], fork_lengths[1:])]
+        self.build_habitat_tables(habitat_preferences)
         print("Finished loading habitat preference library.")
 
+    def build_habitat_tables(self, habitat_preferences):
+        """ Converts the reaches' habitat areas and the preference library from dicts keyed by habitat class label
+            into arrays, so a SharedNetwork can publish them to its workers as they are. Each label in either one is
+            given an index into self.habitat_keys, and
+              - self.habitat_areas is (reach x habitat class), holding ABSENT_HABITAT_AREA for classes a reach
+                doesn't have, and each reach's initial_habitat_available is its row;
+              - self.habitat_preference_indices and self.habitat_preference_nreis are (temperature key x fork length
+                x rank), indexed directly by habitat_temperature_key() (so row 0 is unused), with each fish size's
+                classes best first, padded with -1 and 0 past the number in self.habitat_preference_counts. """
+        habitat_keys = set()
+        for reach in self.reaches:
+            habitat_keys.update(reach.initial_habitat_available.keys())
+        for preferences_by_length in habitat_preferences.values():
+            for preferences in preferences_by_length.values():
+                habitat_keys.update(habitat_key for habitat_key, nrei in preferences)
+        self.habitat_keys = sorted(habitat_keys)
+        self.habitat_key_indices = {habitat_key: index for index, habitat_key in enumerate(self.habitat_keys)}
+        habitat_areas = np.full((len(self.reaches), len(self.habitat_keys)), ABSENT_HABITAT_AREA, dtype=np.float64)
+        for reach in self.reaches:
+            for habitat_key, area in reach.initial_habitat_available.items():
+                habitat_areas[reach.index, self.habitat_key_indices[habitat_key]] = area
+        max_temperature_key = max(habitat_preferences.keys())
+        max_preferences = max(len(preferences) for preferences_by_length in habitat_preferences.values()
+                              for preferences in preferences_by_length.values())
+        table_shape = (max_temperature_key + 1, len(self.habitat_preference_fork_length_list), max_preferences)
+        self.habitat_preference_indices = np.full(table_shape, -1, dtype=np.int32)
+        self.habitat_preference_nreis = np.zeros(table_shape, dtype=np.float64)
+        self.habitat_preference_counts = np.zeros(table_shape[:2], dtype=np.int32)
+        for temperature_key, preferences_by_length in habitat_preferences.items():
+            for length_index, fork_length in enumerate(self.habitat_preference_fork_length_list):
+                preferences = preferences_by_length[fork_length]
+                self.habitat_preference_counts[temperature_key, length_index] = len(preferences)
+                for rank, (habitat_key, nrei) in enumerate(preferences):
+                    self.habitat_preference_indices[temperature_key, length_index, rank] = self.habitat_key_indices[habitat_key]
+                    self.habitat_preference_nreis[temperature_key, length_index, rank] = nrei
+        self.set_habitat_areas(habitat_areas)
+
+    def set_habitat_areas(self, habitat_areas):
+        """ Makes the given (reach x habitat class) array the network's habitat areas, pointing each reach at its row
+            and resetting the habitat available this week to it. """
+        self.habitat_areas = habitat_areas
+        for reach in self.reaches:
+            reach.initial_habitat_available = habitat_areas[reach.index]
+            reach.current_habitat_available = reach.initial_habitat_available.tolist()
+            reach.first_available_habitat_key_cache = {}
+
+    @staticmethod
+    def habitat_temperature_key(temperature):
+        """ Temperature key into the habitat preference tables: the rounded temperature, limited to the modeled 1-20 C. """
+        temperature_key = int(round(temperature))
+        if temperature_key < 1:
+            temperature_key = 1
+        if temperature_key > 20:
+            temperature_key = 20
+        return temperature_key
+
+    def habitat_preference_length_index(self, fork_length):
+        """ Index into self.habitat_preference_fork_lengths of the modeled fork length closest to the given one,
+            taking the smaller one on ties like argmin() of the absolute differences. """
+        return bisect.bisect_left(self.habitat_preference_length_midpoints, fork_length)
+
+    def habitat_preferences_for(self, temperature, fork_length):
+        """ Returns the list of (habitat key, NREI) preferences, best first, for a fish of the given fork length at
+            the given temperature. """
+        indices = self.habitat_preference_indices_for(temperature, fork_length)
+        nreis = self.habitat_preference_nreis[self.habitat_temperature_key(temperature), self.habitat_preference_length_index(fork_length)]
+        return [(self.habitat_keys[index], nrei) for index, nrei in zip(indices, nreis.tolist())]
+
+    def habitat_preference_indices_for(self, temperature, fork_length):
+        """ Returns the indices into self.habitat_keys of the preferred habitat classes, best first, for a fish of
+            the given fork length at the given temperature. """
+        temperature_key = self.habitat_temperature_key(temperature)
+        length_index = self.habitat_preference_length_index(fork_length)
+        return self.habitat_preference_indices[temperature_key, length_index, :self.habitat_preference_counts[temperature_key, length_index]].tolist()
+
+    def prepare_habitat_competition(self, timestep):
+        """ Called by the scheduler before any fish step. For each freshwater reach, every fish's preferred territory
+            is assigned to the best-ranked habitat class that exists in the reach for its size at the reach's current
+            temperature, and the reach is marked uncontested if no class is over-subscribed. Because fish only take
+            less-preferred classes when a better one runs out, each fish growing in an uncontested reach is certain to
+            get exactly that planned class with its full preferred territory, so Fish.grow() can skip the walk down
+            its preference list and the result is identical. Fish moving into an uncontested reach add their demand
+            through add_habitat_arrival(), which switches the reach back to full allocation if it becomes contested.
+            Demand from fish that leave, die, or don't grow this week is still counted, which only errs toward the
+            full allocation. """
+        stats = self.habitat_competition_stats
+        for reach in self.reaches:
+            reach.is_uncontested = False
+            if reach.is_ocean or len(reach.fish) == 0:
+                continue
+            reach.habitat_demand = {}
+            reach.is_uncontested = True
+            for fish in reach.fish:
+                if not self.plan_territory(fish, reach, timestep):
+                    break
+            if reach.is_uncontested:
+                stats['uncontested reach-weeks'] += 1
+            else:
+                stats['contested reach-weeks'] += 1
+
+    def plan_territory(self, fish, reach, timestep):
+        """ Plans the fish's territory in an uncontested reach and adds it to the reach's demand, marking the reach as
+            contested (and returning False) if there's no longer enough of the planned habitat class for everyone. """
+        temperature = reach.current_temperature
+        habitat_key = reach.first_available_habitat_keys(self.habitat_temperature_key(temperature))[self.habitat_preference_length_index(fish.fork_length)]
+        space_preferred = preferred_territory_size_from_f1(reach.temperature_coefficients[0], fish.mass, fish.p, reach.food_production)
+        fish.planned_territory = (timestep, reach, habitat_key, space_preferred)
+        if habitat_key is None or space_preferred <= 0:
+            reach.is_uncontested = False
+            return False
+        demand = reach.habitat_demand.get(habitat_key, 0) + space_preferred
+        reach.habitat_demand[habitat_key] = demand
+        if demand > reach.initial_habitat_available.item(habitat_key):
+            reach.is_uncontested = False
+            return False
+        return True
+
+    def add_habitat_arrival(self, fish, timestep):
+        """ Adds the demand of a fish that moved into an uncontested reach during the timestep. """
+        if not self.plan_territory(fish, fish.network_reach, timestep):
+            self.habitat_competition_stats['fallbacks'] += 1
+
+    def habitat_competition_report(self):
+        """ Prints how often reaches were uncontested and how many fish growth steps took the fast path. """
+        stats = self.habitat_competition_stats
+        reach_weeks = stats['uncontested reach-weeks'] + stats['contested reach-weeks']
+        fish_steps = stats['fast path fish'] + stats['full allocation fish']
+        print("Uncontested reach-weeks: {0} of {1} ({2:.1f} %), {3} switched back to full allocation by arriving fish.".format(
+            stats['uncontested reach-weeks'], reach_weeks, 100 * stats['uncontested reach-weeks'] / max(reach_weeks, 1), stats['fallbacks']))
+        print("Freshwater growth steps taking the fast path: {0} of {1} ({2:.1f} %).".format(
+            stats['fast path fish'], fish_steps, 100 * stats['fast path fish'] / max(fish_steps, 1)))
+
     def season_label(self, history_step):
-        week_of_year = history_step % time_settings['WEEKS_PER_YEAR']
+        week_of_year = history_step % self.model.config.time.weeks_per_year
         if 10 <= week_of_year <= 21:
             return 'Spring', 'Green'
         elif 22 <= week_of_year <= 32:
@@ -227,29 +496,81 @@ class StreamNetwork:
         else:
             return 'Winter', 'Blue'
 
+    def plot_geometry(self, simplified=False):
+        """ Returns the static geometry used to plot the network: line coordinates and widths for each reach and
+            the coordinates of reach midpoints, all in the same order as self.reaches. None of this changes during a
+            run, so it's built once and cached instead of being rebuilt for every video frame and fish plot.
+            The simplified version drops vertices within PLOT_SIMPLIFICATION_TOLERANCE meters of the line through
+            their neighbors, for low-resolution thumbnails. The returned lists are shared by every plot, so callers
+            should build new ColumnDataSource dicts around them rather than modifying them. """
+        key = 'simplified' if simplified else 'full'
+        if key not in self.plot_geometries:
+            tolerance = self.model.config.network.plot_simplification_tolerance
+            lines = [np.array(reach.points, dtype=np.float64) for reach in self.reaches]
+            if simplified:
+                lines = [self.simplified_line(line, tolerance) for line in lines]
+            self.plot_geometries[key] = {
+                'xs': [line[:, 0] for line in lines],
+                'ys': [line[:, 1] for line in lines],
+                'line_widths': [0.5 * reach.strahler_order for reach in self.reaches],
+                'midpoint_xs': np.array([reach.midpoint[0] for reach in self.reaches]),
+                'midpoint_ys': np.array([reach.midpoint[1] for reach in self.reaches])
+            }
+        return self.plot_geometries[key]
+
+    @staticmethod
+    def simplified_line(line, tolerance):
+        """ Douglas-Peucker simplification of an (n x 2) array of line vertices, always keeping both endpoints. """
+        if len(line) < 3:
+            return line
+        keep = np.zeros(len(line), dtype=bool)
+        keep[0] = keep[-1] = True
+        segments = [(0, len(line) - 1)]
+        while len(segments) > 0:
+            first, last = segments.pop()
+            if last - first < 2:
+                continue
+            start = line[first]
+            dx, dy = line[last] - start
+            interior = line[first + 1:last] - start
+            segment_length = math.hypot(dx, dy)
+            if segment_length == 0:
+                distances = np.hypot(interior[:, 0], interior[:, 1])
+            else:
+                distances = np.abs(dx * interior[:, 1] - dy * interior[:, 0]) / segment_length
+            farthest = int(np.argmax(distances))
+            if distances[farthest] > tolerance:
+                split = first + 1 + farthest
+                keep[split] = True
+                segments.append((first, split))
+                segments.append((split, last))
+        return line[keep]
+
     def plot(self, figure, color_attr=None, history_step=None, solid_color='#0485d1', circle_attr=None,
              circle_attr_transform=lambda x: x, circle_line_color='#cb7723', circle_fill_color='#fcb001',
-             circle_hover_attrs=[], color_attr_bounds=None):
+             circle_hover_attrs=[], color_attr_bounds=None, simplified=False):
         """ To simply plot the network in a solid color, use color_attr=None and history_step=None.
             To plot a fixed attribute of each network reach such as redd capacity, set color_attr to the
             name of that attribute and history_step=None.
             To plot an attribute of the network's history that varies over time, use history_step along
             with the name of that attribute.
             color_attr_bounds is None to use the min and max values of that variable in the current plot, or
-            specifiable to use a standard color range across multiple plots"""
-        lines = [reach.points for reach in self.reaches]
-        source = ColumnDataSource({'xs': [list(np.array(line).T[0]) for line in lines],
-                                   'ys': [list(np.array(line).T[1]) for line in lines],
-                                   'line_widths': [0.5 * reach.strahler_order for reach in self.reaches]})
+            specifiable to use a standard color range across multiple plots.
+            Set simplified=True to draw the reaches with simplified geometry, for small thumbnails."""
+        from bokeh.models import LinearColorMapper, ColorBar, HoverTool, Label, NumeralTickFormatter, ColumnDataSource
+        geometry = self.plot_geometry(simplified)
+        source = ColumnDataSource({'xs': geometry['xs'],
+                                   'ys': geometry['ys'],
+                                   'line_widths': geometry['line_widths']})
 
         figure.add_layout(Label(x=self.migration_reach.midpoint[0], y=self.migration_reach.midpoint[1]+750,
                                 text='Migration', text_align='center'))
         figure.add_layout(Label(x=self.ocean_reach.midpoint[0], y=self.ocean_reach.midpoint[1]+750,
                                 text='Ocean', text_align='center'))
         if history_step is not None:
-            year = 1 + math.floor(history_step / time_settings['WEEKS_PER_YEAR'])
-            step_within_year = history_step % time_settings['WEEKS_PER_YEAR']
-            days_into_year = 1 + step_within_year * time_settings['DAYS_PER_WEEK']
+            year = 1 + math.floor(history_step / self.model.config.time.weeks_per_year)
+            step_within_year = history_step % self.model.config.time.weeks_per_year
+            days_into_year = 1 + step_within_year * self.model.config.time.days_per_week
             date1 = datetime.date.fromordinal(days_into_year).strftime("%b %e")
             date2 = datetime.date.fromordinal(days_into_year + 7).strftime("%b %e")
             timestring = "Timestep {0} (step {1} of year {2}, {3} - {4})".format(history_step,
@@ -263,21 +584,22 @@ class StreamNetwork:
         if color_attr is None:
             figure.multi_line('xs', 'ys', source=source, line_color=solid_color, line_width='line_widths')
         else:
-            source.add([reach.reach_statistic(color_attr, history_step) for reach in self.reaches], name='color_values')
-            color_low_value = min(source.data['color_values']) if color_attr_bounds is None else color_attr_bounds[0]
-            color_high_value = max(source.data['color_values']) if color_attr_bounds is None else color_attr_bounds[1]
+            color_values = self.reach_statistic(color_attr, history_step)
+            source.add(color_values, name='color_values')
+            color_low_value = np.nanmin(color_values) if color_attr_bounds is None else color_attr_bounds[0]
+            color_high_value = np.nanmax(color_values) if color_attr_bounds is None else color_attr_bounds[1]
             mapper = LinearColorMapper(palette='Viridis256', low=color_low_value, high=color_high_value)
             figure.multi_line('xs', 'ys', source=source, line_color={'field': 'color_values', 'transform': mapper}, line_width='line_widths')
             fmt = NumeralTickFormatter(format='00')
             color_bar = ColorBar(color_mapper=mapper, location=(0, 0), title=color_attr, formatter=fmt, label_standoff=7)
             figure.add_layout(color_bar, 'right')
         if circle_attr is not None:
-            circle_source = ColumnDataSource({'xs': [reach.midpoint[0] for reach in self.reaches],
-                                              'ys': [reach.midpoint[1] for reach in self.reaches]})
-            circle_source.add([circle_attr_transform(reach.reach_statistic(circle_attr, history_step))
-                               for reach in self.reaches], name='circle_sizes')
+            circle_source = ColumnDataSource({'xs': geometry['midpoint_xs'],
+                                              'ys': geometry['midpoint_ys']})
+            circle_values = self.reach_statistic(circle_attr, history_step)
+            circle_source.add([circle_attr_transform(value) for value in circle_values.tolist()], name='circle_sizes')
             for attr in circle_hover_attrs:
-                circle_source.add([reach.reach_statistic(attr, history_step) for reach in self.reaches], name=attr)
+                circle_source.add(self.reach_statistic(attr, history_step), name=attr)
             figure.scatter('xs', 'ys', source=circle_source, name='scatterplot', marker='circle', size='circle_sizes',
                            line_color=circle_line_color, fill_color=circle_fill_color, alpha=0.5)
             hover_tooltips = []
@@ -0,0 +1,147 @@
+import csv
+import itertools
+import os
+import numpy as np
+from .config import ModelConfig
+from .ensemble import worker_pool, fresh_worker_model
+
+
+class StopRule:
+    """ Ends a sweep run early when a statistic leaves the range [minimum, maximum] at or after first_step. The
+        statistic is 'fish count' (all live fish, including parked ones), 'redd count', or any key of the network
+        history, like 'anad pop' or 'res redds'. """
+
+    def __init__(self, name, statistic, minimum=None, maximum=None, first_step=0):
+        self.name = name
+        self.statistic = statistic
+        self.minimum = minimum
+        self.maximum = maximum
+        self.first_step = first_step
+
+    def value(self, model):
+        if self.statistic == 'fish count':
+            return model.schedule.fish_count
+        elif self.statistic == 'redd count':
+            return model.schedule.redd_count
+        return model.network.history[-1][self.statistic]
+
+    def is_triggered(self, model):
+        if model.schedule.steps - 1 < self.first_step:
+            return False
+        value = self.value(model)
+        return (self.minimum is not None and value < self.minimum) or (self.maximum is not None and value > self.maximum)
+
+
+# The only network setting a sweep can vary, since the workers' network is built once; see scale_habitat()
+SWEEPABLE_NETWORK_SETTINGS = ('network_settings.PROPORTION_USABLE_HABITAT',)
+
+DEFAULT_STOP_RULES = (StopRule('extinction', 'fish count', minimum=1),
+                      StopRule('population explosion', 'fish count', maximum=250000))
+
+
+def grid_design(parameters):
+    """ Every combination of the given values of each parameter, as a list of design points. Parameters are given as
+        a dictionary of lists of values, keyed as in ModelConfig.with_overrides(), like 'spawning_settings.STRAY_PROBABILITY'.
+        The anadromous fish settings start as a copy of the resident ones, so a parameter shared by both life
+        histories, like STARVATION_THRESHOLD, has to be swept in both dictionaries. """
+    names = list(parameters.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*(parameters[name] for name in names))]
+
+
+def latin_hypercube_design(parameters, n_points, seed=None):
+    """ A Latin hypercube sample of n_points design points, given a dictionary of (low, high) ranges keyed by
+        parameter name as in grid_design(). Each parameter's range is split into n_points equal strata, one value is
+        drawn uniformly within each stratum, and the strata are shuffled independently for each parameter. """
+    random_state = np.random.RandomState(seed)
+    columns = {}
+    for name, (low, high) in parameters.items():
+        strata = (random_state.permutation(n_points) + random_state.random_sample(n_points)) / n_points
+        columns[name] = (low + strata * (high - low)).tolist()
+    return [{name: columns[name][point] for name in parameters} for point in range(n_points)]
+
+
+def run_sweep(design, steps, initial_population_size, stop_rules=DEFAULT_STOP_RULES, temperature_scenario=None, seed=0,
+              processes=None, output_folder=None, config=None):
+    """ Runs the model once for each point of a parameter design (a list of dictionaries of parameter values, as made
+        by grid_design() or latin_hypercube_design()) over a pool of worker processes, with the seed of point i being
+        seed + i, and the config of each point being the given config (by default ModelConfig.from_settings()) with the
+        point's values as overrides. After each timestep the stop rules are checked, and a run that triggers one is
+        abandoned.
+
+        The weekly network history of each point is written to 'point_<i>.csv' in the output folder (by default a
+        'Sweep' folder in config.export.results_path), and a summary table with one row per point, giving its
+        parameter values, seed, number of timesteps run, triggered stop rule, and final fish and redd counts, is
+        written to 'sweep_summary.csv' and returned as a list of dictionaries. Stop rules must be picklable where
+        processes can't be forked. Network settings other than SWEEPABLE_NETWORK_SETTINGS can't be swept, because
+        the network is built only once. """
+    if config is None:
+        config = ModelConfig.from_settings()
+    for point in design:
+        config.with_overrides(point)  # raises ValueError for unknown parameters before any runs start
+        for parameter in point:
+            if parameter.startswith('network_settings.') and parameter not in SWEEPABLE_NETWORK_SETTINGS:
+                raise ValueError("Can't sweep '{0}': the workers' network is only built once, so the only network "
+                                 "setting a sweep can vary is {1}.".format(parameter, ", ".join(SWEEPABLE_NETWORK_SETTINGS)))
+    if output_folder is None:
+        output_folder = os.path.join(config.export.results_path, 'Sweep')
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    if processes is None:
+        processes = min(len(design), os.cpu_count())
+    built_proportion = config.network.proportion_usable_habitat
+    tasks = [(index, point, seed + index, steps, stop_rules, output_folder, built_proportion) for index, point in enumerate(design)]
+    summary = [None] * len(design)
+    with worker_pool(processes, initial_population_size, temperature_scenario, config) as pool:
+        for finished, row in enumerate(pool.imap_unordered(run_point, tasks)):
+            summary[row['point']] = row
+            print("Finished sweep point {0} ({1} of {2}) after {3} timesteps{4}.".format(
+                row['point'], finished + 1, len(design), row['steps'],
+                "" if row['stop rule'] == '' else ", stopped by rule '{0}'".format(row['stop rule'])))
+    parameters = list(dict.fromkeys(parameter for point in design for parameter in point))  # in order of appearance
+    fieldnames = ['point'] + parameters + ['seed', 'steps', 'stop rule', 'fish count', 'redd count']
+    with open(os.path.join(output_folder, 'sweep_summary.csv'), 'w', newline='') as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(summary)
+    return summary
+
+
+def run_point(task):
+    """ Runs one design point in a worker, restoring the habitat areas afterward so the worker can run other points. """
+    index, point, seed, steps, stop_rules, output_folder, built_proportion = task
+    model = fresh_worker_model(seed, point)
+    point_proportion = model.config.network.proportion_usable_habitat
+    scale_habitat(model.network, built_proportion, point_proportion)
+    try:
+        triggered_rule = None
+        for i in range(steps):
+            model.step()
+            triggered_rule = next((rule for rule in stop_rules if rule.is_triggered(model)), None)
+            if triggered_rule is not None:
+                break
+        if len(model.network.history) > 0:
+            with open(os.path.join(output_folder, 'point_{0}.csv'.format(index)), 'w', newline='') as point_file:
+                writer = csv.DictWriter(point_file, fieldnames=list(model.network.history[0].keys()))
+                writer.writeheader()
+                writer.writerows(model.network.history)
+        row = {'point': index}
+        row.update(point)
+        row.update({'seed': seed,
+                    'steps': model.schedule.steps,
+                    'stop rule': '' if triggered_rule is None else triggered_rule.name,
+                    'fish count': model.schedule.fish_count,
+                    'redd count': model.schedule.redd_count})
+        return row
+    finally:
+        scale_habitat(model.network, point_proportion, built_proportion)
+
+
+def scale_habitat(network, from_proportion, to_proportion):
+    """ Habitat areas are predicted once when the network is built, using PROPORTION_USABLE_HABITAT, so a sweep over
+        that setting rescales every reach's habitat areas from the proportion they were built with to the point's
+        instead. """
+    if from_proportion == to_proportion:
+        return
+    scale = to_proportion / from_proportion
+    habitat_areas = network.habitat_areas
+    network.set_habitat_areas(np.where(habitat_areas >= 0, habitat_areas * scale, habitat_areas))  # a new array, since a shared one is read-only
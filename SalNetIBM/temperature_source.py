@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+import shapefile  # from 'pyshp' library
+import numpy as np
+
+
+class TemperatureSource:
+    """ Stream temperatures for a scenario of one or more years, each year read from its own input file. Shapefiles
+        (or their .dbf tables) are read from the 8-day mean fields containing 'TMn', and CSV files are expected to have
+        a LineOID column followed by one column per week, in order.
+
+        The first time a scenario is used, its files are converted into a (year x week x reach) array saved as a .npy
+        file in the cache folder, along with the LineOIDs of its reach columns. Afterward that file is memory-mapped
+        rather than read, so a multi-decade scenario costs almost no memory until a year's slab is requested, and the
+        network only holds the slab for the year it's currently simulating. The cache is rebuilt whenever the list of
+        input files or their modification times change. """
+
+    def __init__(self, name, file_paths, cache_folder):
+        self.name = name
+        self.file_paths = list(file_paths)
+        if len(self.file_paths) == 0:
+            raise ValueError("Temperature scenario '{0}' has no input files.".format(name))
+        if not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+        self.array_path = os.path.join(cache_folder, "{0}.npy".format(name))
+        self.reach_ids_path = os.path.join(cache_folder, "{0}_reach_ids.npy".format(name))
+        self.manifest_path = os.path.join(cache_folder, "{0}.json".format(name))
+        if not self.cache_is_current():
+            self.build_cache()
+        self.temperatures = np.load(self.array_path, mmap_mode='r')
+        self.reach_ids = np.load(self.reach_ids_path)
+        self.n_years, self.weeks_per_year, n_reaches = self.temperatures.shape
+        self.column_of_reach_id = {reach_id: column for column, reach_id in enumerate(self.reach_ids.tolist())}
+
+    def manifest(self):
+        return [[os.path.abspath(path), os.path.getmtime(path)] for path in self.file_paths]
+
+    def cache_is_current(self):
+        if not all(os.path.exists(path) for path in (self.array_path, self.reach_ids_path, self.manifest_path)):
+            return False
+        with open(self.manifest_path) as manifest_file:
+            return json.load(manifest_file) == self.manifest()
+
+    def build_cache(self):
+        """ Writes the scenario's years one at a time into the memory-mapped cache file, so the whole scenario never
+            has to fit in memory at once. """
+        print("Building temperature cache for scenario '{0}' from {1} yearly file(s).".format(self.name, len(self.file_paths)))
+        reach_ids = None
+        cache = None
+        for year, path in enumerate(self.file_paths):
+            year_temperatures = self.read_year(path)
+            if reach_ids is None:
+                reach_ids = sorted(year_temperatures.keys())
+                n_weeks = len(year_temperatures[reach_ids[0]])
+                cache = np.lib.format.open_memmap(self.array_path, mode='w+', dtype=np.float64,
+                                                  shape=(len(self.file_paths), n_weeks, len(reach_ids)))
+            missing_ids = [reach_id for reach_id in reach_ids if reach_id not in year_temperatures]
+            if len(missing_ids) > 0:
+                raise ValueError("Temperature file {0} is missing {1} reaches, including reach {2}.".format(path, len(missing_ids), missing_ids[0]))
+            year_array = np.array([year_temperatures[reach_id] for reach_id in reach_ids], dtype=np.float64).T
+            if year_array.shape != cache.shape[1:]:
+                raise ValueError("Temperature file {0} has {1} weeks instead of {2}.".format(path, year_array.shape[0], cache.shape[1]))
+            cache[year] = year_array
+        cache.flush()
+        del cache
+        np.save(self.reach_ids_path, np.array(reach_ids, dtype=np.int64))
+        with open(self.manifest_path, 'w') as manifest_file:
+            json.dump(self.manifest(), manifest_file)
+
+    @staticmethod
+    def read_year(path):
+        """ Returns a dictionary of weekly temperature lists keyed by reach LineOID for one year's input file. """
+        year_temperatures = {}
+        if path.lower().endswith('.csv'):
+            with open(path, newline='') as temperature_file:
+                reader = csv.reader(temperature_file)
+                next(reader)  # header: LineOID, then one column per week
+                for row in reader:
+                    year_temperatures[int(row[0])] = [float(temperature) for temperature in row[1:]]
+        else:
+            tf = shapefile.Reader(path)
+            attrib_keys = [field[0] for field in tf.fields][1:]
+            tfields = [key for key in attrib_keys if 'TMn' in key]
+            for attrib_values in tf.iterRecords():
+                attribs = dict(zip(attrib_keys, attrib_values))
+                year_temperatures[int(attribs['LineOID'])] = [attribs[field] for field in tfields]
+        return year_temperatures
+
+    def columns_for_reach_ids(self, reach_ids):
+        """ Returns the array of source columns for the given reach IDs, with -1 for reaches not in the source. """
+        return np.array([self.column_of_reach_id.get(reach_id, -1) for reach_id in reach_ids], dtype=np.int64)
+
+    def year_slab(self, year):
+        """ Reads one year's (week x reach) temperatures into memory. Years beyond the end of the scenario cycle. """
+        return np.array(self.temperatures[year % self.n_years])
+
+    def week_values(self, year, week_of_year):
+        """ Reads the temperatures of all source reaches for a single week, without loading the rest of the year. """
+        return np.array(self.temperatures[year % self.n_years, week_of_year % self.weeks_per_year])
@@ -164,6 +164,7 @@ test_model.schedule.dead_fish.sort(key=lambda x: -x.age_weeks)
 
 # Ferreting out specific anoomalies
 
+test_model.schedule.catch_up_parked_fish()
 all_fish = test_model.schedule.fish + test_model.schedule.dead_fish
 
 fish_stuck_spawning = [fish for fish in all_fish if fish.activity is Activity.SPAWNING and fish.activity_duration > 20]